@@ -1,22 +1,94 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from pymongo import MongoClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson.errors import InvalidId
+from pydantic import TypeAdapter
 from data_class import *
-import git
-import dns
+from hashing import HasherBusy, pool as hasher_pool
+from ratelimit import AuthGuard, TokenBuckets
+from cache import CacheSync, TTLCache
+from pagination import MAX_PAGE_SIZE, fetch_page, page_response, paginate, paginate_aggregate
+from serialization import DocumentEncoder, json_response, to_document
+from conditional import bump_if_changed, check_not_modified, collection_etag, document_etag, matches, not_modified, with_validators
+from idempotency import IdempotencyKeys
+from indexes import ensure_indexes
+from resume_patch import build_pipeline
+from review import APPLICANT_STAGES, csv_chunks
+from search import SearchIndex
+from stats import Stats
+from email_backend import Outbox
+from jobs import JobQueue, delete_batch
+from bulk import Importer, export_lines, split_lines
+from database import connect, public_read_preference, public_reads
+from startup import build_info
+from metrics import InstrumentedRoute, MetricsMiddleware, MongoCommandListener, MongoPoolListener, Counter, Gauge, render as render_metrics
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import os
-import json
+import time
+import asyncio
+import logging
 
-repo = git.Repo(search_parent_directories=True)
-sha = repo.head.object.hexsha
+sha = build_info()['sha']
+
+startup_timings = {} # Seconds per lifespan stage, see `python startup.py --profile-startup`
+
+@contextmanager
+def startup_stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Created here rather than at import, so importing the app stays cheap
+    global client, db, public_db, recommendation_index
+    with startup_stage('mongo client'):
+        client = connect([MongoCommandListener(), pool_listener])
+        db = client.careerhub
+        public_db = public_reads(db, public_read_preference())
+        outbox.collection = db.outbox
+        jobs.collection = db.jobs
+        cache_sync.collection = db.versions
+        stats.collection = db.stats
+        idempotency_keys.collection = db.idempotency_keys
+    with startup_stage('indexes'):
+        await ensure_indexes(db)
+    with startup_stage('cache sync'):
+        await cache_sync.poll()
+    with startup_stage('search index'):
+        await search_index.rebuild(db.opportunities)
+    with startup_stage('recommendation index'):
+        from recommendations import RecommendationIndex # Pulls in NumPy
+        recommendation_index = RecommendationIndex(int(os.getenv('RECOMMENDATION_DIMENSIONS', 256)))
+        await recommendation_index.rebuild(db.opportunities)
+    refresh_interval = float(os.getenv('SEARCH_REFRESH_SECONDS', 300))
+    refreshes = [ # Background tasks, cancelled at shutdown
+        asyncio.create_task(search_index.refresh_forever(db.opportunities, refresh_interval)),
+        asyncio.create_task(recommendation_index.refresh_forever(db.opportunities, refresh_interval)),
+    ]
+    refreshes.append(asyncio.create_task(cache_sync.run_forever(float(os.getenv('CACHE_SYNC_SECONDS', 1)))))
+    refreshes.append(asyncio.create_task(jobs.run_forever(float(os.getenv('JOBS_POLL_SECONDS', 2)))))
+    if os.getenv('SMTP_HOST'):
+        refreshes.append(asyncio.create_task(outbox.run_forever(float(os.getenv('OUTBOX_POLL_SECONDS', 5)))))
+    yield
+    for refresh in refreshes:
+        refresh.cancel()
+    if import_executor is not None:
+        import_executor.shutdown(cancel_futures=True)
+    await client.close()
 
 app = FastAPI(
+    lifespan = lifespan,
     title = "CareerHub Backend API",
     description = f"""## CareerHub
 The Official Backend API of CareerHub. All API routes have been Documented using OpenAPI Standard.
@@ -24,12 +96,74 @@ The Official Backend API of CareerHub. All API routes have been Documented using
 **Currently Running on Commit: {sha[:7]}**
 """
 )
+app.router.route_class = InstrumentedRoute # Before any route is declared
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-client = MongoClient(os.getenv('MONGODB_URI'))
-db = client.careerhub
+client = None # All set by lifespan
+db = None # Primary reads and writes
+public_db = None # Anonymous listings, may read from secondaries, see database.py
+pool_listener = MongoPoolListener()
+
+# Authenticated users by username, so hot paths don't hit Mongo on every request
+principal_cache = TTLCache(
+    maxsize=int(os.getenv('PRINCIPAL_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('PRINCIPAL_CACHE_TTL', 30)),
+)
+
+outbox = Outbox(
+    None, # Collection set by lifespan
+    batch_size=int(os.getenv('OUTBOX_BATCH_SIZE', 100)),
+    lease_seconds=float(os.getenv('OUTBOX_LEASE_SECONDS', 300)),
+)
+
+jobs = JobQueue(
+    None, # Collection set by lifespan
+    batch_size=int(os.getenv('JOBS_BATCH_SIZE', 500)),
+    lease_seconds=float(os.getenv('JOBS_LEASE_SECONDS', 120)),
+)
+
+# Rate limits and a concurrency cap for the unauthenticated routes that hash passwords
+auth_guard = AuthGuard(
+    ip_buckets=TokenBuckets(float(os.getenv('AUTH_IP_RATE_PER_MINUTE', 30)), int(os.getenv('AUTH_IP_BURST', 10))),
+    username_buckets=TokenBuckets(float(os.getenv('AUTH_USERNAME_RATE_PER_MINUTE', 10)), int(os.getenv('AUTH_USERNAME_BURST', 5))),
+    account_buckets=TokenBuckets(float(os.getenv('AUTH_ACCOUNT_RATE_PER_MINUTE', 60)), int(os.getenv('AUTH_ACCOUNT_BURST', 30))),
+    max_concurrent=int(os.getenv('AUTH_MAX_CONCURRENT', 16)),
+)
+
+# Companies and recruiter listings. Every worker keeps its own copy, cache_sync
+# clears them when another worker writes
+company_cache_size = int(os.getenv('COMPANY_CACHE_SIZE', 1024))
+company_cache_ttl = float(os.getenv('COMPANY_CACHE_TTL', 60))
+company_cache = TTLCache(company_cache_size, company_cache_ttl) # handle -> company document
+company_list_cache = TTLCache(company_cache_size, company_cache_ttl) # (limit, after) -> (etag, page, next cursor)
+recruiter_list_cache = TTLCache(company_cache_size, company_cache_ttl) # (company handle, limit, after) -> (page, next cursor)
+cache_sync = CacheSync() # Collection set by lifespan
+stats = Stats() # Application and posting counters, collection set by lifespan
+idempotency_keys = IdempotencyKeys(ttl_seconds=float(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', 86400))) # Collection set by lifespan
+cache_sync.register("company", company_cache, company_list_cache)
+cache_sync.register("recruiters", recruiter_list_cache)
+
+# Usernames allowed on the /admin routes
+admin_usernames = {name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()}
+import_workers = int(os.getenv('IMPORT_WORKERS', 2))
+import_executor = None # Validates bulk imports, started by the first one
+
+search_index = SearchIndex()
+recommendation_index = None # Set by lifespan
+# Recommendations by username, with the recommendation_index version and k they were computed for
+recommendation_cache = TTLCache(
+    maxsize=int(os.getenv('RECOMMENDATION_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('RECOMMENDATION_CACHE_TTL', 300)),
+)
+cache_sync.register("company", recommendation_cache) # They may list opportunities of a company being unregistered
 
-ph = PasswordHasher()
+# Read routes encode documents straight from Mongo, without the response model
+company_encoder = DocumentEncoder(Company)
+recruiter_encoder = DocumentEncoder(Recruiter)
+opportunity_encoder = DocumentEncoder(Opportunity)
+listed_opportunity_encoder = DocumentEncoder(OpportunityWithID, id_field='id')
+application_encoder = DocumentEncoder(CandidateApplication)
+reviewed_application_encoder = DocumentEncoder(ReviewedApplication, id_field='id')
 
 origins = ["*"] # Should be configured to Only allow selected apps.
 
@@ -39,17 +173,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Lets browsers on other origins page through listings
 )
+app.add_middleware(MetricsMiddleware) # Added last so it runs first and times CORS too
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request: Request, exc: HasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': 'Server is busy, try again shortly'},
+        headers={'Retry-After': '1'},
+    )
 
-def verify_password(password, hashed):
-    try:
-        ph.verify(hashed, password)
-        return True
-    except Exception as e:
-        return False
+async def verify_password(password, hashed):
+    return await hasher_pool.verify(hashed, password)
 
-def get_user(email: str, username: str):
-    obj = db.users.find_one(
+async def get_user(email: str, username: str):
+    obj = await db.users.find_one(
         {
             "resume.basic.email": email # Finds out if the request is from a Existing User
         }
@@ -58,17 +198,20 @@ def get_user(email: str, username: str):
         return UserData(**obj)
 
 
-def get_user_by_username(username: str):
-    obj = db.users.find_one(
-        {
-            "username": username # Finds out if the request is from a Existing User
-        }
-    )
+async def get_user_by_username(username: str, include_tombstoned: bool = False):
+    query = {
+        "username": username # Finds out if the request is from a Existing User
+    }
+    if not include_tombstoned:
+        query["tombstoned_at"] = None # Unregistered, waiting for the cleanup job
+    obj = await db.users.find_one(query)
     if obj:
-        return UserData(**obj)
+        user = UserData(**obj)
+        user._roles_version = obj.get('roles_version', 0)
+        return user
 
-def get_user_by_email(email: str):
-    obj = db.users.find_one(
+async def get_user_by_email(email: str):
+    obj = await db.users.find_one(
         {
             "resume.basic.email": email # Finds out if the request is from a Existing User
         }
@@ -76,12 +219,24 @@ def get_user_by_email(email: str):
     if obj:
         return UserData(**obj)
 
-def get_company_by_handle(handle: str):
-    obj = db.company.find_one(
-        {
-            "handle": handle
-        }
-    )
+async def load_company(handle: str):
+    """The company's document, tombstoned or not, read through company_cache."""
+    return await company_cache.get_or_load(handle, lambda: db.company.find_one(
+        {"handle": handle},
+        {**company_encoder.projection, "version": 1, "tombstoned_at": 1}
+    ))
+
+async def without_tombstoned(opportunities: dict):
+    """`opportunities` by id, less those of companies being unregistered."""
+    tombstoned = set()
+    for handle in {doc["company"]["handle"] for doc in opportunities.values()}:
+        company = await load_company(handle)
+        if company and company.get("tombstoned_at"):
+            tombstoned.add(handle)
+    return {doc_id: doc for doc_id, doc in opportunities.items() if doc["company"]["handle"] not in tombstoned}
+
+async def get_company_by_handle(handle: str):
+    obj = await load_company(handle)
     if obj:
         return Company(**obj)
 
@@ -96,12 +251,43 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, os.getenv('TOKEN_SECRET_KEY'), algorithm='HS256')
     return encoded_jwt
 
-def authenticate_user(login:str, password: str):
-    user = get_user_by_username(login)
+async def get_role_claims(user: UserData):
+    """
+    Company handles the user recruits for or founded, embedded in the access token.
+    user._roles_version must be read before the handles, so a concurrent role change
+    always leaves the token with an outdated version.
+    """
+    recruiter_of = [x['company_handle'] async for x in db.recruiters.find({'recruiter': user.username}, {'company_handle': 1})]
+    founder_of = [x['company_handle'] async for x in db.founders.find({'founder_email': user.resume.basic.email}, {'company_handle': 1})]
+    return {
+        'rv': user._roles_version,
+        'recruiter_of': recruiter_of,
+        'founder_of': founder_of,
+    }
+
+async def bump_roles_version(usernames: List[str]):
+    """Invalidate the role claims in every token issued to these users."""
+    await db.users.update_many(
+        {'username': {'$in': usernames}},
+        {'$inc': {'roles_version': 1}}
+    )
+    for username in usernames:
+        principal_cache.invalidate(username)
+
+async def authenticate_user(login:str, password: str):
+    user = await get_user_by_username(login)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password(password, user.password):
         return False
+    if hasher_pool.needs_rehash(user.password):
+        # Stored hash uses outdated parameters, upgrade it while we have the plaintext
+        user.password = await hasher_pool.hash(password)
+        await db.users.update_one(
+            {'username': user.username},
+            {'$set': {'password': user.password}}
+        )
+        principal_cache.invalidate(user.username)
     return user
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
@@ -119,16 +305,30 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         if username is None:
             raise credentials_exception
         token_data = TokenData(email=username)
+        roles_version = payload.get('rv')
     except JWTError as e:
-        print(e)
+        logging.info(f"Rejected token: {e}")
         raise credentials_exception
-    user = get_user_by_username(token_data.email)
+    load = lambda: get_user_by_username(token_data.email)
+    user = await principal_cache.get_or_load(token_data.email, load)
+    if user is not None and isinstance(roles_version, int) and roles_version > user._roles_version:
+        # Roles changed in another worker, which only cleared its own cache
+        principal_cache.invalidate(token_data.email)
+        user = await principal_cache.get_or_load(token_data.email, load)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="user not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if roles_version != user._roles_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Roles changed since the token was issued, log in again",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user._recruiter_of = payload.get('recruiter_of', [])
+    user._founder_of = payload.get('founder_of', [])
     return user
 
 async def get_current_active_user(
@@ -136,45 +336,84 @@ async def get_current_active_user(
 ):
     return current_user
 
+async def get_current_admin(current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    if current_user.username not in admin_usernames:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only admins can do this.")
+    return current_user
+
+def index_opportunity(opportunity_id: str, opportunity: dict):
+    """Keep this worker's search and recommendation indexes in step with an opportunity write."""
+    search_index.add(opportunity_id, opportunity)
+    recommendation_index.add(opportunity_id, opportunity)
+
+def unindex_opportunity(opportunity_id: str):
+    search_index.remove(opportunity_id)
+    recommendation_index.remove(opportunity_id)
+
+def managed_companies(current_user: UserData):
+    """Handles of the companies the user recruits for or founded, from the token claims."""
+    return set(current_user._recruiter_of) | set(current_user._founder_of)
+
 def is_recruiter_or_company_owner(current_user: UserData, company_handle: Optional[str] = None):
     """
     Check if the current user is a recruiter or a company owner.
     If company_handle is provided, it checks for the specified company.
     If company_handle is not provided, it checks if the user is a recruiter or company owner for any company.
+    Uses the role claims of the access token, so no database lookup is needed.
     """
     if company_handle:
-        # Check if the user is a recruiter for the specified company
-        recruiter = db.recruiters.find_one({
-            "recruiter": current_user.username,
-            "company_handle": company_handle
-        })
-        if recruiter:
-            return True
-
-        # Check if the user is a founder/owner of the specified company
-        founder = db.founders.find_one({
-            "founder_email": current_user.resume.basic.email,
-            "company_handle": company_handle
-        })
-        if founder:
-            return True
-
-    else:
-        # Check if the user is a recruiter for any company
-        recruiter = db.recruiters.find_one({
-            "recruiter": current_user.username
-        })
-        if recruiter:
-            return True
-
-        # Check if the user is a founder/owner of any company
-        founder = db.founders.find_one({
-            "founder_email": current_user.resume.basic.email
-        })
-        if founder:
-            return True
-
-    return False
+        return company_handle in current_user._recruiter_of or company_handle in current_user._founder_of
+    return bool(current_user._recruiter_of or current_user._founder_of)
+
+@jobs.handler("delete_user")
+async def delete_user_job(job):
+    email = job.target["email"]
+    if job.step == 0:
+        while applications := [doc async for doc in db.applications.find({"candidate_email": email}, {"opportunity_id": 1}).limit(job.batch_size)]:
+            result = await db.applications.delete_many({"_id": {"$in": [application["_id"] for application in applications]}})
+            await stats.applications_removed(applications)
+            await job.checkpoint("applications", result.deleted_count)
+        await job.advance()
+    if job.step == 1:
+        while deleted := await delete_batch(db.recruiters, {"recruiter_email": email}, job.batch_size):
+            await job.checkpoint("recruiters", deleted)
+        await cache_sync.bump("recruiters")
+        await job.advance()
+    if job.step == 2:
+        result = await db.users.delete_one({"resume.basic.email": email, "tombstoned_at": {"$ne": None}})
+        await job.checkpoint("users", result.deleted_count)
+        await job.advance()
+
+@jobs.handler("reconcile_stats")
+async def reconcile_stats_job(job):
+    await stats.reconcile(db, job, job.batch_size)
+
+@jobs.handler("delete_opportunity")
+async def delete_opportunity_job(job):
+    opportunity_id = job.target["opportunity_id"]
+    while deleted := await delete_batch(db.applications, {"opportunity_id": opportunity_id}, job.batch_size):
+        await job.checkpoint("applications", deleted)
+
+@jobs.handler("delete_company")
+async def delete_company_job(job):
+    company_handle = job.target["company_handle"]
+    if job.step == 0:
+        # One batch of opportunities at a time: their applications first, so none are left orphaned
+        while ids := [doc["_id"] async for doc in db.opportunities.find({"company.handle": company_handle}, {"_id": 1}).limit(job.batch_size)]:
+            opportunity_ids = [str(oid) for oid in ids]
+            while deleted := await delete_batch(db.applications, {"opportunity_id": {"$in": opportunity_ids}}, job.batch_size):
+                await job.checkpoint("applications", deleted)
+            result = await db.opportunities.delete_many({"_id": {"$in": ids}})
+            for opportunity_id in opportunity_ids:
+                unindex_opportunity(opportunity_id)
+            await job.checkpoint("opportunities", result.deleted_count)
+        await job.advance()
+    if job.step == 1:
+        await stats.company_removed(company_handle)
+        result = await db.company.delete_one({"handle": company_handle, "tombstoned_at": {"$ne": None}})
+        await cache_sync.bump("company") # The handle can be registered again
+        await job.checkpoint("company", result.deleted_count)
+        await job.advance()
 
 @app.get('/')
 async def index():
@@ -183,7 +422,7 @@ async def index():
     }
 
 @app.post('/register', response_model=RegistrationStatus)
-async def register(ud: UserData):
+async def register(ud: UserData, request: Request):
     """
     # Registration Route
     These Details are Atleast Required!
@@ -215,13 +454,14 @@ async def register(ud: UserData):
     - Password
 
     """
-    obj = get_user_by_email(ud.resume.basic.email)
-    obj1 = get_user_by_username(ud.username)
-    ud.password = ph.hash(ud.password)
-    data = json.loads(ud.json()) # Kinda Important as MongoDB requires a Dict
-    uid = None # Don't ask me why it is so complicated. It works,so should you.
-    if obj is None and obj1 is None:
-        uid = db.users.insert_one(data).inserted_id
+    async with auth_guard.admit('register', request, ud.username):
+        obj = await get_user_by_email(ud.resume.basic.email)
+        obj1 = await get_user_by_username(ud.username, include_tombstoned=True)
+        uid = None # Don't ask me why it is so complicated. It works,so should you.
+        if obj is None and obj1 is None:
+            ud.password = await hasher_pool.hash(ud.password) # Only pay for Argon2 when the user is actually created
+            data = to_document(ud) # Kinda Important as MongoDB requires a Dict
+            uid = (await db.users.insert_one(data)).inserted_id
     username_taken = True if obj1 else False
     email_used = True if obj else False
     return RegistrationStatus(
@@ -239,37 +479,55 @@ async def unregister_user(request: UnregisterUserRequest, current_user: Annotate
     if request.email != current_user.resume.basic.email:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Email does not match the current user.")
 
-    # Delete the user document from the database
-    result = db.users.delete_one({"resume.basic.email": request.email})
+    # Tombstone the user, they can no longer log in. The user document and
+    # associated data (applications, recruiter roles) are deleted by a background job.
+    result = await db.users.update_one(
+        {"resume.basic.email": request.email, "tombstoned_at": None},
+        {"$set": {"tombstoned_at": datetime.now(timezone.utc)}}
+    )
+    principal_cache.invalidate(current_user.username)
+    recommendation_cache.invalidate(current_user.username)
 
-    if result.deleted_count == 0:
+    if result.matched_count == 0:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found.")
 
-    # Delete any other associated data (e.g., applications, recruiters, etc.)
-    db.applications.delete_many({"candidate_email": request.email})
-    db.recruiters.delete_many({"recruiter_email": request.email})
-    # ... (delete any other associated data)
+    job_id = await jobs.submit("delete_user", {"email": request.email, "username": current_user.username})
 
     # Log the unregister reason
     logging.info(f"User {request.email} unregistered. Reason: {request.reason}")
 
-    return {"message": "User unregistered successfully."}
+    return {"message": "User unregistered successfully.", "job_id": job_id}
+
+@app.get('/jobs/{job_id}', response_model=JobStatus)
+async def job_status(job_id: str):
+    """
+    # Status of a Background Job
+    Unregistering a user or company, or deleting an opportunity, returns a `job_id` that can be followed here.
+    """
+    job = await jobs.get(job_id)
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return JobStatus(id=job_id, **job)
 
 @app.post('/token')
-async def get_jwt(login: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
+async def get_jwt(login: Annotated[OAuth2PasswordRequestForm, Depends()], request: Request) -> Token:
     """# Get Token Route
     Post your username and Password in Exchange for a JWT Token valid for 15 Minutes.
+    Attempts are rate limited per client IP, and failed ones per username.
     """
-    user = authenticate_user(login.username, login.password)
+    async with auth_guard.admit('token', request, login.username) as admission:
+        user = await authenticate_user(login.username, login.password)
+        if not user:
+            admission.failed()
     if not user:
         raise HTTPException(
                     status_code = status.HTTP_401_UNAUTHORIZED,
                     detail = "Login Details Incorrect",
-                    headers = {'WWW-Authenticate', 'Bearer'}
+                    headers = {'WWW-Authenticate': 'Bearer'}
                 )
     access_token_expires = timedelta(minutes=int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', 20)))
     access_token = create_access_token(
-                data = {"sub": user.username},
+                data = {"sub": user.username, **await get_role_claims(user)},
                 expires_delta = access_token_expires
             )
     return Token(access_token=access_token, token_type="Bearer")
@@ -285,13 +543,17 @@ async def get_user_resume(current_user: Annotated[UserData, Depends(get_current_
     return Resume(**current_user.resume.dict())
 
 @app.get('/resume/{username}', response_model=Resume)
-async def get_user_resume_username(username: str):
+async def get_user_resume_username(username: str, request: Request):
     """
     # Get Resume of a Specific User
     """
-    user = get_user_by_username(username)
-    if user:
-        return user.resume
+    query = {"username": username, "tombstoned_at": None}
+    if response := await check_not_modified(request, public_db.users, query, "resume", stamp="resume_version"):
+        return response
+    user = await public_db.users.find_one(query, {"resume": 1, "resume_version": 1})
+    if not user:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found.")
+    return with_validators(json_response(user["resume"]), document_etag(user, "resume_version"), "resume")
 
 @app.put('/resume', response_model=UserData)
 async def modify_user_resume(resume: Resume, current_user: Annotated[UserData, Depends(get_current_active_user)]):
@@ -303,14 +565,10 @@ async def modify_user_resume(resume: Resume, current_user: Annotated[UserData, D
         # Update the resume field in the UserData object
         current_user.resume = resume
 
-        # Convert the updated UserData object to a dictionary
-        import json
-        updated_user_data = json.loads(current_user.json())
-
-        # Update the document in MongoDB
-        result = db.users.update_one(
+        # Update the document in MongoDB, bumping the resume's ETag if it changed
+        result = await db.users.update_one(
             {'username': current_user.username},
-            {'$set': updated_user_data}
+            bump_if_changed([{'$set': {'resume': {'$literal': to_document(resume)}}}], 'resume', 'resume_version')
         )
 
         if result.modified_count > 0:
@@ -320,7 +578,31 @@ async def modify_user_resume(resume: Resume, current_user: Annotated[UserData, D
             return {'message': 'No changes made'}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # current_user may be the cached object we just modified
+        principal_cache.invalidate(current_user.username)
+        recommendation_cache.invalidate(current_user.username)
 
+@app.patch('/resume')
+async def patch_user_resume(operations: List[ResumePatchOperation], current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    # Partially Update User Resume
+    Send a list of operations instead of the whole resume, e.g.
+    - `{"op": "add", "path": "/skills/-", "value": {...}}` appends a skill
+    - `{"op": "replace", "path": "/basic/summary", "value": "..."}` changes one field
+    - `{"op": "remove", "path": "/projects/0"}` drops a list item
+
+    Only the values being written are validated, and the rest of the document is left untouched.
+    """
+    pipeline = build_pipeline(current_user.resume, operations)
+    if not pipeline:
+        return {'modified': False}
+    try:
+        result = await db.users.update_one({'username': current_user.username}, bump_if_changed(pipeline, 'resume', 'resume_version'))
+    finally:
+        principal_cache.invalidate(current_user.username)
+        recommendation_cache.invalidate(current_user.username)
+    return {'modified': result.modified_count > 0}
 
 @app.put('/change-password')
 async def change_password(new_password: str, current_user: Annotated[UserData, Depends(get_current_active_user)]):
@@ -328,20 +610,17 @@ async def change_password(new_password: str, current_user: Annotated[UserData, D
     # Change User Password
     Update the password for the current user.
     """
-    try:
-        # Hash the new password
-        hashed_password = ph.hash(new_password)
+    # Hash the new password, outside the try so a busy hasher pool surfaces as a 503
+    hashed_password = await hasher_pool.hash(new_password)
 
+    try:
         # Update the password field in the UserData object
         current_user.password = hashed_password
 
-        # Convert the updated UserData object to a dictionary
-        updated_user_data = current_user.dict()
-
         # Update the document in MongoDB
-        result = db.users.update_one(
+        result = await db.users.update_one(
             {'username': current_user.username},
-            {'$set': updated_user_data}
+            {'$set': {'password': hashed_password}}
         )
 
         if result.modified_count > 0:
@@ -353,6 +632,79 @@ async def change_password(new_password: str, current_user: Annotated[UserData, D
             raise HTTPException(status_code=400, detail="Failed to update password")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # current_user may be the cached object we just modified
+        principal_cache.invalidate(current_user.username)
+
+@app.get('/cache-stats')
+async def cache_stats():
+    """# Hit/Miss Counters of the In-Process Caches
+Counters are per worker.
+    """
+    return {
+        'principal': principal_cache.stats(),
+        'recommendations': recommendation_cache.stats(),
+        'companies': company_cache.stats(),
+        'company_lists': company_list_cache.stats(),
+        'recruiter_lists': recruiter_list_cache.stats(),
+    }
+
+@app.get('/pool-stats')
+async def pool_stats(current_user: Annotated[UserData, Depends(get_current_admin)]):
+    """# Mongo Connection Pool per Server
+Open, checked out and waiting connections, checkouts, their failures and mean
+wait, and how often the pool was cleared, with the configured limits and the
+public routes' read preference. Counters are per worker. Admins only, as it
+lists the servers' addresses.
+    """
+    options = client.options.pool_options
+    return {
+        'max_pool_size': options.max_pool_size,
+        'min_pool_size': options.min_pool_size,
+        'wait_queue_timeout_seconds': options.wait_queue_timeout,
+        'public_read_preference': public_db.read_preference.document,
+        'servers': pool_listener.stats(),
+    }
+
+@app.get('/admission-stats')
+async def admission_stats():
+    """# Allowed, Rate Limited and Shed Requests of the Auth Routes
+Counters are per worker.
+    """
+    return auth_guard.stats()
+
+def cache_and_admission_metrics():
+    """The /cache-stats and /admission-stats counters as Prometheus gauges."""
+    caches = {
+        'principal': principal_cache,
+        'recommendations': recommendation_cache,
+        'companies': company_cache,
+        'company_lists': company_list_cache,
+        'recruiter_lists': recruiter_list_cache,
+    }
+    size = Gauge('careerhub_cache_size', 'Entries in the in-process cache.', ('cache',))
+    hits = Counter('careerhub_cache_hits_total', 'In-process cache hits.', ('cache',))
+    misses = Counter('careerhub_cache_misses_total', 'In-process cache misses.', ('cache',))
+    for name, cache in caches.items():
+        stats = cache.stats()
+        size.set((name,), stats['size'])
+        hits.inc((name,), stats['hits'])
+        misses.inc((name,), stats['misses'])
+    admissions = Counter('careerhub_auth_requests_total', 'Auth route requests by outcome.', ('route', 'outcome'))
+    for (route, outcome), count in auth_guard.counts.items():
+        admissions.inc((route, outcome), count)
+    in_flight = Gauge('careerhub_auth_in_flight', 'Auth route requests being handled.', ())
+    in_flight.set((), auth_guard.in_flight)
+    return [size, hits, misses, admissions, in_flight]
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """# Prometheus Metrics
+Request latency per route, time in request and response validation, Mongo
+command timings and document counts per route, Mongo connection pool usage,
+Argon2 timings, and the cache and admission counters. Values are per worker.
+    """
+    return PlainTextResponse(render_metrics(cache_and_admission_metrics()), media_type='text/plain; version=0.0.4')
 
 @app.get('/check-token')
 async def check_token_provided(current_user: Annotated[UserData, Depends(get_current_active_user)]):
@@ -366,13 +718,15 @@ If Invalid, then HTTPException is Returned
 @app.post('/regsiter/company', response_model=Founder)
 async def register_company(company: Company, current_user: Annotated[UserData, Depends(get_current_active_user)]):
     """# Register a Company"""
-    if get_company_by_handle(company.handle):
+    if await get_company_by_handle(company.handle):
         return {
             "company_exists": True
         }
     founder = Founder(founder_email=current_user.resume.basic.email, company_handle=company.handle)
-    cid = db.company.insert_one(json.loads(company.json())).inserted_id
-    fid = db.founders.insert_one(json.loads(founder.json())).inserted_id
+    cid = (await db.company.insert_one(to_document(company))).inserted_id
+    await cache_sync.bump("company")
+    fid = (await db.founders.insert_one(to_document(founder))).inserted_id
+    await bump_roles_version([current_user.username])
     return founder
 
 @app.delete("/register/company", response_model=dict)
@@ -382,37 +736,52 @@ async def unregister_company(request: UnregisterCompanyRequest, current_user: An
     """
     company_handle = request.company_handle
     # Check if the current user is the founder/owner of the company
-    founder = db.founders.find_one({
+    founder = await db.founders.find_one({
         "founder_email": current_user.resume.basic.email,
         "company_handle": company_handle
     })
     if not founder:
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only the company owner can unregister the company.")
 
-    # Delete the company from the database
-    result = db.company.delete_one({"handle": company_handle})
+    # Tombstone the company, it is hidden from now on. The handle stays taken until
+    # the background job has deleted its opportunities and applications.
+    result = await db.company.update_one(
+        {"handle": company_handle, "tombstoned_at": None},
+        {"$set": {"tombstoned_at": datetime.now(timezone.utc)}, "$inc": {"version": 1}}
+    )
 
-    if result.deleted_count == 0:
+    if result.matched_count == 0:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Company not found.")
+    await cache_sync.bump("company")
+    # Gone from this worker's search and recommendations now, other workers leave
+    # them out of their results by the tombstone until the job has deleted them
+    async for opportunity in db.opportunities.find({"company.handle": company_handle}, {"_id": 1}):
+        unindex_opportunity(str(opportunity["_id"]))
 
     # Delete the founder document
-    db.founders.delete_one({"_id": founder["_id"]})
-
-    # Delete all recruiters associated with the company
-    db.recruiters.delete_many({"company_handle": company_handle})
-
-    # Delete all opportunities associated with the company
-    db.opportunities.delete_many({"company.handle": company_handle})
-
-    # Notify recruiters about company unregistration
-    recruiters = db.recruiters.find({"company_handle": company_handle})
-    for recruiter in recruiters:
-        # Send notification to the recruiter's email
-        recruiter_email = recruiter["recruiter_email"]
-        # Include the reason for unregistration in the notification
-        # ... (your notification logic here)
+    await db.founders.delete_one({"_id": founder["_id"]})
+
+    # Delete all recruiters associated with the company, their tokens lose the company claim
+    recruiters = [recruiter async for recruiter in db.recruiters.find({"company_handle": company_handle})]
+    recruiter_usernames = [recruiter["recruiter"] for recruiter in recruiters]
+    await db.recruiters.delete_many({"company_handle": company_handle})
+    await cache_sync.bump("recruiters")
+    await bump_roles_version([current_user.username, *recruiter_usernames])
+
+    # Opportunities, their applications and finally the company go in the background
+    job_id = await jobs.submit("delete_company", {"company_handle": company_handle})
+
+    # Notify recruiters about company unregistration, delivered in the background
+    await outbox.enqueue([
+        (
+            recruiter["recruiter_email"],
+            f"{company_handle} has left CareerHub",
+            f"The company {company_handle} you recruit for has been unregistered from CareerHub.\n\nReason: {request.reason}\n"
+        )
+        for recruiter in recruiters
+    ])
 
-    return {"message": "Company unregistered successfully.", "reason": request.reason}
+    return {"message": "Company unregistered successfully.", "reason": request.reason, "job_id": job_id}
 
 @app.post('/register/recruiter')
 async def be_recruiter(company_handle: str, current_user: Annotated[UserData, Depends(get_current_active_user)]):
@@ -421,13 +790,15 @@ async def be_recruiter(company_handle: str, current_user: Annotated[UserData, De
         recruiter_email=current_user.resume.basic.email,
         recruiter=current_user.username
     )
-    obj = db.recruiters.find_one(data.dict())
+    obj = await db.recruiters.find_one(data.dict())
     if obj:
         return HTTPException(
             status_code = 302,
             detail=f"Recruiter already exists"
         )
-    rid = db.recruiters.insert_one(data.dict()).inserted_id
+    rid = (await db.recruiters.insert_one(data.dict())).inserted_id
+    await cache_sync.bump("recruiters")
+    await bump_roles_version([current_user.username])
     return data
 
 @app.delete('/register/recruiter')
@@ -437,66 +808,257 @@ async def delete_recruiter(company_handle: str, current_user: Annotated[UserData
         recruiter_email=current_user.resume.basic.email,
         recruiter=current_user.username
     )
-    obj = db.recruiters.find_one(data.dict())
+    obj = await db.recruiters.find_one(data.dict())
     if not obj:
         return data
-    db.recruiters.delete_one(data.dict())
+    await db.recruiters.delete_one(data.dict())
+    await cache_sync.bump("recruiters")
+    await bump_roles_version([current_user.username])
     return {
         'data': data,
         'removed': True
     }
 
+PageSize = Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE, description="Page size. The next page's cursor is returned in the X-Next-Cursor header.")]
+PageCursor = Annotated[Optional[str], Query(description="Cursor from the X-Next-Cursor header of the previous page.")]
+StreamNDJSON = Annotated[bool, Query(description="Stream the listing as NDJSON, one document per line.")]
+
+async def cached_recruiters(company_handle: str | None, limit: int | None, after: str | None, stream: bool):
+    query = {'company_handle': company_handle} if company_handle else {}
+    if stream:
+        return await paginate(public_db.recruiters, query, recruiter_encoder, limit, after, stream)
+    items, next_cursor = await recruiter_list_cache.get_or_load(
+        (company_handle, limit, after),
+        lambda: fetch_page(db.recruiters, query, recruiter_encoder, limit, after)
+    )
+    return page_response(items, next_cursor)
+
 @app.get('/recruiter', response_model=List[Recruiter])
-async def list_recruiters():
-    data = [Recruiter(**x) for x in db.recruiters.find({})]
-    return data
+async def list_recruiters(limit: PageSize = None, after: PageCursor = None, stream: StreamNDJSON = False):
+    return await cached_recruiters(None, limit, after, stream)
 
 @app.get('/company', response_model=List[Company])
-async def list_companies():
-    data = [Company(**x) for x in db.company.find({})]
-    return data
+async def list_companies(request: Request, limit: PageSize = None, after: PageCursor = None, stream: StreamNDJSON = False):
+    query = {"tombstoned_at": None}
+    if stream:
+        # On the primary: from a secondary the ETag and the listing could come from different members
+        etag = await collection_etag(db.versions, "company")
+        if matches(request, etag):
+            return not_modified(etag, "company_list")
+        return with_validators(await paginate(db.company, query, company_encoder, limit, after, stream), etag, "company_list")
+
+    async def load():
+        # Read before the listing, so a company added meanwhile makes the next poll refetch
+        etag = await collection_etag(db.versions, "company")
+        return (etag, *await fetch_page(db.company, query, company_encoder, limit, after))
+    etag, items, next_cursor = await company_list_cache.get_or_load((limit, after), load)
+    if matches(request, etag):
+        return not_modified(etag, "company_list")
+    return with_validators(page_response(items, next_cursor), etag, "company_list")
 
 @app.get('/company/{company_handle}', response_model=Company)
-async def company_details(company_handle):
-    data = Company(**db.company.find_one({'handle': company_handle}))
-    return data
+async def company_details(company_handle: str, request: Request):
+    company = await load_company(company_handle)
+    if not company or company.get('tombstoned_at'):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Company not found.")
+    etag = document_etag(company)
+    if matches(request, etag):
+        return not_modified(etag, "company")
+    return with_validators(company_encoder.response(company), etag, "company")
 
-@app.get('/company/{company_handle}/recruiters')
-async def list_recruiters_from_company(company_handle: str):
-    data = [Recruiter(**x) for x in db.recruiters.find({ 'company_handle': company_handle })]
-    return data
+@app.get('/company/{company_handle}/recruiters', response_model=List[Recruiter])
+async def list_recruiters_from_company(company_handle: str, limit: PageSize = None, after: PageCursor = None, stream: StreamNDJSON = False):
+    return await cached_recruiters(company_handle, limit, after, stream)
 
 
+@app.get('/company/{company_handle}/stats', response_model=CompanyStats)
+async def company_stats(company_handle: str, current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    Posting and application counts of a company, for its founder and recruiters.
+    Applications are also counted per UTC day.
+    """
+    if company_handle not in managed_companies(current_user):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only the company's owner and recruiters can view its stats.")
+    return await stats.company(company_handle)
+
+@app.get('/recommendations', response_model=List[OpportunitySearchResult])
+async def recommend_opportunities(current_user: Annotated[UserData, Depends(get_current_active_user)], k: Annotated[int, Query(ge=1, le=100)] = 10):
+    """
+    # Recommended Opportunities
+    Open opportunities that best match the current user's skills, languages, location and education, best first.
+    """
+    cached = recommendation_cache.get(current_user.username)
+    if cached and cached[0] == recommendation_index.version and cached[1] >= k:
+        return json_response(cached[2][:k])
+
+    version = recommendation_index.version
+    ranked = recommendation_index.recommend(current_user.resume.dict(), k)
+    ids = [ObjectId(doc_id) for doc_id, score in ranked]
+    found = await without_tombstoned({str(doc['_id']): doc async for doc in db.opportunities.find({"_id": {"$in": ids}}, listed_opportunity_encoder.projection)})
+    results = [
+        {"score": score, "opportunity": listed_opportunity_encoder.document(found[doc_id])}
+        for doc_id, score in ranked if doc_id in found
+    ]
+    recommendation_cache.set(current_user.username, (version, k, results))
+    return json_response(results)
+
 @app.post("/opportunities", response_model=Opportunity)
 async def create_opportunity(opportunity: Opportunity, current_user: Annotated[UserData, Depends(get_current_active_user)]):
     """
     Create a new job or internship opportunity.
     """
-    # Check if the user is a recruiter or company owner
-    if not is_recruiter_or_company_owner(current_user):
+    # Check if the user is a recruiter or owner of the opportunity's company
+    if not is_recruiter_or_company_owner(current_user, opportunity.company.handle):
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only recruiters and company owners can create opportunities.")
 
     # Convert the Pydantic model to a dictionary
-    opportunity_data = json.loads(opportunity.json())
+    opportunity_data = to_document(opportunity)
 
     # Insert the opportunity into the database
-    opportunity_id = db.opportunities.insert_one(opportunity_data).inserted_id
+    opportunity_id = (await db.opportunities.insert_one(opportunity_data)).inserted_id
+
+    index_opportunity(str(opportunity_id), opportunity_data)
+    await stats.opportunities_added([opportunity_data])
 
     # Retrieve the inserted opportunity from the database
-    inserted_opportunity = db.opportunities.find_one({"_id": opportunity_id})
+    inserted_opportunity = await db.opportunities.find_one({"_id": opportunity_id})
 
     # Convert the database object to a Pydantic model
     return OpportunityWithID(**inserted_opportunity)
 
-@app.get('/opportunities')
+MAX_BULK_ITEMS = 1000
+STATS_FIELDS = {"company.handle": 1, "application_deadline": 1} # What the posting counters need of an opportunity
+
+def check_bulk_size(items: list):
+    if not items:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="The batch is empty.")
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BULK_ITEMS} items per batch.")
+
+def parse_object_ids(ids: List[str]):
+    """ObjectIds for the ids that are valid, and per-item errors for the rest."""
+    parsed = {}
+    errors = {}
+    for index, value in enumerate(ids):
+        try:
+            parsed[index] = ObjectId(value)
+        except (InvalidId, TypeError):
+            errors[index] = BulkItemResult(index=index, id=value, ok=False, error="Invalid id.")
+    return parsed, errors
+
+async def find_managed_opportunities(current_user: UserData, ids: List[str]):
+    """
+    Resolve opportunity ids in one query, keeping those of companies the user manages.
+    Returns ({index: ObjectId} of the found ones, {index: BulkItemResult} of the rest).
+    """
+    parsed, errors = parse_object_ids(ids)
+    found = {
+        doc["_id"] async for doc in db.opportunities.find(
+            {"_id": {"$in": list(parsed.values())}, "company.handle": {"$in": list(managed_companies(current_user))}},
+            {"_id": 1}
+        )
+    }
+    for index, oid in list(parsed.items()):
+        if oid not in found:
+            errors[index] = BulkItemResult(index=index, id=ids[index], ok=False, error="Opportunity not found.")
+            del parsed[index]
+    return parsed, errors
+
+async def check_manages_opportunity(current_user: UserData, opportunity_id: str):
+    found, errors = await find_managed_opportunities(current_user, [opportunity_id])
+    if errors:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
+
+def check_manages_companies(current_user: UserData, opportunities: List[Opportunity]):
+    """Refuse the whole batch if any opportunity is for a company the user does not manage."""
+    not_managed = {opportunity.company.handle for opportunity in opportunities} - managed_companies(current_user)
+    if not_managed:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail=f"Not a recruiter or owner of: {', '.join(sorted(not_managed))}.")
+
+@app.post("/opportunities/bulk", response_model=List[BulkItemResult])
+async def create_opportunities(opportunities: List[Opportunity], current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    Create many job or internship opportunities at once.
+    The whole batch is validated first, then written with a single insert.
+    """
+    check_bulk_size(opportunities)
+    check_manages_companies(current_user, opportunities)
+
+    documents = [to_document(opportunity) for opportunity in opportunities]
+    failed = {}
+    try:
+        await db.opportunities.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+
+    results = []
+    for index, document in enumerate(documents):
+        if index in failed:
+            results.append(BulkItemResult(index=index, ok=False, error=failed[index]))
+            continue
+        index_opportunity(str(document["_id"]), document)
+        results.append(BulkItemResult(index=index, id=str(document["_id"]), ok=True))
+    await stats.opportunities_added([document for index, document in enumerate(documents) if index not in failed])
+    return results
+
+@app.put("/opportunities/bulk", response_model=List[BulkItemResult])
+async def update_opportunities(updates: List[OpportunityUpdate], current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    Update many job or internship opportunities at once.
+    Only opportunities of companies the user recruits for or owns are updated,
+    and they can only be moved to such companies.
+    """
+    check_bulk_size(updates)
+    check_manages_companies(current_user, [update.opportunity for update in updates])
+    found, errors = await find_managed_opportunities(current_user, [update.id for update in updates])
+
+    documents = {index: to_document(updates[index].opportunity) for index in found}
+    if documents:
+        before = [doc async for doc in db.opportunities.find({"_id": {"$in": list(found.values())}}, STATS_FIELDS)]
+        await db.opportunities.bulk_write(
+            [UpdateOne({"_id": found[index]}, {"$set": document, "$inc": {"version": 1}}) for index, document in documents.items()],
+            ordered=False
+        )
+        await stats.opportunities_changed(before, [{**document, "_id": found[index]} for index, document in documents.items()])
+    for index, document in documents.items():
+        index_opportunity(updates[index].id, document)
+    return [errors.get(index) or BulkItemResult(index=index, id=update.id, ok=True) for index, update in enumerate(updates)]
+
+@app.post("/opportunities/bulk/close", response_model=List[BulkItemResult])
+async def close_opportunities(opportunity_ids: List[str], current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    Close many job or internship opportunities at once by moving their application deadline to now.
+    """
+    check_bulk_size(opportunity_ids)
+    found, errors = await find_managed_opportunities(current_user, opportunity_ids)
+
+    if found:
+        before = [doc async for doc in db.opportunities.find({"_id": {"$in": list(found.values())}}, STATS_FIELDS)]
+        await db.opportunities.update_many(
+            {"_id": {"$in": list(found.values())}},
+            # The ISO string to_document stores, so the field keeps one type
+            {"$set": {"application_deadline": TypeAdapter(datetime).dump_python(datetime.now(timezone.utc), mode='json')}, "$inc": {"version": 1}}
+        )
+        after = []
+        async for document in db.opportunities.find({"_id": {"$in": list(found.values())}}):
+            index_opportunity(str(document["_id"]), document)
+            after.append(document)
+        await stats.opportunities_changed(before, after)
+    return [errors.get(index) or BulkItemResult(index=index, id=oid, ok=True) for index, oid in enumerate(opportunity_ids)]
+
+@app.get('/opportunities', response_model=List[OpportunityWithID])
 async def list_all_opportunities(
     company: Optional[str] = None,
     location: Optional[str] = None,
     opportunity_type: Optional[str] = None,
-    keyword: Optional[str] = None
+    keyword: Optional[str] = None,
+    limit: PageSize = None,
+    after: PageCursor = None,
+    stream: StreamNDJSON = False
 ):
     """
     Get a list of job and internship opportunities with filtering options.
+    Use `limit`/`after` to page through the results, or `stream` for NDJSON.
     """
     query = {}
 
@@ -509,39 +1071,65 @@ async def list_all_opportunities(
     if keyword:
         query["$text"] = {"$search": keyword}
 
-    opportunities = [OpportunityWithID(**opportunity) for opportunity in db.opportunities.find(query)]
-    return opportunities
+    return await paginate(public_db.opportunities, query, listed_opportunity_encoder, limit, after, stream)
+
+@app.get('/opportunities/search', response_model=List[OpportunitySearchResult])
+async def search_opportunities(q: str, k: Annotated[int, Query(ge=1, le=100)] = 10):
+    """
+    Search opportunities by position, description, location, company and preferred skills.
+    Returns the `k` best matches, best first.
+    """
+    ranked = search_index.search(q, k)
+    if not ranked:
+        return []
+    ids = [ObjectId(doc_id) for doc_id, score in ranked]
+    found = await without_tombstoned({str(doc['_id']): doc async for doc in public_db.opportunities.find({"_id": {"$in": ids}}, listed_opportunity_encoder.projection)})
+    return json_response([
+        {"score": score, "opportunity": listed_opportunity_encoder.document(found[doc_id])}
+        for doc_id, score in ranked if doc_id in found
+    ])
 
 @app.get("/opportunities/{opportunity_id}", response_model=Opportunity)
-async def get_opportunity(opportunity_id: str):
+async def get_opportunity(opportunity_id: str, request: Request):
     """
     Get details of a specific job or internship opportunity.
     """
-    opportunity = db.opportunities.find_one({"_id": ObjectId(opportunity_id)})
+    query = {"_id": ObjectId(opportunity_id)}
+    if response := await check_not_modified(request, public_db.opportunities, query, "opportunity"):
+        return response
+    opportunity = await public_db.opportunities.find_one(query, {**opportunity_encoder.projection, "version": 1})
     if not opportunity:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
-    return Opportunity(**opportunity)
+    return with_validators(opportunity_encoder.response(opportunity), document_etag(opportunity), "opportunity")
 
 @app.put("/opportunities/{opportunity_id}", response_model=Opportunity)
 async def update_opportunity(opportunity_id: str, opportunity: Opportunity, current_user: Annotated[UserData, Depends(get_current_active_user)]):
     """
     Update an existing job or internship opportunity.
     """
-    # Check if the user is a recruiter or company owner
-    if not is_recruiter_or_company_owner(current_user):
+    # The user must manage both the opportunity's company and the one it is moved to
+    if not is_recruiter_or_company_owner(current_user, opportunity.company.handle):
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only recruiters and company owners can update opportunities.")
+    await check_manages_opportunity(current_user, opportunity_id)
 
     # Convert the Pydantic model to a dictionary
-    opportunity_data = opportunity.dict()
+    opportunity_data = to_document(opportunity)
 
     # Update the opportunity in the database
-    result = db.opportunities.update_one({"_id": ObjectId(opportunity_id)}, {"$set": opportunity_data})
+    before = await db.opportunities.find_one_and_update(
+        {"_id": ObjectId(opportunity_id)},
+        {"$set": opportunity_data, "$inc": {"version": 1}},
+        projection=STATS_FIELDS,
+        return_document=ReturnDocument.BEFORE
+    )
 
-    if result.modified_count == 0:
+    if before is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
+    index_opportunity(opportunity_id, opportunity_data)
+    await stats.opportunities_changed([before], [{**opportunity_data, "_id": before["_id"]}])
 
     # Retrieve the updated opportunity from the database
-    updated_opportunity = db.opportunities.find_one({"_id": ObjectId(opportunity_id)})
+    updated_opportunity = await db.opportunities.find_one({"_id": ObjectId(opportunity_id)})
 
     # Convert the database object to a Pydantic model
     return Opportunity(**updated_opportunity)
@@ -551,38 +1139,69 @@ async def delete_opportunity(opportunity_id: str, current_user: Annotated[UserDa
     """
     Delete a job or internship opportunity.
     """
-    # Check if the user is a recruiter or company owner
-    if not is_recruiter_or_company_owner(current_user):
-        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only recruiters and company owners can delete opportunities.")
+    # Check if the user is a recruiter or owner of the opportunity's company
+    await check_manages_opportunity(current_user, opportunity_id)
 
     # Delete the opportunity from the database
-    result = db.opportunities.delete_one({"_id": ObjectId(opportunity_id)})
+    deleted = await db.opportunities.find_one_and_delete({"_id": ObjectId(opportunity_id)}, projection=STATS_FIELDS)
 
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
+    unindex_opportunity(opportunity_id)
+    await stats.opportunities_removed([deleted])
+
+    # Its applications can be many, they are deleted in the background
+    job_id = await jobs.submit("delete_opportunity", {"opportunity_id": opportunity_id})
 
-    return {"message": "Opportunity deleted successfully."}
+    return {"message": "Opportunity deleted successfully.", "job_id": job_id}
 
 @app.post("/opportunities/{opportunity_id}/apply", response_model=dict)
-async def apply_for_opportunity(opportunity_id: str, application: CandidateApplication, current_user: Annotated[UserData, Depends(get_current_active_user)]):
+async def apply_for_opportunity(
+    opportunity_id: str,
+    application: CandidateApplication,
+    current_user: Annotated[UserData, Depends(get_current_active_user)],
+    idempotency_key: Annotated[Optional[str], Header(max_length=255)] = None
+):
     """
     Apply for a job or internship opportunity.
+    Applying again returns the existing application. Send an `Idempotency-Key` header
+    to safely retry a request whose response got lost.
     """
     # Check if the current user is not a recruiter or company owner
     if is_recruiter_or_company_owner(current_user):
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Recruiters and company owners cannot apply for opportunities.")
 
-    # Check if the opportunity exists
-    opportunity = db.opportunities.find_one({"_id": ObjectId(opportunity_id)})
-    if not opportunity:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
-
-    # Insert the application data into the database
-    application_data = application.dict()
-    application_data["opportunity_id"] = opportunity_id
-    application_id = db.applications.insert_one(application_data).inserted_id
+    email = current_user.resume.basic.email
+    if application.candidate_email != email:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Email does not match the current user.")
 
-    return {"message": "Application submitted successfully.", "application_id": str(application_id)}
+    body = {**to_document(application), "opportunity_id": opportunity_id}
+    async with idempotency_keys.attempt(f"apply:{current_user.username}", idempotency_key, body) as attempt:
+        if attempt.replay is not None:
+            return attempt.replay
+
+        # Check if the opportunity exists
+        opportunity = await db.opportunities.find_one({"_id": ObjectId(opportunity_id)}, {"company.handle": 1})
+        if not opportunity:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
+        company = await load_company(opportunity["company"]["handle"])
+        if company and company.get("tombstoned_at"):
+            # The company is being unregistered, its opportunities go with it
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
+
+        # Insert the application data into the database
+        application_data = {**body, "status": "applied"} # Only recruiters move it on from here
+        try:
+            application_id = (await db.applications.insert_one(application_data)).inserted_id
+        except DuplicateKeyError:
+            # One application per candidate and opportunity, this is a repeat
+            existing = await db.applications.find_one({"opportunity_id": opportunity_id, "candidate_email": email}, {"_id": 1})
+            attempt.response = {"message": "Already applied for this opportunity.", "application_id": str(existing["_id"])}
+            return attempt.response
+        await stats.applied(application_id, opportunity_id, opportunity["company"]["handle"])
+
+        attempt.response = {"message": "Application submitted successfully.", "application_id": str(application_id)}
+        return attempt.response
 
 
 @app.get("/opportunities/{opportunity_id}/applications", response_model=List[CandidateApplication])
@@ -590,16 +1209,171 @@ async def get_opportunity_applications(opportunity_id: str, current_user: Annota
     """
     Get a list of candidates who applied for a job or internship opportunity.
     """
-    # Check if the current user is a recruiter or company owner
-    if not is_recruiter_or_company_owner(current_user):
-        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Only recruiters and company owners can view applications.")
+    # Check if the opportunity exists and the user recruits for or owns its company
+    await check_manages_opportunity(current_user, opportunity_id)
+
+    # Retrieve the applications for the opportunity from the database
+    applications = [application_encoder.document(application) async for application in db.applications.find({"opportunity_id": opportunity_id}, application_encoder.projection)]
+
+    return json_response(applications)
+
+@app.put("/opportunities/{opportunity_id}/applications/status", response_model=List[BulkItemResult])
+async def change_application_statuses(opportunity_id: str, changes: List[ApplicationStatusChange], current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    Move many applications for an opportunity to a new status (shortlisted, rejected, hired, ...) at once.
+    """
+    check_bulk_size(changes)
+    found, errors = await find_managed_opportunities(current_user, [opportunity_id])
+    if errors:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
+
+    ids, errors = parse_object_ids([change.application_id for change in changes])
+    existing = {
+        doc["_id"] async for doc in db.applications.find(
+            {"_id": {"$in": list(ids.values())}, "opportunity_id": opportunity_id},
+            {"_id": 1}
+        )
+    }
+    for index, oid in list(ids.items()):
+        if oid not in existing:
+            errors[index] = BulkItemResult(index=index, id=changes[index].application_id, ok=False, error="Application not found.")
+            del ids[index]
+    if ids:
+        await db.applications.bulk_write(
+            [UpdateOne({"_id": oid}, {"$set": {"status": changes[index].status}}) for index, oid in ids.items()],
+            ordered=False
+        )
+    return [errors.get(index) or BulkItemResult(index=index, id=change.application_id, ok=True) for index, change in enumerate(changes)]
+
+@app.get("/opportunities/{opportunity_id}/stats", response_model=OpportunityStats)
+async def opportunity_stats(opportunity_id: str, current_user: Annotated[UserData, Depends(get_current_active_user)]):
+    """
+    Application counts of a job or internship opportunity, in total and per UTC day.
+    """
+    await check_manages_opportunity(current_user, opportunity_id)
+    return await stats.opportunity(opportunity_id)
+
+@app.get("/opportunities/{opportunity_id}/applications/review", response_model=List[ReviewedApplication])
+async def review_opportunity_applications(
+    opportunity_id: str,
+    current_user: Annotated[UserData, Depends(get_current_active_user)],
+    limit: PageSize = None,
+    after: PageCursor = None,
+    stream: StreamNDJSON = False
+):
+    """
+    Get the applications for a job or internship opportunity together with each applicant's
+    basic info, current job, education, skills and work history, all in one request.
+    Use `limit`/`after` to page through them, or `stream` for NDJSON.
+    """
+    await check_manages_opportunity(current_user, opportunity_id)
+    return await paginate_aggregate(db.applications, {"opportunity_id": opportunity_id}, APPLICANT_STAGES, reviewed_application_encoder, limit, after, stream)
+
+EXPORT_BATCH_SIZE = 500
 
-    # Check if the opportunity exists
-    opportunity = db.opportunities.find_one({"_id": ObjectId(opportunity_id)})
+@app.get("/opportunities/{opportunity_id}/applications/export")
+async def export_opportunity_applications(
+    opportunity_id: str,
+    current_user: Annotated[UserData, Depends(get_current_active_user)],
+    format: Literal['csv', 'ndjson'] = 'csv'
+):
+    """
+    Download every application for a job or internship opportunity with its applicant's
+    details, as CSV (one row per application) or NDJSON (documents as in the review route).
+    The file is streamed as it is read from the database.
+    """
+    await check_manages_opportunity(current_user, opportunity_id)
+    cursor = await db.applications.aggregate(
+        [{"$match": {"opportunity_id": opportunity_id}}, {"$sort": {"_id": 1}}, *APPLICANT_STAGES, {"$project": reviewed_application_encoder.projection}],
+        batchSize=EXPORT_BATCH_SIZE
+    )
+    if format == 'csv':
+        body, media_type = csv_chunks(cursor), 'text/csv'
+    else:
+        async def lines():
+            async for doc in cursor:
+                yield reviewed_application_encoder.line(doc)
+        body, media_type = lines(), 'application/x-ndjson'
+    return StreamingResponse(body, media_type=media_type, headers={'Content-Disposition': f'attachment; filename="applications-{opportunity_id}.{format}"'})
+
+@app.get("/opportunities/{opportunity_id}/applications/ranked", response_model=List[RankedApplication])
+async def get_ranked_opportunity_applications(opportunity_id: str, current_user: Annotated[UserData, Depends(get_current_active_user)], k: Annotated[int, Query(ge=1, le=1000)] = 50):
+    """
+    Get the `k` best matching applicants for a job or internship opportunity.
+    Applicants are scored on how their skills, education and work history match the
+    opportunity's preferred skills, requirements and preferred experience.
+    """
+    await check_manages_opportunity(current_user, opportunity_id)
+    opportunity = await db.opportunities.find_one({"_id": ObjectId(opportunity_id)})
     if not opportunity:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Opportunity not found.")
 
-    # Retrieve the applications for the opportunity from the database
-    applications = [CandidateApplication(**application) for application in db.applications.find({"opportunity_id": opportunity_id})]
+    applications = [application async for application in db.applications.find({"opportunity_id": opportunity_id})]
+    emails = [application["candidate_email"] for application in applications]
+    resumes = {
+        user["resume"]["basic"]["email"]: user["resume"]
+        async for user in db.users.find(
+            {"resume.basic.email": {"$in": emails}},
+            {"resume.basic.email": 1, "resume.skills": 1, "resume.education": 1, "resume.work": 1}
+        )
+    }
 
-    return applications
+    from ranking import rank_applicants # NumPy is loaded by lifespan, keep it off the import path
+    ranked = rank_applicants(opportunity, [resumes.get(email) for email in emails], k)
+    return [
+        RankedApplication(application=CandidateApplication(**applications[i]), score=score, breakdown=breakdown)
+        for i, score, breakdown in ranked
+    ]
+
+BulkKind = Literal['users', 'companies', 'opportunities']
+
+@app.post('/admin/import/{kind}')
+async def bulk_import(
+    kind: BulkKind,
+    request: Request,
+    current_user: Annotated[UserData, Depends(get_current_admin)],
+    batch_size: Annotated[int, Query(ge=1, le=MAX_BULK_ITEMS)] = MAX_BULK_ITEMS
+):
+    """
+    Import users, companies or opportunities from an NDJSON request body, one record per line
+    in the shape `POST /register`, `POST /regsiter/company` or `POST /opportunities` take.
+    Users' passwords may be plain text or Argon2 hashes. Lines that fail do not stop the import,
+    they are reported with their line number. Companies are imported without founders.
+    """
+    global import_executor
+    if import_executor is None:
+        # Spawned, forking a process with running threads is not safe
+        import_executor = ProcessPoolExecutor(import_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def index_opportunities(documents):
+        for document in documents:
+            index_opportunity(str(document["_id"]), document)
+        await stats.opportunities_added(documents)
+
+    importer = Importer(
+        db, kind, import_executor, batch_size,
+        max_pending=import_workers * 2,
+        on_inserted=index_opportunities if kind == 'opportunities' else None,
+    )
+    report = await importer.run(split_lines(request.stream()))
+    if kind == 'companies' and report.inserted:
+        await cache_sync.bump("company")
+    logging.info(f"{current_user.username} imported {report.inserted} {kind}, {report.failed} failed")
+    return report.as_dict()
+
+@app.get('/admin/export/{kind}')
+async def bulk_export(kind: BulkKind, current_user: Annotated[UserData, Depends(get_current_admin)]):
+    """
+    Stream all users, companies or opportunities as NDJSON, in the shape the import takes.
+    Users are exported with their password hashes.
+    """
+    return StreamingResponse(export_lines(db, kind), media_type='application/x-ndjson')
+
+@app.post('/admin/stats/reconcile')
+async def reconcile_stats(current_user: Annotated[UserData, Depends(get_current_admin)]):
+    """
+    Rebuild the company and opportunity stats from the opportunities and applications,
+    in a background job whose `job_id` is returned.
+    """
+    job_id = await jobs.submit("reconcile_stats", {})
+    return {"message": "Reconciliation started.", "job_id": job_id}
@@ -0,0 +1,928 @@
+"""
+Load-testing benchmark for every route of the API.
+
+Point MONGODB_URI at a local, throwaway mongod; seeding drops the collections.
+
+    python benchmark.py seed --scale 10000 --drop
+    uvicorn app:app --workers 4     # with the same MONGODB_URI
+    python benchmark.py run --url http://localhost:8000 --concurrency 32 --out results.json
+    python benchmark.py compare results.json baseline.json
+    python benchmark.py mixed --url http://localhost:8000 --concurrency 128 --out mixed.json
+    python benchmark.py race --url http://localhost:8000
+    python benchmark.py attack --url http://localhost:8000 --seconds 30
+    python benchmark.py resume-patch --url http://localhost:8000 --entries 50
+    python benchmark.py bulk --url http://localhost:8000 --items 20
+
+`seed` writes synthetic users (resumes), companies with their founders and a
+recruiter, opportunities and applications, `--scale` users and the rest in
+proportion. The data only depends on `--seed` (and the day, deadlines are set
+from it), so runs are reproducible: seed again before every run, as the write
+routes change the data.
+
+`run` drives each route in turn with `--requests` requests from
+`--concurrency` concurrent clients and writes throughput, p50/p95/p99 latency
+and status codes per route as JSON. Resources a request needs, like a fresh
+account to unregister, are prepared before the route's timer starts. Raise
+the AUTH_* rate limits of the server first, or `POST /token` and
+`POST /register` mostly measure 429s.
+
+`mixed` keeps `--concurrency` clients busy for `--seconds`, half listing
+opportunities and half logging in, and writes throughput and p50/p95/p99
+latency of both routes in the format of `run`. Comparing it against a run on
+a build that queried MongoDB synchronously shows whether requests overlap
+their database I/O. Like `run`, it needs the AUTH_* rate limits raised.
+
+`race` fires duplicate submissions of one application at once and exits
+non-zero unless exactly one was stored and every response pointed at it.
+
+`attack` runs credential stuffing against `POST /token` while seeded users
+log in and read, first without and then with the attack, and reports their
+latency in both phases. The attack guesses passwords of every seeded user,
+and also targets each of the measured users at `--victim-rate` per minute.
+Each client sends its own `X-Forwarded-For`, the attackers rotating through
+many addresses, so run the server with `--proxy-headers --forwarded-allow-ips
+'*'` and its default AUTH_* limits. It exits non-zero if a measured user's
+correct login got a 429 or 401, if fewer than `--min-login-success` of their
+logins succeeded, or if their reads got more than `--tolerance` slower at p99.
+
+`resume-patch` registers an account with a large resume and changes one of
+its skills, first `--requests` times with `PUT /resume` and the whole resume,
+then with a single `replace` operation on `PATCH /resume`. It reports request
+bytes and latency of each, and exits non-zero if any edit failed.
+
+`bulk` creates and updates `--items` opportunities of the first seeded
+company and changes the status of as many of its applications, first with one
+request per item and then with one bulk request. It reports HTTP requests,
+requests the mongod received (from `serverStatus`, so run it against an
+otherwise idle server) and milliseconds per item, and exits non-zero if an
+item failed.
+
+`compare` exits non-zero when a route got slower or its throughput dropped by
+more than `--tolerance`, or it fails more often than in the baseline.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from startup import build_info
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+PASSWORD = 'benchmark-password'
+
+SKILLS = ['python', 'fastapi', 'mongodb', 'react', 'typescript', 'go', 'rust', 'java', 'kotlin', 'sql',
+          'docker', 'kubernetes', 'aws', 'machine learning', 'pandas', 'figma', 'excel', 'c++', 'django', 'flutter']
+CITIES = ['Kolkata', 'Bengaluru', 'Mumbai', 'Delhi', 'Pune', 'Hyderabad', 'Chennai', 'Remote']
+POSITIONS = ['Backend Engineer', 'Frontend Developer', 'Data Scientist', 'DevOps Engineer', 'Product Designer',
+             'Mobile Developer', 'ML Engineer', 'QA Engineer', 'Business Analyst', 'Intern']
+AREAS = ['Computer Science', 'Electronics', 'Mathematics', 'Design', 'Statistics', 'Mechanical']
+STUDY_TYPES = ['Bachelor', 'Master', 'Diploma', 'PhD']
+INDUSTRIES = ['Software', 'Fintech', 'Healthcare', 'Education', 'Retail', 'Logistics']
+WORDS = ['build', 'scale', 'ship', 'design', 'own', 'product', 'team', 'customers', 'platform', 'data',
+         'reliable', 'fast', 'secure', 'services', 'mentor', 'growth']
+
+def date(year: int, month: int = 1) -> str:
+    return datetime(year, month, 1).isoformat()
+
+def sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+def make_skill(rng: random.Random):
+    return {'name': rng.choice(SKILLS), 'level': rng.randrange(10, 100), 'keywords': rng.sample(SKILLS, 2)}
+
+def make_education(rng: random.Random):
+    start = rng.randrange(2005, 2022)
+    return {
+        'institution': f'Institute {rng.randrange(200)}', 'url': 'https://institute.example',
+        'area': rng.choice(AREAS), 'studytype': rng.choice(STUDY_TYPES),
+        'start_date': date(start, 7), 'end_date': date(start + 4, 6), 'score': round(rng.uniform(5, 10), 1),
+        'courses': rng.sample(SKILLS, 2),
+    }
+
+def make_work(rng: random.Random):
+    return {
+        'name': f'Company {rng.randrange(1000)}', 'position': rng.choice(POSITIONS),
+        'url': 'https://company.example/', 'start_date': date(2019), 'enddate': date(2022),
+        'summary': sentence(rng, 10),
+    }
+
+def make_resume(rng: random.Random, username: str):
+    return {
+        'basic': {
+            'name': username.replace('-', ' ').title(), 'email': f'{username}@bench.example',
+            'image': 'https://bench.example/avatar.png', 'phone': f'+91{rng.randrange(10**9, 10**10)}',
+            'url': None, 'summary': sentence(rng, 12), 'location': rng.choice(CITIES), 'profiles': [],
+        },
+        'working_at': None,
+        'education': [make_education(rng) for _ in range(rng.randrange(1, 3))],
+        'skills': [make_skill(rng) for _ in range(rng.randrange(2, 8))],
+        'languages': [{'name': 'English', 'fluency': rng.randrange(40, 100)}],
+        'projects': [], 'certificates': [], 'awards': [],
+        'work': [make_work(rng) for _ in range(rng.randrange(0, 3))],
+        'interests': [],
+    }
+
+def make_large_resume(rng: random.Random, username: str, entries: int):
+    """A resume with `entries` skills, schools and jobs."""
+    resume = make_resume(rng, username)
+    resume['skills'] = [make_skill(rng) for _ in range(entries)]
+    resume['education'] = [make_education(rng) for _ in range(entries)]
+    resume['work'] = [make_work(rng) for _ in range(entries)]
+    return resume
+
+def make_company(rng: random.Random, handle: str):
+    return {
+        'name': handle.replace('-', ' ').title(), 'handle': handle, 'industry': rng.choice(INDUSTRIES),
+        'founded': rng.randrange(1990, 2024), 'description': sentence(rng, 20), 'logo': 'https://bench.example/logo.png',
+    }
+
+def make_opportunity(rng: random.Random, company: dict):
+    job = rng.random() < 0.7
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    deadline = today + timedelta(days=rng.randrange(30, 365))
+    return {
+        'position': rng.choice(POSITIONS), 'company': company, 'description': sentence(rng, 40),
+        'location': rng.choice(CITIES), 'opportunity_type': 'job' if job else 'internship',
+        'start_date': date(2026), 'end_date': None if job else date(2026, 7),
+        'requirements': [make_education(rng)], 'preferred_skills': [make_skill(rng) for _ in range(3)],
+        'preferred_experience': [],
+        'application_deadline': deadline.isoformat(),
+        'salary_range': None, 'url': None,
+    }
+
+def make_application(rng: random.Random, email: str, opportunity_id: str):
+    return {
+        'candidate_email': email, 'opportunity_id': opportunity_id, 'cover_letter': sentence(rng, 30),
+        'status': rng.choice(['applied', 'applied', 'applied', 'shortlisted', 'rejected']),
+    }
+
+def check_shapes(rng: random.Random):
+    """Fail early if the generators drift from the models the app validates against."""
+    from data_class import CandidateApplication, Company, Opportunity, UserData
+
+    company = make_company(rng, 'shape-check')
+    UserData(username='shape-check', password=PASSWORD, resume=make_resume(rng, 'shape-check'))
+    Company(**company)
+    Opportunity(**make_opportunity(rng, company))
+    CandidateApplication(**make_application(rng, 'shape-check@bench.example', 'x'))
+
+def layout(scale: int):
+    """How many documents of each kind a scale seeds."""
+    companies = max(1, scale // 50)
+    return {
+        'users': max(scale, 2 * companies + 1),
+        'companies': companies,
+        'opportunities': max(1, scale // 5),
+        'applications': scale * 2,
+    }
+
+def username(i: int) -> str:
+    return f'bench-user-{i}'
+
+def company_handle(i: int) -> str:
+    return f'bench-company-{i}'
+
+async def insert_batches(collection, documents, batch_size: int = 5000):
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+async def seed(db, scale: int, seed_value: int):
+    """
+    Users 0..companies-1 found one company each, the next `companies` users
+    recruit for one each, and the rest are candidates.
+    """
+    from hashing import make_hasher
+    from indexes import ensure_indexes
+    from bson.objectid import ObjectId
+
+    rng = random.Random(seed_value)
+    check_shapes(random.Random(seed_value))
+    counts = layout(scale)
+    hashed = make_hasher().hash(PASSWORD) # One Argon2 hash shared by every account
+
+    await insert_batches(db.users, (
+        {'username': username(i), 'password': hashed, 'resume': make_resume(rng, username(i))}
+        for i in range(counts['users'])
+    ))
+    companies = [make_company(rng, company_handle(i)) for i in range(counts['companies'])]
+    await insert_batches(db.company, [dict(company) for company in companies])
+    await insert_batches(db.founders, (
+        {'founder_email': f'{username(i)}@bench.example', 'company_handle': company_handle(i)}
+        for i in range(counts['companies'])
+    ))
+    await insert_batches(db.recruiters, (
+        {'recruiter_email': f'{username(counts["companies"] + i)}@bench.example',
+         'recruiter': username(counts['companies'] + i), 'company_handle': company_handle(i)}
+        for i in range(counts['companies'])
+    ))
+
+    opportunity_ids = [ObjectId() for _ in range(counts['opportunities'])]
+    await insert_batches(db.opportunities, (
+        {'_id': oid, **make_opportunity(rng, companies[i % len(companies)])}
+        for i, oid in enumerate(opportunity_ids)
+    ))
+    first_candidate = 2 * counts['companies']
+    candidates = range(first_candidate, counts['users'])
+    per_candidate, extra = divmod(counts['applications'], max(1, len(candidates)))
+
+    def applications():
+        # Distinct opportunities per candidate, one application each
+        for i, candidate in enumerate(candidates):
+            for opportunity in rng.sample(range(len(opportunity_ids)), min(len(opportunity_ids), per_candidate + (i < extra))):
+                yield make_application(rng, f'{username(candidate)}@bench.example', str(opportunity_ids[opportunity]))
+    await insert_batches(db.applications, applications())
+    await ensure_indexes(db)
+    return counts
+
+class Context:
+    """Accounts and ids the scenarios draw from, set up before any route is timed."""
+    def __init__(self, client, db, rng: random.Random):
+        self.client = client
+        self.db = db
+        self.rng = rng
+        self.run_id = uuid.uuid4().hex[:8]
+        self.created = 0
+        self.candidates = [] # (username, headers)
+        self.founders = [] # (headers, company, [opportunity ids])
+        self.usernames = []
+        self.handles = []
+        self.opportunity_ids = []
+        self.applications = {} # opportunity id -> application ids
+        self.job_id = None
+
+    def unique(self, prefix: str) -> str:
+        self.created += 1
+        return f'{prefix}-{self.run_id}-{self.created}'
+
+    async def login(self, name: str):
+        response = await self.client.post('/token', data={'username': name, 'password': PASSWORD})
+        response.raise_for_status()
+        return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+    async def new_user(self):
+        """Register a fresh account, returns (username, headers)."""
+        name = self.unique('bench-new')
+        response = await self.client.post('/register', json={
+            'username': name, 'password': PASSWORD, 'resume': make_resume(self.rng, name),
+        })
+        response.raise_for_status()
+        return name, await self.login(name)
+
+    async def new_founder(self):
+        """A fresh account that founded a fresh company, returns (headers, company)."""
+        name, headers = await self.new_user()
+        company = make_company(self.rng, self.unique('bench-new-company'))
+        (await self.client.post('/regsiter/company', json=company, headers=headers)).raise_for_status()
+        return await self.login(name), company # Registering the company changed the token's claims
+
+    async def setup(self, accounts: int):
+        counts = await self.db.users.count_documents({})
+        companies = await self.db.company.count_documents({})
+        first_candidate = 2 * companies
+        for i in range(first_candidate, min(first_candidate + accounts, counts)):
+            self.candidates.append((username(i), await self.login(username(i))))
+        for i in range(min(accounts, companies)):
+            opportunities = [
+                str(doc['_id']) async for doc in
+                self.db.opportunities.find({'company.handle': company_handle(i)}, {'_id': 1}).limit(100)
+            ]
+            company = await self.db.company.find_one({'handle': company_handle(i)}, {'_id': 0})
+            self.founders.append((await self.login(username(i)), company, opportunities))
+            for opportunity_id in opportunities:
+                self.applications[opportunity_id] = [
+                    str(doc['_id']) async for doc in
+                    self.db.applications.find({'opportunity_id': opportunity_id}, {'_id': 1}).limit(50)
+                ]
+        self.usernames = [username(self.rng.randrange(counts)) for _ in range(1000)]
+        self.handles = [company_handle(self.rng.randrange(companies)) for _ in range(1000)]
+        self.opportunity_ids = [str(doc['_id']) async for doc in await self.db.opportunities.aggregate([{'$sample': {'size': 1000}}])]
+
+        name, headers = await self.new_user()
+        response = await self.client.request('DELETE', '/register', headers=headers, json={
+            'email': f'{name}@bench.example', 'reason': 'benchmark',
+        })
+        self.job_id = response.json()['job_id']
+
+    def candidate(self):
+        return self.rng.choice(self.candidates)
+
+    def founder(self):
+        """A founder with at least one opportunity, and one of those opportunities."""
+        headers, company, opportunities = self.rng.choice([f for f in self.founders if f[2]])
+        return headers, company, self.rng.choice(opportunities)
+
+async def prepare_many(ctx: Context, n: int, make):
+    items = []
+    for start in range(0, n, 16):
+        items.extend(await asyncio.gather(*(make() for _ in range(min(16, n - start)))))
+    return items
+
+async def prepare_recruiter(ctx: Context):
+    name, headers = await ctx.new_user()
+    handle = ctx.rng.choice(ctx.handles)
+    (await ctx.client.post('/register/recruiter', params={'company_handle': handle}, headers=headers)).raise_for_status()
+    return await ctx.login(name), handle # The new role changed the token's claims
+
+async def prepare_opportunity(ctx: Context):
+    headers, company, _ = ctx.founder()
+    response = await ctx.client.post('/opportunities/bulk', json=[make_opportunity(ctx.rng, company)], headers=headers)
+    response.raise_for_status()
+    return headers, response.json()[0]['id']
+
+async def prepare_closable(ctx: Context):
+    headers, company, _ = ctx.founder()
+    response = await ctx.client.post('/opportunities/bulk', json=[make_opportunity(ctx.rng, company) for _ in range(20)], headers=headers)
+    response.raise_for_status()
+    return headers, [item['id'] for item in response.json()]
+
+def statuses(ctx: Context, opportunity_id: str):
+    return [
+        {'application_id': application_id, 'status': ctx.rng.choice(['shortlisted', 'rejected', 'applied'])}
+        for application_id in ctx.applications.get(opportunity_id, [])[:20]
+    ]
+
+# route -> (build(ctx, prepared item) -> (method, url, request kwargs), prepare(ctx, n) -> items or None, most requests)
+# Routes that need a fresh resource per request prepare it untimed, and are capped as that is slow.
+SCENARIOS = {
+    'GET /': (lambda ctx, _: ('GET', '/', {}), None, None),
+    'POST /register': (lambda ctx, _: ('POST', '/register', {'json': {
+        'username': (name := ctx.unique('bench-register')), 'password': PASSWORD, 'resume': make_resume(ctx.rng, name),
+    }}), None, None),
+    'DELETE /register': (lambda ctx, user: ('DELETE', '/register', {'headers': user[1], 'json': {
+        'email': f'{user[0]}@bench.example', 'reason': 'benchmark',
+    }}), lambda ctx, n: prepare_many(ctx, n, ctx.new_user), 200),
+    'GET /jobs/{job_id}': (lambda ctx, _: ('GET', f'/jobs/{ctx.job_id}', {}), None, None),
+    'POST /token': (lambda ctx, _: ('POST', '/token', {'data': {
+        'username': ctx.candidate()[0], 'password': PASSWORD,
+    }}), None, None),
+    'GET /resume': (lambda ctx, _: ('GET', '/resume', {'headers': ctx.candidate()[1]}), None, None),
+    'GET /resume/{username}': (lambda ctx, _: ('GET', f'/resume/{ctx.rng.choice(ctx.usernames)}', {}), None, None),
+    'PUT /resume': (lambda ctx, _: ('PUT', '/resume', {
+        'headers': (candidate := ctx.candidate())[1], 'json': make_resume(ctx.rng, candidate[0]),
+    }), None, None),
+    'PATCH /resume': (lambda ctx, _: ('PATCH', '/resume', {'headers': ctx.candidate()[1], 'json': [
+        {'op': 'replace', 'path': '/basic/summary', 'value': sentence(ctx.rng, 12)},
+        {'op': 'add', 'path': '/skills/-', 'value': make_skill(ctx.rng)},
+    ]}), None, None),
+    'PUT /change-password': (lambda ctx, _: ('PUT', '/change-password', {
+        'headers': ctx.candidate()[1], 'params': {'new_password': PASSWORD},
+    }), None, None),
+    'GET /cache-stats': (lambda ctx, _: ('GET', '/cache-stats', {}), None, None),
+    'GET /admission-stats': (lambda ctx, _: ('GET', '/admission-stats', {}), None, None),
+    'GET /metrics': (lambda ctx, _: ('GET', '/metrics', {}), None, None),
+    'GET /check-token': (lambda ctx, _: ('GET', '/check-token', {'headers': ctx.candidate()[1]}), None, None),
+    'POST /regsiter/company': (lambda ctx, user: ('POST', '/regsiter/company', {
+        'headers': user[1], 'json': make_company(ctx.rng, ctx.unique('bench-company')),
+    }), lambda ctx, n: prepare_many(ctx, n, ctx.new_user), 200),
+    'DELETE /register/company': (lambda ctx, founder: ('DELETE', '/register/company', {'headers': founder[0], 'json': {
+        'company_handle': founder[1]['handle'], 'reason': 'benchmark',
+    }}), lambda ctx, n: prepare_many(ctx, n, ctx.new_founder), 200),
+    'POST /register/recruiter': (lambda ctx, user: ('POST', '/register/recruiter', {
+        'headers': user[1], 'params': {'company_handle': ctx.rng.choice(ctx.handles)},
+    }), lambda ctx, n: prepare_many(ctx, n, ctx.new_user), 200),
+    'DELETE /register/recruiter': (lambda ctx, recruiter: ('DELETE', '/register/recruiter', {
+        'headers': recruiter[0], 'params': {'company_handle': recruiter[1]},
+    }), lambda ctx, n: prepare_many(ctx, n, lambda: prepare_recruiter(ctx)), 200),
+    'GET /recruiter': (lambda ctx, _: ('GET', '/recruiter', {'params': {'limit': 50}}), None, None),
+    'GET /company': (lambda ctx, _: ('GET', '/company', {'params': {'limit': 50}}), None, None),
+    'GET /company/{company_handle}': (lambda ctx, _: ('GET', f'/company/{ctx.rng.choice(ctx.handles)}', {}), None, None),
+    'GET /company/{company_handle}/stats': (lambda ctx, _: ('GET', f'/company/{(founder := ctx.founder())[1]["handle"]}/stats', {
+        'headers': founder[0],
+    }), None, None),
+    'GET /opportunities/{opportunity_id}/stats': (lambda ctx, _: ('GET', f'/opportunities/{(founder := ctx.founder())[2]}/stats', {
+        'headers': founder[0],
+    }), None, None),
+    'GET /company/{company_handle}/recruiters': (lambda ctx, _: ('GET', f'/company/{ctx.rng.choice(ctx.handles)}/recruiters', {}), None, None),
+    'GET /recommendations': (lambda ctx, _: ('GET', '/recommendations', {'headers': ctx.candidate()[1]}), None, None),
+    'POST /opportunities': (lambda ctx, _: ('POST', '/opportunities', {
+        'headers': (founder := ctx.founder())[0], 'json': make_opportunity(ctx.rng, founder[1]),
+    }), None, None),
+    'POST /opportunities/bulk': (lambda ctx, _: ('POST', '/opportunities/bulk', {
+        'headers': (founder := ctx.founder())[0], 'json': [make_opportunity(ctx.rng, founder[1]) for _ in range(20)],
+    }), None, None),
+    'PUT /opportunities/bulk': (lambda ctx, _: ('PUT', '/opportunities/bulk', {
+        'headers': (founder := ctx.founder())[0],
+        'json': [{'id': founder[2], 'opportunity': make_opportunity(ctx.rng, founder[1])}],
+    }), None, None),
+    'POST /opportunities/bulk/close': (lambda ctx, batch: ('POST', '/opportunities/bulk/close', {
+        'headers': batch[0], 'json': batch[1],
+    }), lambda ctx, n: prepare_many(ctx, n, lambda: prepare_closable(ctx)), 200),
+    'GET /opportunities': (lambda ctx, _: ('GET', '/opportunities', {'params': {'limit': 50, 'location': ctx.rng.choice(CITIES)}}), None, None),
+    'GET /opportunities/search': (lambda ctx, _: ('GET', '/opportunities/search', {'params': {
+        'q': f'{ctx.rng.choice(POSITIONS)} {ctx.rng.choice(SKILLS)}',
+    }}), None, None),
+    'GET /opportunities/{opportunity_id}': (lambda ctx, _: ('GET', f'/opportunities/{ctx.rng.choice(ctx.opportunity_ids)}', {}), None, None),
+    'PUT /opportunities/{opportunity_id}': (lambda ctx, _: ('PUT', f'/opportunities/{(founder := ctx.founder())[2]}', {
+        'headers': founder[0], 'json': make_opportunity(ctx.rng, founder[1]),
+    }), None, None),
+    'DELETE /opportunities/{opportunity_id}': (lambda ctx, created: ('DELETE', f'/opportunities/{created[1]}', {
+        'headers': created[0],
+    }), lambda ctx, n: prepare_many(ctx, n, lambda: prepare_opportunity(ctx)), 500),
+    'POST /opportunities/{opportunity_id}/apply': (lambda ctx, _: ('POST', f'/opportunities/{(oid := ctx.rng.choice(ctx.opportunity_ids))}/apply', {
+        'headers': (candidate := ctx.candidate())[1],
+        'json': make_application(ctx.rng, f'{candidate[0]}@bench.example', oid),
+    }), None, None),
+    'GET /opportunities/{opportunity_id}/applications': (lambda ctx, _: ('GET', f'/opportunities/{(founder := ctx.founder())[2]}/applications', {
+        'headers': founder[0],
+    }), None, None),
+    'PUT /opportunities/{opportunity_id}/applications/status': (lambda ctx, _: ('PUT', f'/opportunities/{(founder := ctx.founder())[2]}/applications/status', {
+        'headers': founder[0], 'json': statuses(ctx, founder[2]) or [{'application_id': '0' * 24, 'status': 'applied'}],
+    }), None, None),
+    'GET /opportunities/{opportunity_id}/applications/review': (lambda ctx, _: ('GET', f'/opportunities/{(founder := ctx.founder())[2]}/applications/review', {
+        'headers': founder[0], 'params': {'limit': 50},
+    }), None, None),
+    'GET /opportunities/{opportunity_id}/applications/export': (lambda ctx, _: ('GET', f'/opportunities/{(founder := ctx.founder())[2]}/applications/export', {
+        'headers': founder[0],
+    }), None, None),
+    'GET /opportunities/{opportunity_id}/applications/ranked': (lambda ctx, _: ('GET', f'/opportunities/{(founder := ctx.founder())[2]}/applications/ranked', {
+        'headers': founder[0],
+    }), None, None),
+}
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def run_route(ctx: Context, route: str, requests: int, concurrency: int):
+    build, prepare, most = SCENARIOS[route]
+    n = min(requests, most) if most else requests
+    items = iter(await prepare(ctx, n) if prepare else [None] * n)
+    latencies = []
+    codes = Counter()
+
+    async def client():
+        for item in items: # Shared by all the clients, each takes the next item
+            method, url, kwargs = build(ctx, item)
+            start = time.perf_counter()
+            try:
+                response = await ctx.client.request(method, url, **kwargs)
+                codes[str(response.status_code)] += 1
+            except Exception as e:
+                codes[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return route_result(latencies, codes, time.perf_counter() - start)
+
+def route_result(latencies: list, codes: Counter, elapsed: float):
+    """The metrics `compare` checks, of requests that took `elapsed` seconds in all."""
+    latencies = sorted(latencies)
+    n = len(latencies)
+    errors = sum(count for code, count in codes.items() if not code.startswith(('2', '3')))
+    return {
+        'requests': n,
+        'errors': errors,
+        'error_rate': errors / n,
+        'status': dict(codes),
+        'throughput_rps': n / elapsed,
+        'mean_ms': sum(latencies) / n * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+async def run(args, db):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        ctx = Context(client, db, random.Random(args.seed))
+        await ctx.setup(args.accounts)
+
+        served = {
+            f'{method.upper()} {path}'
+            for path, methods in (await client.get('/openapi.json')).json()['paths'].items()
+            for method in methods
+        }
+        for route in sorted(served - set(SCENARIOS)):
+            print(f"No scenario for {route}, it is not measured", file=sys.stderr)
+
+        routes = [route for route in SCENARIOS if not args.routes or route in args.routes]
+        results = {}
+        for route in routes:
+            results[route] = await run_route(ctx, route, args.requests, args.concurrency)
+            r = results[route]
+            print(f"{route:60} {r['throughput_rps']:8.1f} req/s  p50 {r['p50_ms']:7.1f}  p95 {r['p95_ms']:7.1f}  p99 {r['p99_ms']:7.1f} ms  errors {r['errors']}", file=sys.stderr)
+    return {
+        'meta': {
+            'commit': build_info()['sha'],
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'url': args.url,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'documents': {name: await db[name].estimated_document_count() for name in ['users', 'company', 'opportunities', 'applications']},
+        },
+        'routes': results,
+    }
+
+async def mixed(args, db):
+    """
+    Half of `--concurrency` clients list opportunities and the other half log
+    in, all at once for `--seconds`, so a slow listing that blocked the event
+    loop would show up in the latency of the logins and the other way round.
+    """
+    import httpx
+
+    users = await db.users.count_documents({})
+    first_candidate = 2 * await db.company.count_documents({})
+    rng = random.Random(args.seed)
+    routes = {
+        'GET /opportunities': lambda: ('GET', '/opportunities', {'params': {'limit': 50, 'location': rng.choice(CITIES)}}),
+        'POST /token': lambda: ('POST', '/token', {'data': {'username': username(rng.randrange(first_candidate, users)), 'password': PASSWORD}}),
+    }
+    measured = {route: ([], Counter()) for route in routes}
+
+    async def client(route: str, until: float):
+        latencies, codes = measured[route]
+        while time.perf_counter() < until:
+            method, url, kwargs = routes[route]()
+            start = time.perf_counter()
+            try:
+                response = await http.request(method, url, **kwargs)
+                codes[str(response.status_code)] += 1
+            except Exception as e:
+                codes[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(list(routes)[i % len(routes)], start + args.seconds) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    results = {route: route_result(*measured[route], elapsed) for route in routes if measured[route][0]}
+    for route, r in results.items():
+        print(f"{route:20} {r['throughput_rps']:8.1f} req/s  p50 {r['p50_ms']:7.1f}  p99 {r['p99_ms']:7.1f} ms  errors {r['errors']}", file=sys.stderr)
+    return {
+        'meta': {
+            'commit': build_info()['sha'],
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'url': args.url,
+            'mode': 'mixed',
+            'seconds': args.seconds,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'routes': results,
+    }
+
+async def race(args, db):
+    """
+    Send the same application `--parallel` times at once, every other one with the same
+    Idempotency-Key. Passes if all of them got the one application that was stored, or
+    a 409 because the keyed request was still running.
+    """
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        ctx = Context(client, db, random.Random(args.seed))
+        name, headers = await ctx.new_user()
+        opportunity_id = str((await db.opportunities.find_one({}, {'_id': 1}))['_id'])
+        body = make_application(ctx.rng, f'{name}@bench.example', opportunity_id)
+        keyed = {**headers, 'Idempotency-Key': uuid.uuid4().hex}
+        responses = await asyncio.gather(*(
+            client.post(f'/opportunities/{opportunity_id}/apply', json=body, headers=keyed if i % 2 else headers)
+            for i in range(args.parallel)
+        ))
+    statuses = Counter(response.status_code for response in responses)
+    application_ids = {response.json()['application_id'] for response in responses if response.status_code == 200}
+    stored = await db.applications.count_documents({'opportunity_id': opportunity_id, 'candidate_email': f'{name}@bench.example'})
+    print(json.dumps({'statuses': statuses, 'application_ids': len(application_ids), 'stored': stored}))
+    return 0 if stored == 1 and len(application_ids) == 1 and set(statuses) <= {200, 409} else 1
+
+def summary(latencies: list, codes: Counter):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'status': dict(codes)}
+    return {
+        'requests': len(latencies),
+        'status': dict(codes),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+async def attack(args, db):
+    """
+    Measure `--users` seeded users logging in every `--login-interval` seconds and
+    reading their resume and the listings in between, for `--seconds`. First alone,
+    then alongside `--attackers` clients trying wrong passwords for any seeded
+    username, and one client per measured user trying wrong passwords for that
+    user, all from rotating addresses.
+    """
+    import httpx
+
+    users = await db.users.estimated_document_count()
+    rng = random.Random(args.seed)
+    legit = [username(i) for i in rng.sample(range(users), args.users)]
+    targets = [username(i) for i in range(users)]
+
+    async def timed(client, record, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            code = str(response.status_code)
+        except Exception as e:
+            response, code = None, type(e).__name__
+        record[0].append(time.perf_counter() - start)
+        record[1][code] += 1
+        return response
+
+    async def user(client, i: int, name: str, until: float, logins, reads):
+        forwarded = {'X-Forwarded-For': f'192.168.{i // 250}.{i % 250 + 1}'}
+        while time.perf_counter() < until:
+            next_login = time.perf_counter() + args.login_interval
+            response = await timed(client, logins, 'POST', '/token', data={'username': name, 'password': PASSWORD}, headers=forwarded)
+            if response is None or response.status_code != 200:
+                await asyncio.sleep(max(0, next_login - time.perf_counter()))
+                continue
+            headers = {**forwarded, 'Authorization': f'Bearer {response.json()["access_token"]}'}
+            while time.perf_counter() < min(next_login, until):
+                await timed(client, reads, 'GET', '/resume', headers=headers)
+                await timed(client, reads, 'GET', '/opportunities', params={'limit': 20}, headers=forwarded)
+
+    async def guess(client, attempts, name: str):
+        forwarded = {'X-Forwarded-For': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'}
+        await timed(client, attempts, 'POST', '/token', data={'username': name, 'password': uuid.uuid4().hex}, headers=forwarded)
+
+    async def attacker(client, until: float, attempts):
+        while time.perf_counter() < until:
+            await guess(client, attempts, rng.choice(targets))
+
+    async def victim_attacker(client, name: str, until: float, attempts):
+        while time.perf_counter() < until:
+            await asyncio.sleep(60 / args.victim_rate)
+            await guess(client, attempts, name)
+
+    async def phase(client, attackers: int):
+        until = time.perf_counter() + args.seconds
+        logins, reads, attempts = ([], Counter()), ([], Counter()), ([], Counter())
+        await asyncio.gather(
+            *(user(client, i, name, until, logins, reads) for i, name in enumerate(legit)),
+            *(attacker(client, until, attempts) for _ in range(attackers)),
+            *(victim_attacker(client, name, until, attempts) for name in legit if attackers),
+        )
+        result = {'logins': summary(*logins), 'reads': summary(*reads)}
+        if attackers:
+            result['attack'] = {**summary(*attempts), 'rps': len(attempts[0]) / args.seconds}
+        return result
+
+    limits = httpx.Limits(max_connections=args.users + args.attackers)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        baseline = await phase(client, 0)
+        attacked = await phase(client, args.attackers)
+    print(json.dumps({'baseline': baseline, 'attacked': attacked}, indent=2))
+
+    failures = []
+    login_status = attacked['logins']['status']
+    for code in ('429', '401'):
+        if code in login_status:
+            failures.append(f"{login_status[code]} correct logins of attacked users got a {code}")
+    succeeded = login_status.get('200', 0) / max(1, attacked['logins']['requests'])
+    if succeeded < args.min_login_success:
+        failures.append(f"only {succeeded:.0%} of the attacked users' logins succeeded")
+    if 'p99_ms' in baseline['reads'] and attacked['reads'].get('p99_ms', float('inf')) > baseline['reads']['p99_ms'] * (1 + args.tolerance):
+        failures.append(f"read p99 went from {baseline['reads']['p99_ms']:.1f} to {attacked['reads'].get('p99_ms', float('inf')):.1f} ms")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+async def resume_patch(args, db):
+    """
+    Change one skill of a fresh account's `--entries` resume `--requests` times
+    with PUT /resume, sending the whole resume, then as many times with a
+    one-operation PATCH /resume.
+    """
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        ctx = Context(client, db, random.Random(args.seed))
+        name = ctx.unique('bench-resume')
+        resume = make_large_resume(ctx.rng, name, args.entries)
+        (await client.post('/register', json={'username': name, 'password': PASSWORD, 'resume': resume})).raise_for_status()
+        headers = await ctx.login(name)
+
+        def put(i: int):
+            resume['skills'][i % args.entries] = make_skill(ctx.rng)
+            return client.put('/resume', json=resume, headers=headers)
+
+        def patch(i: int):
+            return client.patch('/resume', json=[
+                {'op': 'replace', 'path': f'/skills/{i % args.entries}', 'value': make_skill(ctx.rng)},
+            ], headers=headers)
+
+        results = {}
+        for method, send in (('PUT', put), ('PATCH', patch)):
+            latencies, codes, sent = [], Counter(), 0
+            for i in range(args.requests):
+                start = time.perf_counter()
+                response = await send(i)
+                latencies.append(time.perf_counter() - start)
+                codes[str(response.status_code)] += 1
+                sent += len(response.request.content)
+            results[method] = {**summary(latencies, codes), 'request_bytes': sent / args.requests}
+        document = await db.users.find_one({'username': name}, {'resume': 1})
+    print(json.dumps({'entries': args.entries, 'resume_bytes': len(json.dumps(document['resume'], default=str)), **results}, indent=2))
+    return 0 if all(set(r['status']) == {'200'} for r in results.values()) else 1
+
+async def server_requests(db):
+    """Requests the mongod has received so far, None if serverStatus is not allowed."""
+    from pymongo.errors import OperationFailure
+
+    try:
+        return (await db.client.admin.command('serverStatus'))['network']['numRequests']
+    except OperationFailure:
+        return None
+
+async def bulk(args, db):
+    """
+    For each kind of batch write, send `--items` items as that many single
+    requests, then as one bulk request, `--rounds` times, and count the HTTP
+    requests and the requests the mongod received per item.
+    """
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        ctx = Context(client, db, random.Random(args.seed))
+        headers = await ctx.login(username(0)) # Founder of the first company
+        company = await db.company.find_one({'handle': company_handle(0)}, {'_id': 0})
+        # The company's opportunity with the most applications
+        opportunity_id, applications = None, []
+        async for doc in db.opportunities.find({'company.handle': company['handle']}, {'_id': 1}):
+            ids = [str(a['_id']) async for a in db.applications.find({'opportunity_id': str(doc['_id'])}, {'_id': 1}).limit(args.items)]
+            if len(ids) > len(applications):
+                opportunity_id, applications = str(doc['_id']), ids
+        created = []
+
+        def statuses(ids: list):
+            return [{'application_id': i, 'status': ctx.rng.choice(['shortlisted', 'rejected', 'applied'])} for i in ids]
+
+        # operation -> (send the items one request each, send them in one request), each returning its responses
+        operations = {
+            'create opportunities': (
+                lambda n: [client.post('/opportunities', json=make_opportunity(ctx.rng, company), headers=headers) for _ in range(n)],
+                lambda n: [client.post('/opportunities/bulk', json=[make_opportunity(ctx.rng, company) for _ in range(n)], headers=headers)],
+            ),
+            'update opportunities': (
+                lambda n: [client.put(f'/opportunities/{i}', json=make_opportunity(ctx.rng, company), headers=headers) for i in created[:n]],
+                lambda n: [client.put('/opportunities/bulk', json=[
+                    {'id': i, 'opportunity': make_opportunity(ctx.rng, company)} for i in created[:n]
+                ], headers=headers)],
+            ),
+            'change application statuses': (
+                lambda n: [client.put(f'/opportunities/{opportunity_id}/applications/status', json=statuses([i]), headers=headers) for i in applications[:n]],
+                lambda n: [client.put(f'/opportunities/{opportunity_id}/applications/status', json=statuses(applications[:n]), headers=headers)],
+            ),
+        }
+        response = await client.post('/opportunities/bulk', json=[make_opportunity(ctx.rng, company) for _ in range(args.items)], headers=headers)
+        response.raise_for_status()
+        created = [item['id'] for item in response.json()]
+
+        results, failed = {}, 0
+        for operation, modes in operations.items():
+            items = len(applications) if operation == 'change application statuses' else args.items
+            if not items:
+                continue
+            results[operation] = {}
+            for mode, send in zip(('single', 'bulk'), modes):
+                requests, elapsed, before = 0, 0.0, await server_requests(db)
+                for _ in range(args.rounds):
+                    start = time.perf_counter()
+                    for request in send(items): # One after the other, as a client without batching would
+                        response = await request
+                        requests += 1
+                        results_of_items = response.json() if response.status_code == 200 else None
+                        if results_of_items is None or (isinstance(results_of_items, list) and not all(item['ok'] for item in results_of_items)):
+                            failed += 1
+                    elapsed += time.perf_counter() - start
+                after = await server_requests(db)
+                total = items * args.rounds
+                results[operation][mode] = {
+                    'http_requests_per_item': requests / total,
+                    # Less the serverStatus that read `after`
+                    'mongo_requests_per_item': (after - before - 1) / total if before is not None else None,
+                    'ms_per_item': elapsed / total * 1000,
+                }
+    print(json.dumps({'items': args.items, 'rounds': args.rounds, 'operations': results}, indent=2))
+    return 1 if failed else 0
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Regressions of `results` against `baseline`, as (route, what, baseline value, new value)."""
+    regressions = []
+    for route, base in baseline['routes'].items():
+        new = results['routes'].get(route)
+        if new is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if new[metric] > base[metric] * (1 + tolerance):
+                regressions.append((route, metric, base[metric], new[metric]))
+        if new['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append((route, 'throughput_rps', base['throughput_rps'], new['throughput_rps']))
+        if new['error_rate'] > base['error_rate'] + 0.01:
+            regressions.append((route, 'error_rate', base['error_rate'], new['error_rate']))
+    return regressions
+
+async def main():
+    from pymongo import AsyncMongoClient
+
+    parser = argparse.ArgumentParser(description="Seed synthetic data, load test every route, and compare runs.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    seeding = commands.add_parser('seed', help="Fill the database with synthetic data")
+    seeding.add_argument('--scale', type=int, default=1000, help="Users to create, other collections are sized from it (1k to 1M)")
+    seeding.add_argument('--seed', type=int, default=1)
+    seeding.add_argument('--drop', action='store_true', help="Drop the app's collections first")
+    running = commands.add_parser('run', help="Drive every route and write the results as JSON")
+    running.add_argument('--url', default='http://localhost:8000')
+    running.add_argument('--requests', type=int, default=1000, help="Requests per route")
+    running.add_argument('--concurrency', type=int, default=16)
+    running.add_argument('--accounts', type=int, default=20, help="Seeded candidates and founders to log in as")
+    running.add_argument('--seed', type=int, default=1)
+    running.add_argument('--routes', nargs='*', help="Only these routes, e.g. 'GET /company'")
+    running.add_argument('--out', help="Write the results here instead of stdout")
+    mixing = commands.add_parser('mixed', help="Load GET /opportunities and POST /token together and write the results as JSON")
+    mixing.add_argument('--url', default='http://localhost:8000')
+    mixing.add_argument('--seconds', type=float, default=30)
+    mixing.add_argument('--concurrency', type=int, default=128, help="Concurrent clients, split between the two routes")
+    mixing.add_argument('--seed', type=int, default=1)
+    mixing.add_argument('--out', help="Write the results here instead of stdout")
+    racing = commands.add_parser('race', help="Check that parallel duplicate applications store one application")
+    racing.add_argument('--url', default='http://localhost:8000')
+    racing.add_argument('--parallel', type=int, default=50)
+    racing.add_argument('--seed', type=int, default=1)
+    attacking = commands.add_parser('attack', help="Measure legitimate logins and reads during credential stuffing")
+    attacking.add_argument('--url', default='http://localhost:8000')
+    attacking.add_argument('--seconds', type=float, default=30, help="Length of each phase")
+    attacking.add_argument('--users', type=int, default=20, help="Seeded users logging in and reading")
+    attacking.add_argument('--login-interval', type=float, default=5, help="Seconds each user reads between logins, keep it under the per-IP rate")
+    attacking.add_argument('--attackers', type=int, default=64, help="Concurrent credential stuffing clients")
+    attacking.add_argument('--victim-rate', type=float, default=30, help="Wrong passwords per minute aimed at each measured user")
+    attacking.add_argument('--min-login-success', type=float, default=0.95, help="Share of the measured users' logins that must succeed under attack")
+    attacking.add_argument('--tolerance', type=float, default=0.5, help="Allowed relative read p99 increase under attack")
+    attacking.add_argument('--seed', type=int, default=1)
+    patching = commands.add_parser('resume-patch', help="Compare PUT and PATCH /resume on a large resume")
+    patching.add_argument('--url', default='http://localhost:8000')
+    patching.add_argument('--requests', type=int, default=200, help="Edits sent with each method")
+    patching.add_argument('--entries', type=int, default=50, help="Skills, schools and jobs on the resume")
+    patching.add_argument('--seed', type=int, default=1)
+    batching = commands.add_parser('bulk', help="Compare single and bulk opportunity and application writes")
+    batching.add_argument('--url', default='http://localhost:8000')
+    batching.add_argument('--items', type=int, default=20, help="Items per batch")
+    batching.add_argument('--rounds', type=int, default=10)
+    batching.add_argument('--seed', type=int, default=1)
+    comparing = commands.add_parser('compare', help="Exit non-zero if results regressed against a baseline")
+    comparing.add_argument('results')
+    comparing.add_argument('baseline')
+    comparing.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative change, 0.10 is 10%%")
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.results) as f, open(args.baseline) as g:
+            regressions = compare(json.load(f), json.load(g), args.tolerance)
+        for route, metric, before, after in regressions:
+            print(f"REGRESSION {route}: {metric} {before:.2f} -> {after:.2f}")
+        return 1 if regressions else 0
+
+    client = AsyncMongoClient(os.getenv('MONGODB_URI'))
+    db = client.careerhub
+    try:
+        if args.command == 'seed':
+            if args.drop:
+                for name in ['users', 'company', 'founders', 'recruiters', 'opportunities', 'applications',
+                             'jobs', 'outbox', 'versions', 'stats']:
+                    await db.drop_collection(name)
+            elif await db.users.estimated_document_count():
+                print("The database already has users, pass --drop to replace them", file=sys.stderr)
+                return 1
+            print(json.dumps(await seed(db, args.scale, args.seed)))
+            return 0
+        if args.command == 'race':
+            return await race(args, db)
+        if args.command == 'attack':
+            return await attack(args, db)
+        if args.command == 'resume-patch':
+            return await resume_patch(args, db)
+        if args.command == 'bulk':
+            return await bulk(args, db)
+
+        results = await (mixed if args.command == 'mixed' else run)(args, db)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        return 0
+    finally:
+        await client.close()
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
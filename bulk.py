@@ -0,0 +1,220 @@
+"""
+Bulk import and export of users, companies and opportunities as NDJSON.
+
+An import reads the input in chunks of `batch_size` lines. Each chunk is
+validated against its `data_class` model in a process pool, users' plain text
+passwords are hashed there too (Argon2 hashes are kept as they are), and the
+valid documents are written with one unordered `insert_many`. At most
+`max_pending` chunks are validated ahead of the inserts, so a fast reader
+waits for the database instead of filling memory. Lines that fail to parse,
+validate or insert (a taken username, a duplicate handle, ...) are reported
+by line number and the rest of the file goes on.
+
+An export streams a collection out through a cursor, one document per line,
+in the same shape an import takes.
+
+    python bulk.py import users users.ndjson --workers 4
+    python bulk.py export opportunities -o opportunities.ndjson
+
+Admins (`ADMIN_USERNAMES`) can do the same over HTTP with
+`POST /admin/import/{kind}` and `GET /admin/export/{kind}`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from data_class import Company, Opportunity, UserData
+from serialization import DocumentEncoder, to_document
+import argparse
+import asyncio
+import orjson
+import os
+import sys
+import time
+
+# kind -> (collection, model, query of the documents an export includes)
+KINDS = {
+    'users': ('users', UserData, {'tombstoned_at': None}),
+    'companies': ('company', Company, {'tombstoned_at': None}),
+    'opportunities': ('opportunities', Opportunity, {}),
+}
+
+MAX_REPORTED_ERRORS = 1000
+
+_hasher = None # Per pool process
+
+def hash_password(password: str) -> str:
+    global _hasher
+    if password.startswith('$argon2'):
+        return password
+    if _hasher is None:
+        from hashing import make_hasher
+        _hasher = make_hasher()
+    return _hasher.hash(password)
+
+def validate_chunk(kind: str, lines: list):
+    """
+    Run in the pool: validate (line number, raw line) pairs into documents.
+    Returns ([(line number, document)], [(line number, error)]).
+    """
+    model = KINDS[kind][1]
+    documents = []
+    errors = []
+    for number, line in lines:
+        try:
+            item = model.model_validate(orjson.loads(line))
+        except orjson.JSONDecodeError as e:
+            errors.append((number, f"Invalid JSON: {e}"))
+            continue
+        except ValidationError as e:
+            errors.append((number, '; '.join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())))
+            continue
+        if kind == 'users':
+            item.password = hash_password(item.password)
+        documents.append((number, to_document(item)))
+    return documents, errors
+
+class ImportReport:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = [] # (line number, error), the first MAX_REPORTED_ERRORS of them
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def fail(self, number: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((number, error))
+
+    def as_dict(self):
+        return {
+            'read': self.read,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': [{'line': number, 'error': error} for number, error in sorted(self.errors)],
+            'seconds': round(self.seconds, 3),
+            'records_per_second': round(self.read / self.seconds, 1) if self.seconds else 0,
+        }
+
+class Importer:
+    def __init__(self, db, kind: str, executor: ProcessPoolExecutor, batch_size: int = 1000, max_pending: int = 4, on_inserted=None):
+        """`await on_inserted(documents)` is called with each written batch, e.g. to index them."""
+        self.collection = db[KINDS[kind][0]]
+        self.kind = kind
+        self.executor = executor
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.on_inserted = on_inserted
+
+    async def run(self, lines) -> ImportReport:
+        """Import an async iterable of NDJSON lines (bytes)."""
+        report = ImportReport()
+        loop = asyncio.get_running_loop()
+        pending = deque() # Chunks being validated, inserted in order
+        chunk = []
+        number = 0
+        async for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            report.read += 1
+            chunk.append((number, line))
+            if len(chunk) == self.batch_size:
+                pending.append(loop.run_in_executor(self.executor, validate_chunk, self.kind, chunk))
+                chunk = []
+                if len(pending) >= self.max_pending:
+                    await self.insert(await pending.popleft(), report)
+        if chunk:
+            pending.append(loop.run_in_executor(self.executor, validate_chunk, self.kind, chunk))
+        while pending:
+            await self.insert(await pending.popleft(), report)
+        report.seconds = time.perf_counter() - report.started
+        return report
+
+    async def insert(self, validated, report: ImportReport):
+        documents, errors = validated
+        for number, error in errors:
+            report.fail(number, error)
+        if not documents:
+            return
+        failed = set()
+        try:
+            await self.collection.insert_many([document for _, document in documents], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details['writeErrors']:
+                failed.add(error['index'])
+                report.fail(documents[error['index']][0], error['errmsg'])
+        report.inserted += len(documents) - len(failed)
+        if self.on_inserted:
+            await self.on_inserted([document for index, (_, document) in enumerate(documents) if index not in failed])
+
+async def export_lines(db, kind: str, batch_size: int = 1000):
+    """The documents of `kind` as NDJSON lines, read through a cursor."""
+    collection, model, query = KINDS[kind]
+    encoder = DocumentEncoder(model)
+    async for doc in db[collection].find(query, encoder.projection).sort('_id', 1).batch_size(batch_size):
+        yield encoder.line(doc)
+
+async def split_lines(chunks):
+    """Lines out of a stream of byte chunks, e.g. a request body."""
+    rest = b''
+    async for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+async def file_lines(path: str):
+    with (sys.stdin.buffer if path == '-' else open(path, 'rb')) as f:
+        for line in f:
+            yield line
+
+async def main():
+    from pymongo import AsyncMongoClient
+    from cache import CacheSync
+    from stats import Stats
+
+    parser = argparse.ArgumentParser(description="Import or export users, companies and opportunities as NDJSON.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    importing = commands.add_parser('import', help="Insert the records of an NDJSON file ('-' for stdin)")
+    importing.add_argument('kind', choices=KINDS)
+    importing.add_argument('path')
+    importing.add_argument('--batch-size', type=int, default=1000)
+    importing.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Validation processes")
+    exporting = commands.add_parser('export', help="Write a collection as NDJSON")
+    exporting.add_argument('kind', choices=KINDS)
+    exporting.add_argument('-o', '--output', default='-')
+    args = parser.parse_args()
+
+    client = AsyncMongoClient(os.getenv('MONGODB_URI'))
+    db = client.careerhub
+    status = 0
+    if args.command == 'import':
+        with ProcessPoolExecutor(args.workers) as executor:
+            on_inserted = Stats(db.stats).opportunities_added if args.kind == 'opportunities' else None
+            importer = Importer(db, args.kind, executor, args.batch_size, max_pending=args.workers * 2, on_inserted=on_inserted)
+            report = await importer.run(file_lines(args.path))
+        if args.kind == 'companies':
+            await CacheSync(db.versions).bump('company') # Running workers drop their cached listing
+        for number, error in report.errors:
+            print(f"line {number}: {error}", file=sys.stderr)
+        print(orjson.dumps({key: value for key, value in report.as_dict().items() if key != 'errors'}).decode())
+        status = 1 if report.failed else 0
+    else:
+        start = time.perf_counter()
+        count = 0
+        with (sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')) as out:
+            async for line in export_lines(db, args.kind):
+                out.write(line)
+                count += 1
+        seconds = time.perf_counter() - start
+        print(f"Exported {count} {args.kind} in {seconds:.1f}s, {count / seconds if seconds else 0:.0f} records/s", file=sys.stderr)
+    await client.close()
+    return status
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,117 @@
+"""
+Small in-process caches, and `CacheSync` to keep them coherent across workers.
+"""
+from collections import OrderedDict, defaultdict
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    LRU cache with a per-entry TTL.
+    Not shared between workers, so entries must be invalidated by whoever writes them.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0 # Bumped by every invalidation, see get_or_load
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key, load):
+        """
+        Read-through get: on a miss, await `load()` and cache what it returns.
+        A result loaded while the cache was invalidated may predate the write that
+        invalidated it, so it is returned but not cached. None is never cached.
+        """
+        value = self.get(key)
+        if value is None:
+            generation = self.generation
+            value = await load()
+            if value is not None and generation == self.generation:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+class CacheSync:
+    """
+    Clears caches in every worker when the data behind them changes.
+
+    Writers call `bump(name)`, which increments the `name` counter in the
+    `versions` collection and clears this worker's caches registered under it
+    right away. Every worker polls the counters each `interval` seconds and
+    clears the caches of those that moved, so other workers serve stale entries
+    for at most one interval (plus the time a poll takes).
+    """
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.caches = defaultdict(list)
+        self.seen = {}
+
+    def register(self, name: str, *caches: TTLCache):
+        self.caches[name].extend(caches)
+
+    def clear(self, name: str):
+        for cache in self.caches[name]:
+            cache.clear()
+
+    async def bump(self, *names: str):
+        for name in names:
+            await self.collection.update_one({'_id': name}, {'$inc': {'version': 1}}, upsert=True)
+            self.clear(name)
+
+    async def poll(self):
+        async for doc in self.collection.find({'_id': {'$in': list(self.caches)}}):
+            if self.seen.get(doc['_id'], 0) != doc['version']:
+                self.seen[doc['_id']] = doc['version']
+                self.clear(doc['_id'])
+
+    async def run_forever(self, interval: float):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                # Can't tell what changed, so nothing cached can be trusted
+                logger.error("Cache sync failed: %s", e)
+                for name in self.caches:
+                    self.clear(name)
+            await asyncio.sleep(interval)
@@ -0,0 +1,69 @@
+"""
+ETags and conditional GETs for the public read routes.
+
+Documents those routes serve carry a version stamp that every write route
+bumps: `version` on companies and opportunities, `resume_version` on users.
+The ETag is the document's `_id` and stamp, so when a request's
+If-None-Match still matches, the 304 is answered after reading only those
+two fields. The company listing is stamped as a whole, by the `company`
+counter in the `versions` collection that CacheSync bumps whenever a company
+is added or removed.
+"""
+from fastapi import Request, Response, status
+
+# Cache-Control per route. Details can be reused for a little while, the
+# resume is revalidated every time since its owner expects edits to show.
+CACHE_CONTROL = {
+    'company_list': 'public, max-age=30',
+    'company': 'public, max-age=60',
+    'resume': 'public, no-cache',
+    'opportunity': 'public, max-age=30',
+}
+
+def document_etag(doc: dict, stamp: str = 'version') -> str:
+    return f'"{doc["_id"]}.{doc.get(stamp, 0)}"'
+
+def if_none_match(request: Request):
+    """The entity tags of the If-None-Match header, None without one."""
+    header = request.headers.get('if-none-match')
+    if header is None:
+        return None
+    return {tag.strip().removeprefix('W/') for tag in header.split(',')}
+
+def matches(request: Request, etag: str) -> bool:
+    tags = if_none_match(request)
+    return bool(tags) and ('*' in tags or etag in tags)
+
+def not_modified(etag: str, policy: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL[policy]})
+
+def with_validators(response: Response, etag: str, policy: str) -> Response:
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = CACHE_CONTROL[policy]
+    return response
+
+async def check_not_modified(request: Request, collection, query: dict, policy: str, stamp: str = 'version'):
+    """A 304 response if the client's copy of the document matching `query` is current, else None."""
+    if not if_none_match(request):
+        return None
+    doc = await collection.find_one(query, {stamp: 1})
+    if doc and matches(request, document_etag(doc, stamp)):
+        return not_modified(document_etag(doc, stamp), policy)
+    return None
+
+async def collection_etag(versions, name: str) -> str:
+    doc = await versions.find_one({'_id': name})
+    return f'"{name}.{doc["version"] if doc else 0}"'
+
+def bump_if_changed(pipeline: list, field: str, stamp: str) -> list:
+    """
+    Wrap update pipeline stages so they also increment `stamp`, but only if
+    they changed `field`. A no-op update stays a no-op (modified_count 0).
+    """
+    current = {'$ifNull': ['$' + stamp, 0]}
+    return [
+        {'$set': {'_before': '$' + field}},
+        *pipeline,
+        {'$set': {stamp: {'$cond': [{'$eq': ['$' + field, '$_before']}, current, {'$add': [current, 1]}]}}},
+        {'$project': {'_before': 0}},
+    ]
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, HttpUrl, Field, validator
-from typing import List, Dict, Optional, Annotated, Literal
+from pydantic import BaseModel, EmailStr, HttpUrl, Field, PrivateAttr, validator
+from typing import Any, List, Dict, Optional, Annotated, Literal
 from datetime import datetime
 
 class SocialProfiles(BaseModel):
@@ -100,6 +100,15 @@ class UserData(BaseModel):
     resume: Resume
     username: str
     password: str
+    # Set from the database and the access token, never from request bodies
+    _roles_version: int = PrivateAttr(default=0)
+    _recruiter_of: List[str] = PrivateAttr(default_factory=list)
+    _founder_of: List[str] = PrivateAttr(default_factory=list)
+
+class ResumePatchOperation(BaseModel):
+    op: Literal['add', 'replace', 'remove']
+    path: str # JSON Pointer into the resume, e.g. /skills/- or /basic/summary
+    value: Any = None
 
 class LoginData(BaseModel):
     email: EmailStr
@@ -164,10 +173,74 @@ class OpportunityWithID(Opportunity):
     class Config:
         orm_mode = True
 
+class OpportunitySearchResult(BaseModel):
+    score: float
+    opportunity: OpportunityWithID
+
+ApplicationStatus = Literal['applied', 'shortlisted', 'rejected', 'hired']
+
 class CandidateApplication(BaseModel):
     candidate_email: EmailStr
     opportunity_id: str
     cover_letter: str
+    status: ApplicationStatus = 'applied'
+
+class ApplicantProfile(BaseModel):
+    # The parts of an applicant's resume a recruiter reviews
+    username: str
+    basic: BasicInfo
+    working_at: Optional[CurrentJob] = None
+    education: List[Education]
+    skills: List[Skill]
+    work: Optional[List[Experience]] = None
+
+class ReviewedApplication(BaseModel):
+    id: str
+    candidate_email: EmailStr
+    cover_letter: str
+    status: ApplicationStatus = 'applied'
+    applicant: Optional[ApplicantProfile] = None # None once the applicant unregistered
+
+class OpportunityUpdate(BaseModel):
+    id: str
+    opportunity: Opportunity
+
+class ApplicationStatusChange(BaseModel):
+    application_id: str
+    status: ApplicationStatus
+
+class BulkItemResult(BaseModel):
+    index: int # Position of the item in the request
+    id: Optional[str] = None
+    ok: bool
+    error: Optional[str] = None
+
+class RankedApplication(BaseModel):
+    application: CandidateApplication
+    score: float
+    breakdown: Dict[str, float] # Score per feature group: skills, education, experience
+
+class CompanyStats(BaseModel):
+    company_handle: str
+    opportunities: int
+    open_opportunities: int # Application deadline still ahead
+    applications: int
+    applications_per_day: Dict[str, int] # UTC day (YYYY-MM-DD) -> applications made that day
+
+class OpportunityStats(BaseModel):
+    opportunity_id: str
+    applications: int
+    applications_per_day: Dict[str, int]
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: Literal['pending', 'running', 'done', 'failed']
+    step: int
+    progress: Dict[str, int] # Documents deleted so far, per collection
+    created_at: datetime
+    updated_at: datetime
+    error: Optional[str] = None
 
 class UnregisterCompanyRequest(BaseModel):
     company_handle: str
@@ -0,0 +1,159 @@
+"""
+The Mongo client: connection pool settings, and where each kind of route reads.
+
+Pool sizes and timeouts come from `MONGO_*` environment variables, see
+`client_options`; unset ones keep the driver's defaults (100 connections per
+server, no minimum, waiting on a busy pool until the server selection timeout).
+The URI's own options (`?maxPoolSize=...`) are overridden by these.
+
+Routes read through one of two handles on the same client and pool:
+
+- `db`, on the primary: authentication, every write, and reads whose result
+  decides a write (e.g. whether a handle is taken) or must see the caller's
+  own last write.
+- `public_db`, for the anonymous read routes (`/opportunities`, a single
+  opportunity, `/resume/{username}`, streamed recruiter listings). Its read
+  preference is `MONGO_PUBLIC_READ_PREFERENCE`, so on a replica set these can
+  be served by secondaries, and `MONGO_MAX_STALENESS_SECONDS` keeps them away
+  from secondaries lagging more than that behind. With the default,
+  `primary`, both handles are the same.
+
+The company routes stay on the primary. What they load into the in-process
+caches would outlive the change that cleared it if it came from a lagging
+secondary. The streamed company listing reads its ETag and its documents in
+two operations, which could be sent to different members, so a stale listing
+could go out under the new ETag.
+
+A secondary may not have a write yet, so a client may briefly not see what it
+just posted on the public routes. The ETag of a single opportunity or resume
+is taken from the document that was read, so it always matches the body.
+
+    python database.py --public-reads secondaryPreferred --max-staleness 90
+
+prints the effective options, the replica set members, and which member a
+primary and a public read were sent to, to check a setup against a local
+replica set.
+"""
+from pymongo import AsyncMongoClient, monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+import argparse
+import asyncio
+import orjson
+import os
+import sys
+
+# Environment variable -> client option, all integers
+POOL_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_CONNECTING': 'maxConnecting',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGO_TIMEOUT_MS': 'timeoutMS',
+}
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# The smallest bound the servers accept
+MIN_MAX_STALENESS_SECONDS = 90
+
+def client_options(environ=os.environ) -> dict:
+    """The pool and timeout options set in the environment."""
+    options = {}
+    for name, option in POOL_OPTIONS.items():
+        value = environ.get(name)
+        if value:
+            try:
+                options[option] = int(value)
+            except ValueError:
+                raise ValueError(f"{name} must be an integer, got {value!r}") from None
+    return options
+
+def read_preference(mode: str, max_staleness: float | None = None):
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}, expected one of: {', '.join(READ_PREFERENCES)}")
+    if mode == 'primary':
+        if max_staleness is not None:
+            raise ValueError("A max staleness can't be set on primary reads")
+        return Primary()
+    if max_staleness is None:
+        return READ_PREFERENCES[mode]()
+    if max_staleness < MIN_MAX_STALENESS_SECONDS:
+        raise ValueError(f"Max staleness must be at least {MIN_MAX_STALENESS_SECONDS} seconds, got {max_staleness:g}")
+    return READ_PREFERENCES[mode](max_staleness=int(max_staleness))
+
+def public_read_preference(environ=os.environ):
+    max_staleness = environ.get('MONGO_MAX_STALENESS_SECONDS')
+    return read_preference(environ.get('MONGO_PUBLIC_READ_PREFERENCE', 'primary'), float(max_staleness) if max_staleness else None)
+
+def connect(event_listeners=(), environ=os.environ) -> AsyncMongoClient:
+    return AsyncMongoClient(environ.get('MONGODB_URI'), event_listeners=list(event_listeners), **client_options(environ))
+
+def public_reads(db, preference):
+    """`db` reading with `preference`, sharing its client and pool."""
+    if isinstance(preference, Primary):
+        return db
+    return db.with_options(read_preference=preference)
+
+class ServerRecorder(monitoring.CommandListener):
+    """Which server each command went to, by command name."""
+    def __init__(self):
+        self.servers = {}
+
+    def started(self, event):
+        self.servers[event.command_name] = '%s:%s' % event.connection_id
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+async def main():
+    parser = argparse.ArgumentParser(description="Show the Mongo client options and where primary and public reads go.")
+    parser.add_argument('--public-reads', help="Read preference of the public routes (default: MONGO_PUBLIC_READ_PREFERENCE)")
+    parser.add_argument('--max-staleness', type=float, help="Max staleness in seconds (default: MONGO_MAX_STALENESS_SECONDS)")
+    args = parser.parse_args()
+
+    environ = dict(os.environ)
+    if args.public_reads:
+        environ['MONGO_PUBLIC_READ_PREFERENCE'] = args.public_reads
+    if args.max_staleness is not None:
+        environ['MONGO_MAX_STALENESS_SECONDS'] = str(args.max_staleness)
+    preference = public_read_preference(environ)
+
+    recorder = ServerRecorder()
+    client = connect([recorder], environ)
+    db = client.careerhub
+    try:
+        hello = await client.admin.command('hello')
+        await db.opportunities.find_one({}, {'_id': 1})
+        primary_server = recorder.servers.get('find')
+        await public_reads(db, preference).opportunities.find_one({}, {'_id': 1})
+        public_server = recorder.servers.get('find')
+    finally:
+        await client.close()
+
+    print(orjson.dumps({
+        'options': client_options(environ),
+        'public_read_preference': preference.document,
+        'replica_set': hello.get('setName'),
+        'primary': hello.get('primary'),
+        'secondaries': [host for host in hello.get('hosts', []) if host != hello.get('primary')],
+        'primary_read_server': primary_server,
+        'public_read_server': public_server,
+    }, option=orjson.OPT_INDENT_2).decode())
+    if preference.mode and not hello.get('setName'):
+        print("Not a replica set, public reads go to the only server.", file=sys.stderr)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+"""
+Outbox-backed email delivery.
+
+Routes never talk to SMTP. They append messages to the `outbox` collection
+with `Outbox.enqueue`, which costs one insert. A background worker drains the
+outbox in batches, sends each batch over a single SMTP connection, and retries
+failed messages with exponential backoff. Several workers can drain the same
+outbox: a batch is claimed before it is sent, and claims of a worker that died
+expire after OUTBOX_LEASE_SECONDS.
+
+Configured with SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+SMTP_STARTTLS and MAIL_FROM. Without SMTP_HOST messages are queued but not sent.
+"""
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from pymongo import UpdateOne
+import asyncio
+import logging
+import os
+import smtplib
+import uuid
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 30 # Doubles with each failed attempt
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+
+def smtp_settings():
+    return {
+        'host': os.getenv('SMTP_HOST'),
+        'port': int(os.getenv('SMTP_PORT', 25)),
+        'username': os.getenv('SMTP_USERNAME'),
+        'password': os.getenv('SMTP_PASSWORD'),
+        'starttls': os.getenv('SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes'),
+        'sender': os.getenv('MAIL_FROM', 'noreply@careerhub.local'),
+    }
+
+def send_batch(settings: dict, messages: list) -> dict:
+    """
+    Send outbox documents over one SMTP connection. Blocking, run it in a thread.
+    Returns {outbox id: error message} for the messages that were not sent.
+    """
+    errors = {}
+    sent = set()
+    try:
+        with smtplib.SMTP(settings['host'], settings['port'], timeout=30) as smtp:
+            if settings['starttls']:
+                smtp.starttls()
+            if settings['username']:
+                smtp.login(settings['username'], settings['password'])
+            for message in messages:
+                email = EmailMessage()
+                email['From'] = settings['sender']
+                email['To'] = message['to']
+                email['Subject'] = message['subject']
+                email.set_content(message['body'])
+                try:
+                    smtp.send_message(email)
+                    sent.add(message['_id'])
+                except smtplib.SMTPException as e:
+                    errors[message['_id']] = str(e)
+    except (OSError, smtplib.SMTPException) as e:
+        # Connection level failure, whatever was not sent yet did not go out
+        for message in messages:
+            if message['_id'] not in sent:
+                errors.setdefault(message['_id'], str(e))
+    return errors
+
+class Outbox:
+    def __init__(self, collection, batch_size: int = 100, lease_seconds: float = 300):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.worker_id = uuid.uuid4().hex
+
+    async def enqueue(self, messages: list):
+        """Queue (to, subject, body) messages for delivery."""
+        if not messages:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.insert_many([
+            {
+                'to': to,
+                'subject': subject,
+                'body': body,
+                'status': 'pending',
+                'attempts': 0,
+                'next_attempt_at': now,
+                'created_at': now,
+            }
+            for to, subject, body in messages
+        ])
+
+    async def claim(self):
+        """Mark up to batch_size due messages as ours and return them."""
+        now = datetime.now(timezone.utc)
+        due = {'$or': [
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'status': 'sending', 'claimed_at': {'$lt': now - timedelta(seconds=self.lease_seconds)}},
+        ]}
+        ids = [doc['_id'] async for doc in self.collection.find(due, {'_id': 1}).limit(self.batch_size)]
+        if not ids:
+            return []
+        claim = uuid.uuid4().hex
+        # Re-check the filter, another worker may have claimed some of them meanwhile
+        await self.collection.update_many(
+            {'$and': [{'_id': {'$in': ids}}, due]},
+            {'$set': {'status': 'sending', 'claimed_by': f'{self.worker_id}:{claim}', 'claimed_at': now}}
+        )
+        return [doc async for doc in self.collection.find({'claimed_by': f'{self.worker_id}:{claim}'})]
+
+    async def deliver(self, settings: dict):
+        """Send one batch. Returns how many messages were claimed."""
+        batch = await self.claim()
+        if not batch:
+            return 0
+        errors = await asyncio.to_thread(send_batch, settings, batch)
+
+        now = datetime.now(timezone.utc)
+        updates = []
+        for message in batch:
+            if message['_id'] not in errors:
+                updates.append(UpdateOne({'_id': message['_id']}, {
+                    '$set': {'status': 'sent', 'sent_at': now},
+                    '$unset': {'claimed_by': '', 'claimed_at': ''},
+                }))
+                continue
+            attempts = message['attempts'] + 1
+            backoff = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+            updates.append(UpdateOne({'_id': message['_id']}, {
+                '$set': {
+                    'status': 'failed' if attempts >= MAX_ATTEMPTS else 'pending',
+                    'attempts': attempts,
+                    'next_attempt_at': now + timedelta(seconds=backoff),
+                    'last_error': errors[message['_id']],
+                },
+                '$unset': {'claimed_by': '', 'claimed_at': ''},
+            }))
+        await self.collection.bulk_write(updates, ordered=False)
+        if errors:
+            logger.warning("%d of %d emails failed, will retry", len(errors), len(batch))
+        return len(batch)
+
+    async def run_forever(self, poll_seconds: float):
+        settings = smtp_settings()
+        while True:
+            try:
+                # Keep draining while there is a backlog, then wait for more
+                while await self.deliver(settings) == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error("Outbox delivery failed: %s", e)
+            await asyncio.sleep(poll_seconds)
@@ -0,0 +1,119 @@
+"""
+Argon2 password hashing, kept off the event loop.
+
+Hashing and verification run on a small, dedicated thread pool (argon2-cffi
+releases the GIL while it works). The number of calls waiting on the pool is
+capped, so a login spike gets shed instead of queueing forever.
+
+Run `python hashing.py --target-ms 250` to pick PasswordHasher parameters for
+the current host.
+"""
+from argon2 import PasswordHasher
+from concurrent.futures import ThreadPoolExecutor
+from metrics import ARGON2_SECONDS
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+DEFAULT_MEMORY_COST = 65536 # KiB, same as argon2-cffi's default profile
+DEFAULT_PARALLELISM = 4
+
+class HasherBusy(Exception):
+    """Raised when too many hash/verify calls are already waiting on the pool."""
+
+def make_hasher():
+    return PasswordHasher(
+        time_cost=int(os.getenv('ARGON2_TIME_COST', 3)),
+        memory_cost=int(os.getenv('ARGON2_MEMORY_COST', DEFAULT_MEMORY_COST)),
+        parallelism=int(os.getenv('ARGON2_PARALLELISM', DEFAULT_PARALLELISM)),
+    )
+
+def timed_call(fn, *args):
+    # Timed on the worker thread, so time spent waiting for a thread is left out
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+class HasherPool:
+    def __init__(self, hasher: PasswordHasher, workers: int, max_pending: int):
+        self.hasher = hasher
+        self.max_pending = max_pending
+        self.pending = 0 # Only touched from the event loop thread
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='argon2')
+
+    async def _run(self, operation: str, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HasherBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, seconds = await loop.run_in_executor(self.executor, timed_call, fn, *args)
+        finally:
+            self.pending -= 1
+        ARGON2_SECONDS.observe((operation,), seconds)
+        return result
+
+    def _verify(self, hashed: str, password: str) -> bool:
+        try:
+            return self.hasher.verify(hashed, password)
+        except Exception:
+            return False
+
+    async def hash(self, password: str) -> str:
+        return await self._run('hash', self.hasher.hash, password)
+
+    async def verify(self, hashed: str, password: str) -> bool:
+        return await self._run('verify', self._verify, hashed, password)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return self.hasher.check_needs_rehash(hashed)
+
+ph = make_hasher()
+pool = HasherPool(
+    ph,
+    workers=int(os.getenv('ARGON2_WORKERS', min(4, os.cpu_count() or 1))),
+    max_pending=int(os.getenv('ARGON2_MAX_PENDING', 64)),
+)
+
+def time_hash(hasher: PasswordHasher, rounds: int = 5) -> float:
+    """Median time of one hash in milliseconds."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.hash('calibration-password')
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def calibrate(target_ms: float, memory_cost: int, parallelism: int):
+    """
+    Find the largest time_cost that stays within target_ms.
+    If even time_cost=1 is too slow, memory_cost is halved until it fits.
+    """
+    time_cost = 1
+    while memory_cost > 8 * parallelism:
+        took = time_hash(PasswordHasher(time_cost=1, memory_cost=memory_cost, parallelism=parallelism))
+        if took <= target_ms:
+            break
+        memory_cost //= 2
+    while True:
+        took = time_hash(PasswordHasher(time_cost=time_cost + 1, memory_cost=memory_cost, parallelism=parallelism))
+        if took > target_ms:
+            break
+        time_cost += 1
+    took = time_hash(PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism))
+    return time_cost, memory_cost, took
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pick Argon2 parameters for a target per-hash latency on this host.")
+    parser.add_argument('--target-ms', type=float, default=250)
+    parser.add_argument('--memory-cost', type=int, default=DEFAULT_MEMORY_COST, help="Starting memory cost in KiB")
+    parser.add_argument('--parallelism', type=int, default=DEFAULT_PARALLELISM)
+    args = parser.parse_args()
+
+    time_cost, memory_cost, took = calibrate(args.target_ms, args.memory_cost, args.parallelism)
+    print(f"# {took:.1f} ms per hash (target {args.target_ms:.0f} ms)")
+    print(f"ARGON2_TIME_COST={time_cost}")
+    print(f"ARGON2_MEMORY_COST={memory_cost}")
+    print(f"ARGON2_PARALLELISM={args.parallelism}")
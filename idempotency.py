@@ -0,0 +1,74 @@
+"""
+Idempotency keys for write routes that clients retry.
+
+A request sent with an `Idempotency-Key` header claims the key in the
+`idempotency_keys` collection before doing any work, the unique `_id` makes
+sure only one request gets it. The response is stored with the key, so a
+retry with the same key and body gets it back without running the route again.
+A retry with a different body is refused, as is one that arrives while the
+first is still running. A TTL index drops keys `ttl_seconds` after they were
+claimed; if the route fails the key is released right away so the client can
+retry.
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+import hashlib
+import orjson
+
+def fingerprint(body) -> str:
+    return hashlib.sha256(orjson.dumps(body, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+
+class Attempt:
+    def __init__(self, replay: dict | None = None):
+        self.replay = replay # The stored response when this is a retry
+        self.response = None # Set by the route, stored for retries
+
+class IdempotencyKeys:
+    def __init__(self, collection=None, ttl_seconds: float = 86400):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    @asynccontextmanager
+    async def attempt(self, scope: str, key: str | None, body):
+        """
+        Run a route body once per `key`. If the yielded attempt has a `replay`,
+        respond with it; otherwise do the work and set `attempt.response`.
+        Without a key every request runs.
+        """
+        if key is None:
+            yield Attempt()
+            return
+        key_id = f'{scope}:{key}'
+        digest = fingerprint(body)
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({
+                '_id': key_id,
+                'fingerprint': digest,
+                'response': None,
+                'created_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl_seconds),
+            })
+        except DuplicateKeyError:
+            claimed = await self.collection.find_one({'_id': key_id})
+            if claimed is None: # Released or expired in between
+                raise HTTPException(status.HTTP_409_CONFLICT, detail="Request with this Idempotency-Key is being retried, try again.")
+            if claimed['fingerprint'] != digest:
+                raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Idempotency-Key was already used for a different request.")
+            if claimed['response'] is None:
+                raise HTTPException(status.HTTP_409_CONFLICT, detail="Request with this Idempotency-Key is still in progress.", headers={'Retry-After': '1'})
+            yield Attempt(claimed['response'])
+            return
+
+        attempt = Attempt()
+        try:
+            yield attempt
+        except BaseException:
+            await self.collection.delete_one({'_id': key_id})
+            raise
+        if attempt.response is None:
+            await self.collection.delete_one({'_id': key_id})
+        else:
+            await self.collection.update_one({'_id': key_id}, {'$set': {'response': attempt.response}})
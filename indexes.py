@@ -0,0 +1,182 @@
+"""
+Indexes every collection needs, created at startup.
+
+`INDEXES` is the single place to declare an index. Unique indexes back the
+uniqueness the routes assume (one account per username and email, one company
+per handle, one application per candidate and opportunity, ...). Databases
+from before the last one need `python indexes.py --dedupe-applications` once.
+
+Run `python indexes.py --audit` against a database to create the indexes and
+`explain()` every query the routes issue. It exits non-zero if any of them
+would scan a whole collection.
+"""
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'users': [
+        IndexModel('username', unique=True),
+        IndexModel('resume.basic.email', unique=True),
+    ],
+    'company': [
+        IndexModel('handle', unique=True),
+    ],
+    'recruiters': [
+        IndexModel([('recruiter', ASCENDING), ('company_handle', ASCENDING)], unique=True),
+        IndexModel('company_handle'),
+        IndexModel('recruiter_email'),
+    ],
+    'founders': [
+        IndexModel([('founder_email', ASCENDING), ('company_handle', ASCENDING)], unique=True),
+        IndexModel('company_handle'),
+    ],
+    'opportunities': [
+        IndexModel('company.handle'),
+        IndexModel('company.name'),
+        IndexModel('location'),
+        IndexModel('opportunity_type'),
+        IndexModel([('position', TEXT), ('description', TEXT), ('location', TEXT)], name='opportunity_text'),
+    ],
+    'applications': [
+        IndexModel([('opportunity_id', ASCENDING), ('_id', ASCENDING)]), # Also serves the review pages in _id order
+        IndexModel([('opportunity_id', ASCENDING), ('candidate_email', ASCENDING)], unique=True), # One application per candidate
+        IndexModel('candidate_email'),
+    ],
+    'idempotency_keys': [
+        IndexModel('expires_at', expireAfterSeconds=0),
+    ],
+    'stats': [
+        IndexModel('company_handle'),
+    ],
+    'jobs': [
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('claimed_at', ASCENDING)]),
+    ],
+    'outbox': [
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('claimed_at', ASCENDING)]),
+        IndexModel('claimed_by', sparse=True),
+    ],
+}
+
+# (where it is issued, collection, filter, sort) for every query the routes and background jobs make.
+# Lookups by _id are left out, they always use the _id index.
+ROUTE_QUERIES = [
+    ('get_user_by_username', 'users', {'username': 'audit', 'tombstoned_at': None}, None),
+    ('get_user_by_email', 'users', {'resume.basic.email': 'audit@example.com'}, None),
+    ('bump_roles_version', 'users', {'username': {'$in': ['audit']}}, None),
+    ('load_company', 'company', {'handle': 'audit'}, None),
+    ('get_role_claims', 'recruiters', {'recruiter': 'audit'}, None),
+    ('get_role_claims', 'founders', {'founder_email': 'audit@example.com'}, None),
+    ('unregister_user', 'users', {'resume.basic.email': 'audit@example.com', 'tombstoned_at': None}, None),
+    ('delete_user_job', 'applications', {'candidate_email': 'audit@example.com'}, None),
+    ('delete_user_job', 'recruiters', {'recruiter_email': 'audit@example.com'}, None),
+    ('delete_user_job', 'users', {'resume.basic.email': 'audit@example.com', 'tombstoned_at': {'$ne': None}}, None),
+    ('unregister_company', 'founders', {'founder_email': 'audit@example.com', 'company_handle': 'audit'}, None),
+    ('unregister_company', 'company', {'handle': 'audit', 'tombstoned_at': None}, None),
+    ('unregister_company', 'recruiters', {'company_handle': 'audit'}, None),
+    ('unregister_company', 'opportunities', {'company.handle': 'audit'}, None),
+    ('delete_company_job', 'opportunities', {'company.handle': 'audit'}, None),
+    ('delete_company_job', 'applications', {'opportunity_id': {'$in': ['audit']}}, None),
+    ('delete_company_job', 'company', {'handle': 'audit', 'tombstoned_at': {'$ne': None}}, None),
+    ('delete_opportunity_job', 'applications', {'opportunity_id': 'audit'}, None),
+    ('be_recruiter', 'recruiters', {'company_handle': 'audit', 'recruiter_email': 'audit@example.com', 'recruiter': 'audit'}, None),
+    ('list_recruiters', 'recruiters', {}, [('_id', ASCENDING)]),
+    ('list_companies', 'company', {'tombstoned_at': None}, [('_id', ASCENDING)]),
+    ('list_recruiters_from_company', 'recruiters', {'company_handle': 'audit'}, [('_id', ASCENDING)]),
+    ('list_all_opportunities', 'opportunities', {}, [('_id', ASCENDING)]),
+    ('list_all_opportunities', 'opportunities', {'company.name': 'audit'}, [('_id', ASCENDING)]),
+    ('list_all_opportunities', 'opportunities', {'location': {'$regex': 'audit', '$options': 'i'}}, [('_id', ASCENDING)]),
+    ('list_all_opportunities', 'opportunities', {'opportunity_type': 'job'}, [('_id', ASCENDING)]),
+    ('list_all_opportunities', 'opportunities', {'$text': {'$search': 'audit'}}, [('_id', ASCENDING)]),
+    ('apply_for_opportunity', 'applications', {'opportunity_id': 'audit', 'candidate_email': 'audit@example.com'}, None),
+    ('get_opportunity_applications', 'applications', {'opportunity_id': 'audit'}, None),
+    ('review_opportunity_applications', 'applications', {'opportunity_id': 'audit'}, [('_id', ASCENDING)]),
+    ('get_ranked_opportunity_applications', 'users', {'resume.basic.email': {'$in': ['audit@example.com']}}, None),
+    ('Stats.company_removed', 'stats', {'company_handle': 'audit'}, None),
+    ('TTL monitor', 'idempotency_keys', {'expires_at': {'$lt': 0}}, None),
+    ('JobQueue.claim', 'jobs', {'status': 'pending'}, [('created_at', ASCENDING)]),
+    ('JobQueue.claim', 'jobs', {'status': 'running', 'claimed_at': {'$lt': 0}}, None),
+    ('Outbox.claim', 'outbox', {'status': 'pending', 'next_attempt_at': {'$lte': 0}}, None),
+    ('Outbox.claim', 'outbox', {'status': 'sending', 'claimed_at': {'$lt': 0}}, None),
+    ('Outbox.claim', 'outbox', {'claimed_by': 'audit'}, None),
+]
+
+async def ensure_indexes(db):
+    """Create the indexes in INDEXES. Existing indexes are left alone."""
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # Usually duplicates blocking a unique index, the app can still serve
+            logger.error("Could not create indexes on %s: %s", collection, e)
+
+async def dedupe_applications(db) -> int:
+    """
+    Delete repeated applications of a candidate to the same opportunity, keeping the
+    first. Needed once before the unique index on them can be built.
+    """
+    duplicates = await db.applications.aggregate([
+        {'$group': {'_id': {'opportunity_id': '$opportunity_id', 'candidate_email': '$candidate_email'}, 'ids': {'$push': '$_id'}}},
+        {'$match': {'ids.1': {'$exists': True}}},
+    ], allowDiskUse=True)
+    deleted = 0
+    async for group in duplicates:
+        deleted += (await db.applications.delete_many({'_id': {'$in': sorted(group['ids'])[1:]}})).deleted_count
+    return deleted
+
+def find_stages(plan: dict):
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(find_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(find_stages(value))
+    return stages
+
+async def audit(db):
+    """Explain every query in ROUTE_QUERIES, returning the ones that do a COLLSCAN."""
+    failures = []
+    for route, collection, query, sort in ROUTE_QUERIES:
+        command = {'find': collection, 'filter': query}
+        if sort:
+            command['sort'] = dict(sort)
+        explained = await db.command({'explain': command, 'verbosity': 'queryPlanner'})
+        stages = find_stages(explained['queryPlanner']['winningPlan'])
+        if 'COLLSCAN' in stages:
+            failures.append((route, collection, query))
+        print(f"{route:36} {collection:16} {' > '.join(stages)}")
+    return failures
+
+async def main():
+    from pymongo import AsyncMongoClient
+
+    parser = argparse.ArgumentParser(description="Create the collection indexes and check the routes' query plans.")
+    parser.add_argument('--audit', action='store_true', help="Fail if any route query does a collection scan")
+    parser.add_argument('--dedupe-applications', action='store_true', help="First delete repeated applications blocking their unique index")
+    args = parser.parse_args()
+
+    client = AsyncMongoClient(os.getenv('MONGODB_URI'))
+    db = client.careerhub
+    if args.dedupe_applications:
+        print(f"Deleted {await dedupe_applications(db)} repeated applications, run POST /admin/stats/reconcile to recount")
+    await ensure_indexes(db)
+    failures = await audit(db) if args.audit else []
+    await client.close()
+
+    for route, collection, query in failures:
+        print(f"COLLSCAN: {route} on {collection} with {query}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
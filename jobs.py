@@ -0,0 +1,124 @@
+"""
+Background jobs stored in the `jobs` collection.
+
+Routes submit a job and return at once; every app worker runs a loop that
+claims pending jobs and runs their handler. Handlers work in bounded batches
+and checkpoint after each one: the current step and per-collection progress
+are saved on the job document, and a job whose worker died is picked up again
+after `lease_seconds` and resumes from its last step. Steps must therefore be
+safe to run again, which deletes by query are.
+"""
+from datetime import datetime, timedelta, timezone
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class JobLost(Exception):
+    """Raised when another worker took over the job, e.g. after our lease expired."""
+
+class Job:
+    def __init__(self, queue, doc: dict):
+        self.queue = queue
+        self.id = doc['_id']
+        self.kind = doc['kind']
+        self.target = doc['target']
+        self.step = doc.get('step', 0)
+        self.batch_size = queue.batch_size
+
+    async def _update(self, update: dict):
+        update.setdefault('$set', {})
+        update['$set']['updated_at'] = update['$set']['claimed_at'] = datetime.now(timezone.utc)
+        result = await self.queue.collection.update_one(
+            {'_id': self.id, 'claimed_by': self.queue.worker_id}, update
+        )
+        if result.matched_count == 0:
+            raise JobLost(self.id)
+
+    async def checkpoint(self, collection: str, deleted: int):
+        """Record a finished batch and renew the lease."""
+        await self._update({'$inc': {f'progress.{collection}': deleted}})
+
+    async def advance(self):
+        """Mark the current step done, a resumed job starts after it."""
+        self.step += 1
+        await self._update({'$set': {'step': self.step}})
+
+class JobQueue:
+    def __init__(self, collection, batch_size: int = 500, lease_seconds: float = 120):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.worker_id = uuid.uuid4().hex
+        self.handlers = {}
+
+    def handler(self, kind: str):
+        """Register `async def handler(job: Job)` for a job kind."""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    async def submit(self, kind: str, target: dict) -> str:
+        now = datetime.now(timezone.utc)
+        result = await self.collection.insert_one({
+            'kind': kind,
+            'target': target,
+            'status': 'pending',
+            'step': 0,
+            'progress': {},
+            'created_at': now,
+            'updated_at': now,
+        })
+        return str(result.inserted_id)
+
+    async def get(self, job_id: str):
+        try:
+            return await self.collection.find_one({'_id': ObjectId(job_id)})
+        except Exception:
+            return None
+
+    async def claim(self):
+        now = datetime.now(timezone.utc)
+        doc = await self.collection.find_one_and_update(
+            {'$or': [
+                {'status': 'pending'},
+                {'status': 'running', 'claimed_at': {'$lt': now - timedelta(seconds=self.lease_seconds)}},
+            ]},
+            {'$set': {'status': 'running', 'claimed_by': self.worker_id, 'claimed_at': now, 'updated_at': now}},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return Job(self, doc) if doc else None
+
+    async def run(self, job: Job):
+        try:
+            await self.handlers[job.kind](job)
+            await job._update({'$set': {'status': 'done'}})
+        except JobLost:
+            logger.warning("Job %s was taken over by another worker", job.id)
+        except Exception as e:
+            logger.error("Job %s failed: %s", job.id, e)
+            await self.collection.update_one(
+                {'_id': job.id, 'claimed_by': self.worker_id},
+                {'$set': {'status': 'failed', 'error': str(e), 'updated_at': datetime.now(timezone.utc)}}
+            )
+
+    async def run_forever(self, poll_seconds: float):
+        while True:
+            try:
+                while job := await self.claim():
+                    await self.run(job)
+            except Exception as e:
+                logger.error("Job queue failed: %s", e)
+            await asyncio.sleep(poll_seconds)
+
+async def delete_batch(collection, query: dict, batch_size: int) -> int:
+    """Delete up to batch_size documents matching query, returns how many went."""
+    ids = [doc['_id'] async for doc in collection.find(query, {'_id': 1}).limit(batch_size)]
+    if not ids:
+        return 0
+    return (await collection.delete_many({'_id': {'$in': ids}})).deleted_count
@@ -0,0 +1,304 @@
+"""
+Instrumentation, served by `GET /metrics` in the Prometheus text format.
+
+- `MetricsMiddleware` records a latency histogram per route and the number of
+  requests in flight.
+- `MongoCommandListener` times every Mongo command and counts the documents it
+  returned or wrote, attributed to the route whose request issued it.
+- `InstrumentedRoute` splits a request's time between the endpoint and what
+  FastAPI does around it: resolving dependencies and validating the request
+  with pydantic before, validating and serializing the response after. Time
+  spent in Mongo is left out of both.
+- `MongoPoolListener` follows the driver's connection pool per server: open,
+  checked out and waiting connections, time to check one out, and failures.
+- `ARGON2_SECONDS` is observed by the password hashing pool.
+
+Recording is a few dict lookups and additions, there are no locks as
+everything runs on the event loop thread (Argon2 timings are recorded once the
+pool hands the result back). Metrics are per worker.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+import functools
+import inspect
+import time
+
+# Latency buckets in seconds, from sub-millisecond Mongo reads to slow bulk routes
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class RequestTimes:
+    """What one request spent its time on, shared by the hooks below through `current_request`."""
+    __slots__ = ('scope', 'mongo', 'endpoint_started', 'endpoint_finished', 'mongo_before', 'mongo_after')
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.mongo = 0.0 # Seconds in Mongo commands so far
+        self.endpoint_started = None
+        self.endpoint_finished = None
+        self.mongo_before = 0.0 # self.mongo when the endpoint started
+        self.mongo_after = 0.0 # and when it returned
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope before running it
+        route = self.scope.get('route')
+        return route.path if route is not None else 'unmatched'
+
+current_request: ContextVar[RequestTimes | None] = ContextVar('current_request', default=None)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {} # label values -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for values, series in self.series.items():
+            labels = format_labels(self.labels, values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{labels}}} {series[-1]}'
+            yield f'{self.name}_count{{{labels}}} {cumulative}'
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, labels: tuple, value: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type}'
+        for values, value in self.series.items():
+            yield f'{self.name}{{{format_labels(self.labels, values)}}} {value}'
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, labels: tuple, value: float):
+        self.series[labels] = value
+
+def format_labels(names: tuple, values: tuple) -> str:
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REQUEST_SECONDS = Histogram('careerhub_http_request_duration_seconds', 'Time to respond, per route.', ('method', 'route', 'status'))
+REQUESTS_IN_FLIGHT = Gauge('careerhub_http_requests_in_flight', 'Requests being handled.', ())
+REQUEST_PHASE_SECONDS = Histogram('careerhub_request_phase_seconds', 'Time FastAPI spends validating the request (with dependencies) and the response, Mongo excluded.', ('route', 'phase'))
+MONGO_SECONDS = Histogram('careerhub_mongo_command_duration_seconds', 'Mongo command durations, per issuing route.', ('route', 'command', 'collection'))
+MONGO_DOCUMENTS = Counter('careerhub_mongo_documents_total', 'Documents returned or written by Mongo commands.', ('route', 'command', 'collection'))
+MONGO_FAILURES = Counter('careerhub_mongo_command_failures_total', 'Mongo commands that failed.', ('route', 'command', 'collection'))
+MONGO_POOL_CONNECTIONS = Gauge('careerhub_mongo_pool_connections', 'Connections in the Mongo pool by state: open, checked_out, or waiting for one.', ('server', 'state'))
+MONGO_POOL_CHECKOUT_SECONDS = Histogram('careerhub_mongo_pool_checkout_seconds', 'Time to check a connection out of the Mongo pool, connecting included.', ('server',))
+MONGO_POOL_CHECKOUT_FAILURES = Counter('careerhub_mongo_pool_checkout_failures_total', 'Connection checkouts that failed, by reason (timeout, connectionError, poolClosed).', ('server', 'reason'))
+MONGO_POOL_CLEARED = Counter('careerhub_mongo_pool_cleared_total', 'Times the pool of a server was cleared after a network error or failover.', ('server',))
+ARGON2_SECONDS = Histogram('careerhub_argon2_duration_seconds', 'Time in Argon2 per call, queueing for the pool excluded.', ('operation',))
+
+METRICS = [REQUEST_SECONDS, REQUESTS_IN_FLIGHT, REQUEST_PHASE_SECONDS, MONGO_SECONDS, MONGO_DOCUMENTS, MONGO_FAILURES,
+    MONGO_POOL_CONNECTIONS, MONGO_POOL_CHECKOUT_SECONDS, MONGO_POOL_CHECKOUT_FAILURES, MONGO_POOL_CLEARED, ARGON2_SECONDS]
+
+def render(extra=()) -> str:
+    """All metrics in the Prometheus text format, followed by the `extra` metrics."""
+    lines = []
+    for metric in (*METRICS, *extra):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, cheaper than BaseHTTPMiddleware as it does not wrap the body."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        times = RequestTimes(scope)
+        token = current_request.set(times)
+        status = 500 # If the app fails before it responds
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.series[()] = REQUESTS_IN_FLIGHT.series.get((), 0) + 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            REQUESTS_IN_FLIGHT.series[()] -= 1
+            REQUEST_SECONDS.observe((scope['method'], times.route, status), time.perf_counter() - start)
+            current_request.reset(token)
+
+class InstrumentedRoute(APIRoute):
+    """Route class that records the request and response phases, set as the router's `route_class`."""
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = timed(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            start = time.perf_counter()
+            times = current_request.get()
+            response = await handler(request)
+            if times is not None and times.endpoint_finished is not None:
+                REQUEST_PHASE_SECONDS.observe((self.path, 'request'), max(0, times.endpoint_started - start - times.mongo_before))
+                REQUEST_PHASE_SECONDS.observe((self.path, 'response'), max(0, time.perf_counter() - times.endpoint_finished - times.mongo + times.mongo_after))
+            return response
+        return timed_handler
+
+def timed(endpoint):
+    """Wrap an endpoint to note when it starts and returns, and how much Mongo time went before."""
+    @functools.wraps(endpoint) # FastAPI reads the parameters through __wrapped__
+    async def timed_endpoint(*args, **kwargs):
+        times = current_request.get()
+        if times is None:
+            return await endpoint(*args, **kwargs)
+        times.endpoint_started = time.perf_counter()
+        times.mongo_before = times.mongo
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            times.endpoint_finished = time.perf_counter()
+            times.mongo_after = times.mongo
+    return timed_endpoint
+
+def returned_documents(reply: dict) -> int:
+    if 'cursor' in reply:
+        cursor = reply['cursor']
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+    return reply.get('n', 0)
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Pass to the client as `event_listeners=[MongoCommandListener()]`. The driver
+    publishes the events in the task that ran the command, so `current_request`
+    tells which request it was for. Commands of background tasks count as 'background'.
+    """
+    def __init__(self):
+        self.collections = {} # request id -> collection, the replies don't name it
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        if isinstance(collection, str):
+            self.collections[event.request_id] = collection
+
+    def labels(self, event):
+        times = current_request.get()
+        route = times.route if times is not None else 'background'
+        return times, (route, event.command_name, self.collections.pop(event.request_id, ''))
+
+    def succeeded(self, event):
+        times, labels = self.labels(event)
+        seconds = event.duration_micros / 1e6
+        if times is not None:
+            times.mongo += seconds
+        MONGO_SECONDS.observe(labels, seconds)
+        documents = returned_documents(event.reply)
+        if documents:
+            MONGO_DOCUMENTS.inc(labels, documents)
+
+    def failed(self, event):
+        times, labels = self.labels(event)
+        if times is not None:
+            times.mongo += event.duration_micros / 1e6
+        MONGO_FAILURES.inc(labels)
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """
+    Pass to the client with the command listener. `stats()` is served at
+    `/pool-stats`, the same numbers are in /metrics.
+    """
+    def __init__(self):
+        self.checkouts = {} # server -> connections checked out so far
+
+    def server(self, event) -> str:
+        return '%s:%s' % event.address
+
+    def pool_created(self, event):
+        self.checkouts.setdefault(self.server(event), 0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        MONGO_POOL_CLEARED.inc((self.server(event),))
+
+    def pool_closed(self, event):
+        server = self.server(event)
+        self.checkouts.pop(server, None)
+        for state in ('open', 'checked_out', 'waiting'):
+            MONGO_POOL_CONNECTIONS.series.pop((server, state), None)
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc((self.server(event), 'open'))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.inc((self.server(event), 'open'), -1)
+
+    def connection_check_out_started(self, event):
+        MONGO_POOL_CONNECTIONS.inc((self.server(event), 'waiting'))
+
+    def connection_checked_out(self, event):
+        server = self.server(event)
+        MONGO_POOL_CONNECTIONS.inc((server, 'waiting'), -1)
+        MONGO_POOL_CONNECTIONS.inc((server, 'checked_out'))
+        self.checkouts[server] = self.checkouts.get(server, 0) + 1
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_SECONDS.observe((server,), event.duration)
+
+    def connection_check_out_failed(self, event):
+        server = self.server(event)
+        MONGO_POOL_CONNECTIONS.inc((server, 'waiting'), -1)
+        MONGO_POOL_CHECKOUT_FAILURES.inc((server, event.reason))
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_SECONDS.observe((server,), event.duration)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CONNECTIONS.inc((self.server(event), 'checked_out'), -1)
+
+    def stats(self) -> dict:
+        servers = {}
+        for server, checkouts in self.checkouts.items():
+            waits = MONGO_POOL_CHECKOUT_SECONDS.series.get((server,))
+            timed = sum(waits[:-1]) if waits else 0
+            servers[server] = {
+                **{state: MONGO_POOL_CONNECTIONS.series.get((server, state), 0) for state in ('open', 'checked_out', 'waiting')},
+                'checkouts': checkouts,
+                'checkout_failures': {reason: count for (name, reason), count in MONGO_POOL_CHECKOUT_FAILURES.series.items() if name == server},
+                'mean_checkout_ms': round(waits[-1] / timed * 1000, 3) if timed else None,
+                'cleared': MONGO_POOL_CLEARED.series.get((server,), 0),
+            }
+        return servers
@@ -0,0 +1,95 @@
+"""
+Keyset pagination and NDJSON streaming for list endpoints.
+
+Pages are ordered by `_id`. The cursor handed to clients is the last `_id` of
+the page, url-safe base64 encoded, and is sent back as `after` to get the next
+page. It stays valid while documents are inserted or deleted.
+
+Documents are encoded straight to JSON by a `DocumentEncoder`, without going
+through the response model.
+"""
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from bson.objectid import ObjectId
+from serialization import DocumentEncoder, json_response
+import base64
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(oid: ObjectId) -> str:
+    return base64.urlsafe_b64encode(oid.binary).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+async def paginate(collection, query: dict, encoder: DocumentEncoder, limit: int | None = None, after: str | None = None, stream: bool = False):
+    """
+    Respond with the `collection` documents matching `query`, encoded by `encoder`.
+    With `limit`, at most that many are returned and the `X-Next-Cursor` header
+    is set when more remain. With `stream`, documents are sent as NDJSON while the
+    Mongo cursor produces them, so memory use does not grow with the result.
+    """
+    if after:
+        query = {**query, '_id': {'$gt': decode_cursor(after)}}
+    cursor = collection.find(query, encoder.projection).sort('_id', 1)
+
+    if stream:
+        if limit:
+            cursor = cursor.limit(limit)
+
+        async def lines():
+            async for doc in cursor:
+                yield encoder.line(doc)
+        return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+    items, next_cursor = await read_page(cursor, encoder, limit)
+    return page_response(items, next_cursor)
+
+async def fetch_page(collection, query: dict, encoder: DocumentEncoder, limit: int | None = None, after: str | None = None):
+    """One page as (encoded documents, cursor of the next page or None), for callers that cache it."""
+    if after:
+        query = {**query, '_id': {'$gt': decode_cursor(after)}}
+    return await read_page(collection.find(query, encoder.projection).sort('_id', 1), encoder, limit)
+
+async def paginate_aggregate(collection, match: dict, stages: list, encoder: DocumentEncoder, limit: int | None = None, after: str | None = None, stream: bool = False):
+    """
+    Like `paginate`, for documents shaped by aggregation `stages`. The stages run
+    after the page is matched, sorted and cut, so joins only touch that page.
+    """
+    if after:
+        match = {**match, '_id': {'$gt': decode_cursor(after)}}
+    pipeline = [{'$match': match}, {'$sort': {'_id': 1}}]
+    if limit:
+        pipeline.append({'$limit': limit if stream else limit + 1})
+    cursor = await collection.aggregate([*pipeline, *stages, {'$project': encoder.projection}])
+
+    if stream:
+        async def lines():
+            async for doc in cursor:
+                yield encoder.line(doc)
+        return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+    items, next_cursor = await collect_page(cursor, encoder, limit)
+    return page_response(items, next_cursor)
+
+async def read_page(cursor, encoder: DocumentEncoder, limit: int | None):
+    if limit:
+        cursor = cursor.limit(limit + 1) # One extra to know if there is a next page
+    return await collect_page(cursor, encoder, limit)
+
+async def collect_page(cursor, encoder: DocumentEncoder, limit: int | None):
+    """Encode what `cursor` yields, up to `limit` documents. It must yield one more when there is a next page."""
+    items = []
+    last_id = None
+    async for doc in cursor:
+        if limit and len(items) == limit:
+            return items, encode_cursor(last_id)
+        items.append(encoder.document(doc))
+        last_id = doc['_id']
+    return items, None
+
+def page_response(items: list, next_cursor: str | None):
+    return json_response(items, {'X-Next-Cursor': next_cursor} if next_cursor else None)
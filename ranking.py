@@ -0,0 +1,107 @@
+"""
+Rank an opportunity's applicants against what the opportunity asks for.
+
+The vocabulary is the set of terms the opportunity mentions, split into three
+feature groups:
+- skills: preferred skill names and keywords, weighted by the preferred level
+- education: area, study type and courses of the requirements
+- experience: position, company and summary of the preferred experience
+
+Each applicant becomes one row of an applicants x terms matrix built from their
+resume skills (weighted by their level), education and work history. All
+applicants are scored in one matrix product against the per-group query
+vectors, which gives the per-group breakdown; the total is its weighted sum.
+"""
+from search import tokenize
+import numpy as np
+
+GROUP_WEIGHTS = {
+    'skills': 0.5,
+    'education': 0.2,
+    'experience': 0.3,
+}
+GROUPS = list(GROUP_WEIGHTS)
+
+def level_weight(level) -> float:
+    """Skill level is 0-100 and optional, unknown levels count half."""
+    if level is None:
+        return 0.5
+    return min(max(level / 100, 0), 1)
+
+def skill_terms(skills):
+    for skill in skills or []:
+        weight = level_weight(skill.get('level'))
+        for text in [skill.get('name'), *skill.get('keywords', [])]:
+            for term in tokenize(text):
+                yield term, weight
+
+def education_terms(education):
+    for entry in education or []:
+        for text in [entry.get('area'), entry.get('studytype'), *entry.get('courses', [])]:
+            for term in tokenize(text):
+                yield term, 1.0
+
+def experience_terms(work):
+    for entry in work or []:
+        for text in [entry.get('position'), entry.get('name'), entry.get('summary')]:
+            for term in tokenize(text):
+                yield term, 1.0
+
+def query_vectors(opportunity: dict):
+    """Vocabulary of (group, term) columns and the group x column query matrix."""
+    wanted = {
+        'skills': skill_terms(opportunity.get('preferred_skills')),
+        'education': education_terms(opportunity.get('requirements')),
+        'experience': experience_terms(opportunity.get('preferred_experience')),
+    }
+    columns = {}
+    weights = {}
+    for group, terms in wanted.items():
+        for term, weight in terms:
+            column = columns.setdefault((group, term), len(columns))
+            weights[column] = max(weights.get(column, 0), weight)
+
+    query = np.zeros((len(GROUPS), len(columns)))
+    for (group, term), column in columns.items():
+        query[GROUPS.index(group), column] = weights[column]
+    # Normalize each group so a perfect match scores 1
+    totals = query.sum(axis=1, keepdims=True)
+    np.divide(query, totals, out=query, where=totals > 0)
+    return columns, query
+
+def applicant_matrix(resumes: list, columns: dict):
+    """applicants x columns matrix, an entry is how strongly the applicant has that term."""
+    matrix = np.zeros((len(resumes), len(columns)))
+    for row, resume in enumerate(resumes):
+        if not resume:
+            continue
+        have = {
+            'skills': skill_terms(resume.get('skills')),
+            'education': education_terms(resume.get('education')),
+            'experience': experience_terms(resume.get('work')),
+        }
+        for group, terms in have.items():
+            for term, weight in terms:
+                column = columns.get((group, term))
+                if column is not None and weight > matrix[row, column]:
+                    matrix[row, column] = weight
+    return matrix
+
+def rank_applicants(opportunity: dict, resumes: list, k: int):
+    """
+    Score resumes (dicts, None for applicants without one) against the opportunity.
+    Returns (index into resumes, total score, {group: score}) for the top k, best first.
+    """
+    if not resumes:
+        return []
+    columns, query = query_vectors(opportunity)
+    breakdown = applicant_matrix(resumes, columns) @ query.T # applicants x groups
+    totals = breakdown @ np.array([GROUP_WEIGHTS[group] for group in GROUPS])
+
+    k = min(k, len(resumes))
+    top = np.argpartition(-totals, k - 1)[:k]
+    top = top[np.argsort(-totals[top], kind='stable')]
+    return [
+        (int(i), float(totals[i]), dict(zip(GROUPS, breakdown[i].tolist())))
+        for i in top
+    ]
@@ -0,0 +1,124 @@
+"""
+Admission control for the unauthenticated auth routes.
+
+`POST /token` and `POST /register` each cost an Argon2 hash and a few lookups,
+and anyone can call them. Requests first take a token from the bucket of the
+client IP. They also need a token left in two failed-login buckets of the
+username they name. The strict one is per username and IP. The looser one is
+per username across all IPs, and backs up the first against guessing from
+many addresses. An empty bucket gets a 429 with Retry-After.
+
+Only failed logins are charged to the username buckets. A user logging in does
+not use up their own limit, and registering under a taken username does not
+count against its owner. Failures from other addresses only lock a user out
+once they exceed the looser limit.
+
+Then at most `max_concurrent` of the requests run at once. The rest are shed
+with a 503 straight away rather than queueing, so a burst of credential
+stuffing can not pile up in front of everything else.
+
+Everything is in-process, so limits apply per worker.
+"""
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, Request, status
+import math
+import time
+
+class TokenBuckets:
+    """Token bucket per key, refilled at `rate_per_minute` up to `burst` tokens."""
+    def __init__(self, rate_per_minute: float, burst: int, maxsize: int = 100_000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets = OrderedDict() # key -> (tokens, last refill), least recently used first
+
+    def peek(self, key) -> float:
+        """0 if `key` has a token left, else the seconds until it has. Takes nothing."""
+        entry = self._buckets.get(key)
+        if entry is None:
+            return 0
+        tokens, last = entry
+        tokens = min(self.burst, tokens + (time.monotonic() - last) * self.rate)
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key) -> float:
+        """Take a token for `key`. Returns 0 if there was one, else the seconds until there is."""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            # Forgetting an idle client only hands it a full bucket again
+            self._buckets.popitem(last=False)
+        return wait
+
+class Admission:
+    def __init__(self, charges: list):
+        self.charges = charges # [(buckets, key)]
+
+    def failed(self):
+        """Charge the attempt to the username's buckets."""
+        for buckets, key in self.charges:
+            buckets.take(key)
+
+class AuthGuard:
+    def __init__(self, ip_buckets: TokenBuckets, username_buckets: TokenBuckets, account_buckets: TokenBuckets, max_concurrent: int):
+        """`username_buckets` are keyed by (username, ip), `account_buckets` by username."""
+        self.ip_buckets = ip_buckets
+        self.username_buckets = username_buckets
+        self.account_buckets = account_buckets
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0 # Only touched from the event loop thread
+        self.counts = Counter() # (route, outcome) -> requests
+
+    def reject(self, route: str, outcome: str, wait: float):
+        self.counts[route, outcome] += 1
+        raise HTTPException(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later.",
+            headers={'Retry-After': str(math.ceil(wait))},
+        )
+
+    @asynccontextmanager
+    async def admit(self, route: str, request: Request, username: str):
+        """
+        Run the body of an auth route, or raise a 429/503 if it is over its limits.
+        The body calls `failed()` on the yielded admission if the attempt failed.
+        """
+        ip = request.client.host if request.client else 'unknown'
+        if wait := self.ip_buckets.take(ip):
+            self.reject(route, 'rate_limited_ip', wait)
+        username = username.lower()
+        if wait := self.username_buckets.peek((username, ip)):
+            self.reject(route, 'rate_limited_username', wait)
+        if wait := self.account_buckets.peek(username):
+            self.reject(route, 'rate_limited_account', wait)
+        if self.in_flight >= self.max_concurrent:
+            self.counts[route, 'shed'] += 1
+            raise HTTPException(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again shortly",
+                headers={'Retry-After': '1'},
+            )
+        self.counts[route, 'allowed'] += 1
+        self.in_flight += 1
+        try:
+            yield Admission([(self.username_buckets, (username, ip)), (self.account_buckets, username)])
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        routes = {}
+        for (route, outcome), count in self.counts.items():
+            routes.setdefault(route, {})[outcome] = count
+        return {
+            'in_flight': self.in_flight,
+            'max_concurrent': self.max_concurrent,
+            'routes': routes,
+        }
@@ -0,0 +1,155 @@
+"""
+Opportunity recommendations for candidates.
+
+Opportunities and resumes are turned into feature vectors over the same
+hashed term space (skills, position, location, education, languages) and L2
+normalized, so a dot product is their cosine similarity. Each worker keeps the
+opportunity vectors in one matrix that the opportunity routes update row by
+row, and recommending is a single matrix-vector product over it.
+"""
+from datetime import datetime, timezone
+from ranking import level_weight
+from search import tokenize
+from collections import defaultdict
+import asyncio
+import logging
+import numpy as np
+import zlib
+
+logger = logging.getLogger(__name__)
+
+PROJECTION = {
+    'position': 1, 'description': 1, 'location': 1, 'preferred_skills': 1,
+    'requirements': 1, 'application_deadline': 1,
+}
+
+def opportunity_terms(opportunity: dict):
+    for skill in opportunity.get('preferred_skills') or []:
+        for text in [skill.get('name'), *skill.get('keywords', [])]:
+            for term in tokenize(text):
+                yield term, 2.0
+    for term in tokenize(opportunity.get('position')):
+        yield term, 1.5
+    for term in tokenize(opportunity.get('location')):
+        yield term, 1.5
+    for entry in opportunity.get('requirements') or []:
+        for text in [entry.get('area'), entry.get('studytype'), *entry.get('courses', [])]:
+            for term in tokenize(text):
+                yield term, 1.0
+    for term in tokenize(opportunity.get('description')):
+        yield term, 0.25
+
+def resume_terms(resume: dict):
+    for skill in resume.get('skills') or []:
+        weight = 2.0 * level_weight(skill.get('level'))
+        for text in [skill.get('name'), *skill.get('keywords', [])]:
+            for term in tokenize(text):
+                yield term, weight
+    for language in resume.get('languages') or []:
+        for term in tokenize(language.get('name')):
+            yield term, 0.5 * level_weight(language.get('fluency'))
+    for term in tokenize((resume.get('basic') or {}).get('location')):
+        yield term, 1.5
+    for entry in resume.get('education') or []:
+        for text in [entry.get('area'), entry.get('studytype'), *entry.get('courses', [])]:
+            for term in tokenize(text):
+                yield term, 1.0
+    for entry in resume.get('work') or []:
+        for term in tokenize(entry.get('position')):
+            yield term, 1.0
+
+def deadline_timestamp(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        return float('inf')
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class RecommendationIndex:
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.version = 0 # Bumped on every change, cached recommendations compare against it
+        self.matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self.deadlines = np.zeros(0) # -inf marks a free row
+        self.slot_of = {} # opportunity id -> row
+        self.ids = []
+        self.free = []
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def vector(self, terms) -> np.ndarray:
+        """Hash weighted terms into a unit vector."""
+        weights = defaultdict(float)
+        for term, weight in terms:
+            weights[zlib.crc32(term.encode()) % self.dimensions] += weight
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if weights:
+            vector[list(weights)] = list(weights.values())
+            vector /= np.linalg.norm(vector) or 1
+        return vector
+
+    def add(self, doc_id: str, opportunity: dict):
+        """Index an opportunity, replacing any previous version of it."""
+        slot = self.slot_of.get(doc_id)
+        if slot is None:
+            if not self.free:
+                self._grow()
+            slot = self.free.pop()
+            self.slot_of[doc_id] = slot
+            self.ids[slot] = doc_id
+        self.matrix[slot] = self.vector(opportunity_terms(opportunity))
+        self.deadlines[slot] = deadline_timestamp(opportunity.get('application_deadline'))
+        self.version += 1
+
+    def remove(self, doc_id: str):
+        slot = self.slot_of.pop(doc_id, None)
+        if slot is None:
+            return
+        self.matrix[slot] = 0
+        self.deadlines[slot] = -np.inf
+        self.ids[slot] = None
+        self.free.append(slot)
+        self.version += 1
+
+    def _grow(self):
+        old = len(self.ids)
+        size = max(64, old * 2)
+        matrix = np.zeros((size, self.dimensions), dtype=np.float32)
+        matrix[:old] = self.matrix
+        deadlines = np.full(size, -np.inf)
+        deadlines[:old] = self.deadlines
+        self.matrix, self.deadlines = matrix, deadlines
+        self.ids.extend([None] * (size - old))
+        self.free.extend(range(size - 1, old - 1, -1))
+
+    def recommend(self, resume: dict, k: int = 10):
+        """Top k (opportunity id, score) for a resume, among opportunities still open."""
+        if not self.slot_of:
+            return []
+        scores = self.matrix @ self.vector(resume_terms(resume))
+        scores[self.deadlines < datetime.now(timezone.utc).timestamp()] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    async def rebuild(self, collection):
+        """Re-read every opportunity from Mongo and swap the new index in."""
+        fresh = RecommendationIndex(self.dimensions)
+        async for doc in collection.find({}, PROJECTION):
+            fresh.add(str(doc['_id']), doc)
+        # No awaits below, so requests never see a half swapped index
+        self.matrix, self.deadlines = fresh.matrix, fresh.deadlines
+        self.slot_of, self.ids, self.free = fresh.slot_of, fresh.ids, fresh.free
+        self.version += 1
+
+    async def refresh_forever(self, collection, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild(collection)
+            except Exception as e:
+                logger.error("Recommendation index refresh failed: %s", e)
@@ -0,0 +1,122 @@
+"""
+Partial resume updates for `PATCH /resume`.
+
+A patch is a list of JSON Patch style operations (`add`, `replace`, `remove`)
+whose paths point into the resume, e.g. `/basic/summary`, `/skills/-` or
+`/projects/2`. Only the value of each operation is validated, against the
+model of the field or list item it targets, and the whole patch becomes one
+aggregation pipeline update. Operations apply in order, atomically, without
+rewriting the rest of the user document.
+
+List items are patched whole: `/skills/2` can be replaced or removed, but
+`/skills/2/level` can not be addressed.
+"""
+from fastapi import HTTPException, status
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Union, get_args, get_origin, get_type_hints
+from data_class import Resume, ResumePatchOperation
+import copy
+
+SLICE_END = 2**31 - 1
+
+def invalid(detail: str):
+    return HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail)
+
+def unwrap_optional(tp):
+    if get_origin(tp) is Union:
+        args = [a for a in get_args(tp) if a is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return tp, False
+
+def parse_pointer(path: str):
+    if not path.startswith('/') or path == '/':
+        raise invalid(f"Invalid path {path!r}")
+    return [part.replace('~1', '/').replace('~0', '~') for part in path[1:].split('/')]
+
+def resolve(path: str):
+    """
+    Map a patch path to (mongo field, type, optional, list index).
+    The list index is None when the path targets a field, '-' or an int when it targets a list item.
+    """
+    parts = parse_pointer(path)
+    tp, optional = Resume, False
+    fields = []
+    for i, part in enumerate(parts):
+        if isinstance(tp, type) and issubclass(tp, BaseModel):
+            hints = get_type_hints(tp)
+            if part not in hints:
+                raise invalid(f"Unknown field {part!r} in {path!r}")
+            tp, optional = unwrap_optional(hints[part])
+            fields.append(part)
+        elif get_origin(tp) is list:
+            if i != len(parts) - 1:
+                raise invalid(f"List items are patched whole, {path!r} goes inside one")
+            if part != '-' and not part.isdigit():
+                raise invalid(f"Invalid list index {part!r} in {path!r}")
+            item_type = get_args(tp)[0]
+            return 'resume.' + '.'.join(fields), item_type, False, part if part == '-' else int(part)
+        else:
+            raise invalid(f"{path!r} goes inside a plain value")
+    return 'resume.' + '.'.join(fields), tp, optional, None
+
+def to_document(tp, value):
+    """`value` validated as `tp`, in the shape the write routes store (see serialization.to_document)."""
+    adapter = TypeAdapter(tp)
+    return adapter.dump_python(adapter.validate_python(value), mode='json')
+
+def locate(patched: dict, field: str, path: str):
+    """The dict holding `field` in the patched resume document, and its key there."""
+    container = patched
+    parts = field.split('.')
+    for depth, part in enumerate(parts[:-1]):
+        container = container.get(part)
+        if container is None:
+            raise invalid(f"{path!r} goes into /{'/'.join(parts[1:depth + 1])}, which is not set")
+    return container, parts[-1]
+
+def build_pipeline(resume: Resume, operations: list[ResumePatchOperation]):
+    """
+    Validate the operations and turn them into update pipeline stages.
+    They are also applied to a copy of `resume`, the user's current resume, to
+    check list indexes and that a path does not go into an unset optional section,
+    which would store that section without its required fields.
+    """
+    pipeline = []
+    patched = {'resume': resume.model_dump(mode='json')}
+    for operation in operations:
+        field, tp, optional, index = resolve(operation.path)
+        container, key = locate(patched, field, operation.path)
+
+        if operation.op in ('add', 'replace'):
+            try:
+                value = {'$literal': to_document(tp, operation.value)}
+            except ValidationError as e:
+                raise invalid(f"Invalid value for {operation.path!r}: {e}")
+
+        if index is None:
+            if operation.op == 'remove':
+                if not optional:
+                    raise invalid(f"{operation.path!r} is required and can not be removed")
+                value = None
+            pipeline.append({'$set': {field: value}})
+            container[key] = copy.deepcopy(value['$literal']) if value else None
+            continue
+
+        items = container.get(key) or []
+        length = len(items)
+        if index == '-':
+            if operation.op != 'add':
+                raise invalid(f"'-' can only be used to add to a list, in {operation.path!r}")
+            index = length
+        elif index > length or (operation.op != 'add' and index == length):
+            raise invalid(f"List index out of range in {operation.path!r}")
+
+        # Rebuild the list as items[:index] + new item + the rest
+        stored = {'$ifNull': ['$' + field, []]}
+        head = [{'$slice': [stored, index]}] if index else []
+        middle = [] if operation.op == 'remove' else [{'$literal': [value['$literal']]}]
+        tail = {'$slice': [stored, index if operation.op == 'add' else index + 1, SLICE_END]}
+        pipeline.append({'$set': {field: {'$concatArrays': [*head, *middle, tail]}}})
+        container[key] = items[:index] + copy.deepcopy(middle[0]['$literal'] if middle else []) + items[index if operation.op == 'add' else index + 1:]
+    return pipeline
@@ -0,0 +1,76 @@
+"""
+Applicant review: an opportunity's applications together with their
+applicants' resumes, in one aggregation instead of a resume request per
+applicant.
+
+`APPLICANT_STAGES` join each application to its applicant with a `$lookup` on
+the unique `resume.basic.email` index (MongoDB 5.0+ for `localField` with a
+sub-pipeline), keeping only the resume fields of `ApplicantProfile`.
+`csv_chunks` turns the joined documents into CSV as the cursor yields them, so
+an export holds one batch in memory however many applied.
+"""
+import csv
+import io
+
+APPLICANT_STAGES = [
+    {'$lookup': {
+        'from': 'users',
+        'localField': 'candidate_email',
+        'foreignField': 'resume.basic.email',
+        'pipeline': [
+            {'$match': {'tombstoned_at': None}}, # Unregistered, waiting for the cleanup job
+            {'$project': {
+                '_id': 0,
+                'username': 1,
+                'basic': '$resume.basic',
+                'working_at': '$resume.working_at',
+                'education': '$resume.education',
+                'skills': '$resume.skills',
+                'work': '$resume.work',
+            }},
+        ],
+        'as': 'applicant',
+    }},
+    {'$set': {'applicant': {'$first': '$applicant'}}},
+]
+
+CSV_COLUMNS = [
+    'application_id', 'status', 'candidate_email', 'username', 'name', 'phone', 'location',
+    'current_position', 'current_company', 'skills', 'education', 'cover_letter',
+]
+
+def cell(value) -> str:
+    value = '' if value is None else str(value)
+    # Keep spreadsheets from running applicant supplied text as a formula
+    return "'" + value if value[:1] in ('=', '+', '-', '@', '\t', '\r') else value
+
+def csv_row(doc: dict) -> list:
+    applicant = doc.get('applicant') or {}
+    basic = applicant.get('basic') or {}
+    working_at = applicant.get('working_at') or {}
+    skills = '; '.join(
+        f"{skill['name']} ({skill['level']:g})" if skill.get('level') is not None else skill['name']
+        for skill in applicant.get('skills') or []
+    )
+    education = '; '.join(
+        f"{education['studytype']} {education['area']}, {education['institution']}"
+        for education in applicant.get('education') or []
+    )
+    return [cell(value) for value in (
+        doc['_id'], doc.get('status', 'applied'), doc['candidate_email'], applicant.get('username'),
+        basic.get('name'), basic.get('phone'), basic.get('location'), working_at.get('position'),
+        (working_at.get('company') or {}).get('name'), skills, education, doc.get('cover_letter'),
+    )]
+
+async def csv_chunks(cursor, chunk_size: int = 64 * 1024):
+    """CSV text of the documents `cursor` yields, header first, in chunks of about `chunk_size` characters."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    async for doc in cursor:
+        writer.writerow(csv_row(doc))
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
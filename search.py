@@ -0,0 +1,156 @@
+"""
+In-process full text search over opportunities, ranked with BM25.
+
+Each worker keeps an inverted index of every opportunity, including those
+past their deadline. The opportunity routes update it as they write, and it
+is rebuilt from Mongo every SEARCH_REFRESH_SECONDS to pick up writes made by
+other workers.
+
+Indexed text: position, description, location, company name and the
+preferred skills' names and keywords. Position and skills count extra.
+"""
+from collections import Counter, defaultdict
+import asyncio
+import heapq
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {
+    'position': 3,
+    'skills': 2,
+    'description': 1,
+    'location': 1,
+    'company': 1,
+}
+PROJECTION = {'position': 1, 'description': 1, 'location': 1, 'company.name': 1, 'preferred_skills': 1}
+
+TOKEN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+def tokenize(text: str):
+    return TOKEN.findall(text.lower()) if text else []
+
+def document_terms(opportunity: dict) -> Counter:
+    """Weighted term frequencies of an opportunity document."""
+    fields = {
+        'position': opportunity.get('position'),
+        'description': opportunity.get('description'),
+        'location': opportunity.get('location'),
+        'company': (opportunity.get('company') or {}).get('name'),
+        'skills': ' '.join(
+            ' '.join([skill.get('name', ''), *skill.get('keywords', [])])
+            for skill in opportunity.get('preferred_skills') or []
+        ),
+    }
+    terms = Counter()
+    for field, text in fields.items():
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+class SearchIndex:
+    """
+    Postings hold each term's precomputed BM25 weight per document, using the
+    average document length from the last rebuild. Queries run the threshold
+    algorithm over per-term lists sorted by weight, so the top k can usually be
+    found without scoring every document that contains a common term.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.avgdl = 0
+        self.postings = defaultdict(dict) # term -> {doc_id: BM25 term weight}
+        self.ranked = {} # term -> [(weight, doc_id)] best first, rebuilt lazily
+        self.doc_terms = {} # doc_id -> terms, needed to remove the doc again
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id: str, opportunity: dict = None, terms: Counter = None):
+        """Index an opportunity, replacing any previous version of it."""
+        self.remove(doc_id)
+        if terms is None:
+            terms = document_terms(opportunity)
+        length = sum(terms.values())
+        norm = self.k1 * (1 - self.b + self.b * length / (self.avgdl or length or 1))
+        for term, tf in terms.items():
+            self.postings[term][doc_id] = tf * (self.k1 + 1) / (tf + norm)
+            self.ranked.pop(term, None)
+        self.doc_terms[doc_id] = list(terms)
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+            self.ranked.pop(term, None)
+
+    def ranked_postings(self, term: str):
+        ranked = self.ranked.get(term)
+        if ranked is None:
+            ranked = sorted(((w, doc_id) for doc_id, w in self.postings[term].items()), reverse=True)
+            self.ranked[term] = ranked
+        return ranked
+
+    def search(self, query: str, k: int = 10):
+        """Top k (doc_id, score) pairs for the query, best first."""
+        n = len(self.doc_terms)
+        terms = []
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings:
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                terms.append((idf, postings, self.ranked_postings(term)))
+        if not terms:
+            return []
+
+        top = [] # min-heap of (score, doc_id)
+        seen = set()
+        depth = 0
+        while True:
+            threshold = 0 # Best possible score of any document not seen yet
+            for idf, postings, ranked in terms:
+                if depth >= len(ranked):
+                    continue
+                weight, doc_id = ranked[depth]
+                threshold += idf * weight
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                score = sum(i * p.get(doc_id, 0) for i, p, r in terms)
+                if len(top) < k:
+                    heapq.heappush(top, (score, doc_id))
+                elif score > top[0][0]:
+                    heapq.heapreplace(top, (score, doc_id))
+            if not threshold or (len(top) == k and top[0][0] >= threshold):
+                break
+            depth += 1
+        return [(doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
+    async def rebuild(self, collection):
+        """Re-read every opportunity from Mongo and swap the new index in."""
+        documents = [(str(doc['_id']), document_terms(doc)) async for doc in collection.find({}, PROJECTION)]
+        fresh = SearchIndex(self.k1, self.b)
+        if documents:
+            fresh.avgdl = sum(sum(terms.values()) for doc_id, terms in documents) / len(documents)
+        for doc_id, terms in documents:
+            fresh.add(doc_id, terms=terms)
+        # No awaits below, so requests never see a half swapped index
+        self.avgdl = fresh.avgdl
+        self.postings = fresh.postings
+        self.ranked = fresh.ranked
+        self.doc_terms = fresh.doc_terms
+
+    async def refresh_forever(self, collection, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild(collection)
+            except Exception as e:
+                logger.error("Search index refresh failed: %s", e)
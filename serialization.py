@@ -0,0 +1,109 @@
+"""
+JSON responses straight from Mongo documents.
+
+Every document in the collections is written by the app from a validated
+model (`to_document`), so read routes do not need to validate it into a model
+again and have FastAPI validate and serialize it once more. A `DocumentEncoder`
+asks Mongo for the fields of its response model only, fills in the defaults of
+fields older documents lack, and the result is encoded to bytes with orjson.
+
+Run `python serialization.py` to compare both paths for each listing's model.
+"""
+from fastapi import Response
+from pydantic import BaseModel
+from typing import Type
+import argparse
+import orjson
+import time
+
+def to_document(model: BaseModel) -> dict:
+    """The JSON compatible dict stored in Mongo for a validated model."""
+    return model.model_dump(mode='json')
+
+def json_response(content, headers: dict | None = None) -> Response:
+    # ObjectIds and the like that slip into nested documents go out as strings
+    return Response(orjson.dumps(content, default=str), media_type='application/json', headers=headers)
+
+class DocumentEncoder:
+    def __init__(self, model: Type[BaseModel], id_field: str | None = None):
+        """`id_field` names the field that carries the document's `_id`, as a string."""
+        self.id_field = id_field
+        self.defaults = {}
+        self.fields = []
+        for name, field in model.model_fields.items():
+            if name == id_field:
+                continue
+            self.fields.append(name)
+            if not field.is_required():
+                self.defaults[name] = to_json_value(field.get_default(call_default_factory=True))
+        self.projection = {name: 1 for name in self.fields} # _id comes along, pagination needs it
+
+    def document(self, doc: dict) -> dict:
+        """The response model's fields of a Mongo document, ready for orjson."""
+        out = {self.id_field: str(doc['_id'])} if self.id_field else {}
+        for name in self.fields:
+            if name in doc:
+                out[name] = doc[name]
+            elif name in self.defaults:
+                out[name] = self.defaults[name]
+        return out
+
+    def line(self, doc: dict) -> bytes:
+        """One NDJSON line."""
+        return orjson.dumps(self.document(doc), default=str) + b'\n'
+
+    def response(self, doc: dict) -> Response:
+        return json_response(self.document(doc))
+
+def to_json_value(value):
+    if isinstance(value, BaseModel):
+        return to_document(value)
+    if isinstance(value, list):
+        return [to_json_value(item) for item in value]
+    return value
+
+def benchmark(model, encoder: DocumentEncoder, docs: list, rounds: int):
+    """Seconds per document for validate + dump through pydantic, and for the encoder."""
+    from pydantic import TypeAdapter
+    from typing import List
+
+    adapter = TypeAdapter(List[model])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        adapter.dump_json(adapter.validate_python([model(**doc) for doc in docs]))
+    validated = (time.perf_counter() - start) / rounds / len(docs)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        orjson.dumps([encoder.document(doc) for doc in docs], default=str)
+    direct = (time.perf_counter() - start) / rounds / len(docs)
+    return validated, direct
+
+if __name__ == '__main__':
+    from bson.objectid import ObjectId
+    from data_class import CandidateApplication, Company, Opportunity, OpportunityWithID, Recruiter
+
+    parser = argparse.ArgumentParser(description="Time pydantic validation against the direct encoder for each listing's model.")
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    company = {'name': 'Acme', 'handle': 'acme', 'industry': 'Software', 'founded': 2001, 'description': 'Tools for builders', 'logo': 'https://acme.example/logo.png'}
+    skill = {'name': 'Python', 'level': 80, 'keywords': ['fastapi', 'mongodb']}
+    education = {'institution': 'IIT', 'url': 'https://iit.example', 'area': 'CS', 'studytype': 'Bachelor', 'start_date': '2018-07-01T00:00:00', 'end_date': '2022-06-01T00:00:00', 'score': 8.5, 'courses': ['Databases']}
+    opportunity = {
+        'position': 'Backend Engineer', 'company': company, 'description': 'Build and run our APIs. ' * 10,
+        'location': 'Kolkata, India', 'opportunity_type': 'job', 'start_date': '2025-01-01T00:00:00',
+        'end_date': None, 'requirements': [education], 'preferred_skills': [skill] * 3, 'preferred_experience': [],
+        'application_deadline': '2025-01-01T00:00:00', 'salary_range': None, 'url': None,
+    }
+    endpoints = [
+        ('GET /company', Company, DocumentEncoder(Company), company),
+        ('GET /recruiter', Recruiter, DocumentEncoder(Recruiter), {'recruiter_email': 'r@acme.example', 'recruiter': 'r', 'company_handle': 'acme'}),
+        ('GET /opportunities', OpportunityWithID, DocumentEncoder(OpportunityWithID, id_field='id'), opportunity),
+        ('GET /opportunities/{id}', Opportunity, DocumentEncoder(Opportunity), opportunity),
+        ('GET /opportunities/{id}/applications', CandidateApplication, DocumentEncoder(CandidateApplication), {'candidate_email': 'c@example.com', 'opportunity_id': 'x', 'cover_letter': 'Hello ' * 50, 'status': 'applied'}),
+    ]
+    for name, model, encoder, doc in endpoints:
+        docs = [{**doc, '_id': ObjectId()} for _ in range(args.documents)]
+        validated, direct = benchmark(model, encoder, docs, args.rounds)
+        print(f"{name:40} pydantic {validated * 1e6:7.1f} us/doc   direct {direct * 1e6:6.1f} us/doc   {validated / direct:5.1f}x")
@@ -0,0 +1,211 @@
+"""
+Application and posting counters for recruiter and founder dashboards.
+
+The `stats` collection holds one document per opportunity
+(`opportunity:<id>`) and one per company (`company:<handle>`). The routes
+that add or remove opportunities and applications update them with `$inc`,
+so a dashboard reads one document instead of counting the source
+collections:
+
+- `applications`, and `daily.<YYYY-MM-DD>` applications by the UTC day they
+  were made (taken from the application's ObjectId).
+- On companies, `opportunities` posted and `closing.<YYYY-MM-DDTHH:MM>`
+  postings by their deadline in UTC. Open postings are those whose deadline is
+  still ahead. A key whose postings were all removed or moved to another
+  deadline stays behind at 0 until the next reconcile.
+
+A write and its counter update are not atomic together, so a crash in
+between, or a write that bypasses the app, leaves the counters off, and an
+opportunity moved to another company keeps its applications counted at the
+old one. The `reconcile_stats` job rebuilds them from the source collections.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pymongo import ReplaceOne, UpdateOne
+from bson.objectid import ObjectId
+
+def minute(value) -> str:
+    """UTC minute of a datetime, or of an ISO string as stored by `to_document`. Naive times are taken as UTC."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M')
+
+def application_day(application_id: ObjectId) -> str:
+    return minute(application_id.generation_time)[:10]
+
+def company_key(handle: str) -> str:
+    return f'company:{handle}'
+
+def opportunity_key(opportunity_id) -> str:
+    return f'opportunity:{opportunity_id}'
+
+def open_count(closing: dict, now: str) -> int:
+    return sum(count for deadline, count in closing.items() if deadline > now)
+
+class Stats:
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    async def _apply(self, increments: dict, handles: dict):
+        """$inc `increments` (key -> Counter of fields) and set `handles` (key -> company handle), upserting the documents."""
+        requests = []
+        for key in increments.keys() | handles.keys():
+            fields = {field: count for field, count in increments.get(key, {}).items() if count}
+            if not fields and key not in handles:
+                continue
+            update = {'$setOnInsert': {'created_at': datetime.now(timezone.utc)}}
+            if fields:
+                update['$inc'] = fields
+            if key in handles:
+                update['$set'] = {'company_handle': handles[key]}
+            requests.append(UpdateOne({'_id': key}, update, upsert=True))
+        if requests:
+            await self.collection.bulk_write(requests, ordered=False)
+
+    async def opportunities_added(self, documents: list):
+        await self.opportunities_changed([], documents)
+
+    async def opportunities_changed(self, before: list, after: list):
+        """Move posting counts from the `before` versions of opportunities to the `after` ones."""
+        increments = defaultdict(Counter)
+        for sign, documents in ((-1, before), (1, after)):
+            for document in documents:
+                key = company_key(document['company']['handle'])
+                increments[key]['opportunities'] += sign
+                increments[key][f"closing.{minute(document['application_deadline'])}"] += sign
+        previous = {document['_id']: document['company']['handle'] for document in before}
+        handles = {
+            key: document['company']['handle']
+            for document in after
+            for key in (opportunity_key(document['_id']), company_key(document['company']['handle']))
+            if previous.get(document['_id']) != document['company']['handle'] # Added, or moved to another company
+        }
+        await self._apply(increments, handles)
+
+    async def opportunities_removed(self, documents: list):
+        """Uncount deleted opportunities, and their applications which a job deletes later."""
+        keys = [opportunity_key(document['_id']) for document in documents]
+        counted = {doc['_id']: doc async for doc in self.collection.find({'_id': {'$in': keys}})}
+        await self.collection.delete_many({'_id': {'$in': keys}})
+        increments = defaultdict(Counter)
+        handles = {}
+        for key, document in zip(keys, documents):
+            handle = document['company']['handle']
+            company = company_key(handle)
+            handles[company] = handle
+            increments[company]['opportunities'] -= 1
+            increments[company][f"closing.{minute(document['application_deadline'])}"] -= 1
+            if key in counted:
+                increments[company]['applications'] -= counted[key].get('applications', 0)
+                for application_day, count in counted[key].get('daily', {}).items():
+                    increments[company][f'daily.{application_day}'] -= count
+        await self._apply(increments, handles)
+
+    async def applied(self, application_id: ObjectId, opportunity_id: str, company_handle: str):
+        fields = Counter({'applications': 1, f'daily.{application_day(application_id)}': 1})
+        await self._apply(
+            {opportunity_key(opportunity_id): fields, company_key(company_handle): fields},
+            {opportunity_key(opportunity_id): company_handle, company_key(company_handle): company_handle},
+        )
+
+    async def applications_removed(self, applications: list):
+        """Uncount deleted applications, given their `_id` and `opportunity_id`."""
+        keys = {opportunity_key(application['opportunity_id']) for application in applications}
+        handles = {doc['_id']: doc['company_handle'] async for doc in self.collection.find({'_id': {'$in': list(keys)}}, {'company_handle': 1})}
+        increments = defaultdict(Counter)
+        for application in applications:
+            key = opportunity_key(application['opportunity_id'])
+            if key not in handles:
+                continue # Its opportunity is gone and was uncounted with it
+            fields = Counter({'applications': -1, f"daily.{application_day(application['_id'])}": -1})
+            increments[key].update(fields)
+            increments[company_key(handles[key])].update(fields)
+        await self._apply(increments, {})
+
+    async def company_removed(self, handle: str):
+        await self.collection.delete_many({'company_handle': handle})
+
+    async def company(self, handle: str) -> dict:
+        doc = await self.collection.find_one({'_id': company_key(handle)}) or {}
+        return {
+            'company_handle': handle,
+            'opportunities': doc.get('opportunities', 0),
+            'open_opportunities': open_count(doc.get('closing', {}), minute(datetime.now(timezone.utc))),
+            'applications': doc.get('applications', 0),
+            'applications_per_day': {key: count for key, count in sorted(doc.get('daily', {}).items()) if count},
+        }
+
+    async def opportunity(self, opportunity_id: str) -> dict:
+        doc = await self.collection.find_one({'_id': opportunity_key(opportunity_id)}) or {}
+        return {
+            'opportunity_id': opportunity_id,
+            'applications': doc.get('applications', 0),
+            'applications_per_day': {key: count for key, count in sorted(doc.get('daily', {}).items()) if count},
+        }
+
+    async def reconcile(self, db, job, batch_size: int):
+        """
+        Rebuild every counter from the opportunities and applications collections.
+        Safe to run again from the start. Increments landing while it runs can be lost,
+        so counters of documents written meanwhile may be off by those.
+        """
+        started = datetime.now(timezone.utc)
+        replacements = []
+
+        async def replace(key: str, document: dict, progress: str):
+            nonlocal replacements
+            replacements.append(ReplaceOne({'_id': key}, {**document, 'reconciled_at': started}, upsert=True))
+            if len(replacements) == batch_size:
+                await self.collection.bulk_write(replacements, ordered=False)
+                await job.checkpoint(progress, len(replacements))
+                replacements = []
+
+        companies = defaultdict(Counter)
+        handles = {} # opportunity id -> company handle
+        async for opportunity in db.opportunities.find({}, {'company.handle': 1, 'application_deadline': 1}).batch_size(batch_size):
+            handle = opportunity['company']['handle']
+            handles[str(opportunity['_id'])] = handle
+            companies[handle]['opportunities'] += 1
+            companies[handle][f"closing.{minute(opportunity['application_deadline'])}"] += 1
+
+        per_opportunity = await db.applications.aggregate([
+            {'$group': {
+                '_id': {'opportunity_id': '$opportunity_id', 'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': {'$toDate': '$_id'}}}},
+                'count': {'$sum': 1},
+            }},
+            {'$group': {'_id': '$_id.opportunity_id', 'days': {'$push': {'k': '$_id.day', 'v': '$count'}}, 'applications': {'$sum': '$count'}}},
+        ], batchSize=batch_size)
+        uncounted = set(handles)
+        async for opportunity in per_opportunity:
+            handle = handles.get(opportunity['_id'])
+            if handle is None:
+                continue # Left behind by a deleted opportunity, its job deletes them
+            uncounted.discard(opportunity['_id'])
+            daily = {entry['k']: entry['v'] for entry in opportunity['days']}
+            await replace(opportunity_key(opportunity['_id']), {'company_handle': handle, 'applications': opportunity['applications'], 'daily': daily}, 'opportunities')
+            companies[handle]['applications'] += opportunity['applications']
+            companies[handle].update({f'daily.{key}': count for key, count in daily.items()})
+        for opportunity_id in uncounted:
+            await replace(opportunity_key(opportunity_id), {'company_handle': handles[opportunity_id], 'applications': 0, 'daily': {}}, 'opportunities')
+
+        for handle, counter in companies.items():
+            document = {'company_handle': handle, 'opportunities': 0, 'applications': 0, 'daily': {}, 'closing': {}}
+            for field, count in counter.items():
+                if '.' in field:
+                    group, key = field.split('.', 1)
+                    document[group][key] = count
+                else:
+                    document[field] = count
+            await replace(company_key(handle), document, 'companies')
+        if replacements:
+            await self.collection.bulk_write(replacements, ordered=False)
+            await job.checkpoint('companies', len(replacements))
+
+        # Counters of opportunities and companies that are gone
+        result = await self.collection.delete_many({'$or': [
+            {'reconciled_at': {'$lt': started}},
+            {'reconciled_at': {'$exists': False}, 'created_at': {'$lt': started}},
+        ]})
+        await job.checkpoint('removed', result.deleted_count)
@@ -0,0 +1,14 @@
+import os
+import pytest
+import sys
+import time
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze time.monotonic, which the caches and rate limits read, at clock[0]."""
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
@@ -0,0 +1,101 @@
+"""An in-memory stand-in for the few collection methods the tested modules use."""
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+import copy
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def limit(self, n: int):
+        self.documents = iter(list(self.documents)[:n])
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+OPERATORS = {
+    '$in': lambda value, operand: value in operand,
+    '$lt': lambda value, operand: value is not None and value < operand,
+    '$lte': lambda value, operand: value is not None and value <= operand,
+}
+
+def matches(document: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(document, q) for q in condition):
+                return False
+        elif field == '$and':
+            if not all(matches(document, q) for q in condition):
+                return False
+        elif isinstance(condition, dict) and condition.keys() <= OPERATORS.keys():
+            if not all(OPERATORS[op](document.get(field), operand) for op, operand in condition.items()):
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+def apply(document: dict, update: dict):
+    for field, value in update.get('$set', {}).items():
+        document[field] = copy.deepcopy(value)
+    for field, value in update.get('$inc', {}).items():
+        document[field] = document.get(field, 0) + value
+    for field in update.get('$unset', {}):
+        document.pop(field, None)
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = {} # _id -> document
+
+    def find(self, query: dict | None = None, projection: dict | None = None):
+        return Cursor([copy.deepcopy(doc) for doc in self.documents.values() if matches(doc, query or {})])
+
+    async def find_one(self, query: dict, projection: dict | None = None):
+        return next((copy.deepcopy(doc) for doc in self.documents.values() if matches(doc, query)), None)
+
+    async def insert_one(self, document: dict):
+        if document['_id'] in self.documents:
+            raise DuplicateKeyError(f"Duplicate _id {document['_id']!r}")
+        self.documents[document['_id']] = copy.deepcopy(document)
+
+    async def insert_many(self, documents: list):
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+            await self.insert_one(document)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        document = next((doc for doc in self.documents.values() if matches(doc, query)), None)
+        if document is None:
+            if not upsert:
+                return
+            document = self.documents[query['_id']] = {'_id': query['_id']}
+        apply(document, update)
+
+    async def update_many(self, query: dict, update: dict):
+        for document in self.documents.values():
+            if matches(document, query):
+                apply(document, update)
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        for request in requests: # UpdateOne only
+            await self.update_one(request._filter, request._doc)
+
+    async def delete_one(self, query: dict):
+        for key, doc in list(self.documents.items()):
+            if matches(doc, query):
+                del self.documents[key]
+                return
+
+class FakeDatabase:
+    """Collections by attribute, created on first use."""
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection())
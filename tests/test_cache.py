@@ -0,0 +1,95 @@
+from cache import CacheSync, TTLCache
+from fakes import FakeCollection
+import asyncio
+
+def test_entries_expire(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=30)
+    ttl_cache.set('a', 1)
+    clock[0] += 29
+    assert ttl_cache.get('a') == 1
+    clock[0] += 2
+    assert ttl_cache.get('a') is None
+    assert (ttl_cache.hits, ttl_cache.misses) == (1, 1)
+
+def test_least_recently_used_is_evicted(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=30)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    ttl_cache.get('a')
+    ttl_cache.set('c', 3)
+    assert ttl_cache.get('b') is None
+    assert ttl_cache.get('a') == 1
+
+def test_load_overlapping_an_invalidation_is_not_cached(clock):
+    ttl_cache = TTLCache()
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_load():
+            started.set()
+            await release.wait()
+            return 'old'
+
+        loading = asyncio.create_task(ttl_cache.get_or_load('a', slow_load))
+        await started.wait()
+        ttl_cache.invalidate('a') # A write lands while the old value is being read
+        release.set()
+        assert await loading == 'old' # Returned to its caller
+        return await ttl_cache.get_or_load('a', lambda: asyncio.sleep(0, 'new'))
+
+    assert asyncio.run(scenario()) == 'new'
+
+def test_none_is_not_cached(clock):
+    ttl_cache = TTLCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+
+    asyncio.run(ttl_cache.get_or_load('a', load))
+    asyncio.run(ttl_cache.get_or_load('a', load))
+    assert len(calls) == 2
+
+def test_bump_clears_other_workers_on_their_next_poll(clock):
+    versions = FakeCollection()
+    workers = []
+    for _ in range(2):
+        sync = CacheSync(versions)
+        companies = TTLCache()
+        sync.register('company', companies)
+        workers.append((sync, companies))
+    (writer, written), (reader, stale) = workers
+
+    async def scenario():
+        await reader.poll()
+        written.set('acme', 'v1')
+        stale.set('acme', 'v1')
+        await writer.bump('company')
+        assert written.get('acme') is None # Cleared right away where the write happened
+        assert stale.get('acme') == 'v1' # The other worker serves it until it polls
+        await reader.poll()
+        assert stale.get('acme') is None
+        stale.set('acme', 'v2')
+        await reader.poll() # Nothing moved since
+        assert stale.get('acme') == 'v2'
+
+    asyncio.run(scenario())
+
+def test_unrelated_bump_keeps_caches(clock):
+    versions = FakeCollection()
+    sync = CacheSync(versions)
+    companies, recruiters = TTLCache(), TTLCache()
+    sync.register('company', companies)
+    sync.register('recruiters', recruiters)
+
+    async def scenario():
+        await sync.poll()
+        companies.set('acme', 1)
+        recruiters.set('acme', 1)
+        await CacheSync(versions).bump('recruiters') # Another worker
+        await sync.poll()
+
+    asyncio.run(scenario())
+    assert companies.get('acme') == 1
+    assert recruiters.get('acme') is None
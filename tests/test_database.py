@@ -0,0 +1,87 @@
+from database import ServerRecorder, connect, public_read_preference, public_reads
+from fakes import FakeDatabase
+from fastapi.testclient import TestClient
+from pymongo.read_preferences import Primary
+import app
+import asyncio
+import os
+import pytest
+
+ENVIRON = {
+    'MONGODB_URI': 'mongodb://localhost:27017', # Never contacted, the client connects lazily
+    'MONGO_PUBLIC_READ_PREFERENCE': 'secondaryPreferred',
+    'MONGO_MAX_STALENESS_SECONDS': '120',
+}
+
+RESUME = {
+    'basic': {'name': 'Ada', 'email': 'ada@example.com', 'image': '', 'phone': '1', 'url': None, 'summary': None, 'location': 'London', 'profiles': None},
+    'education': [], 'skills': [], 'languages': [], 'projects': None,
+    'certificates': None, 'awards': None, 'work': None, 'interests': None,
+}
+
+@pytest.fixture
+def handles():
+    client = connect(environ=ENVIRON)
+    db = client.careerhub
+    yield db, public_reads(db, public_read_preference(ENVIRON))
+    asyncio.run(client.close())
+
+def test_public_reads_use_the_configured_preference(handles):
+    db, public = handles
+    assert public.opportunities.read_preference.document == {'mode': 'secondaryPreferred', 'maxStalenessSeconds': 120}
+    assert public.client is db.client # Same pool
+    assert db.users.read_preference == Primary()
+
+def test_primary_by_default():
+    client = connect(environ={'MONGODB_URI': ENVIRON['MONGODB_URI']})
+    db = client.careerhub
+    assert public_reads(db, public_read_preference({})) is db
+    asyncio.run(client.close())
+
+@pytest.mark.parametrize('environ', [
+    {'MONGO_PUBLIC_READ_PREFERENCE': 'secondary', 'MONGO_MAX_STALENESS_SECONDS': '30'},
+    {'MONGO_MAX_STALENESS_SECONDS': '120'}, # Primary reads can't be stale
+    {'MONGO_PUBLIC_READ_PREFERENCE': 'secondaryOnly'},
+])
+def test_invalid_preferences_fail_at_startup(environ):
+    with pytest.raises(ValueError):
+        public_read_preference(environ)
+
+def test_public_routes_read_public_db_and_auth_reads_the_primary(monkeypatch):
+    primary, public = FakeDatabase(), FakeDatabase()
+    monkeypatch.setattr(app, 'db', primary)
+    monkeypatch.setattr(app, 'public_db', public)
+    # Only the public handle has ada, only the primary has bob
+    for collection, name in ((public.users, 'ada'), (primary.users, 'bob')):
+        collection.documents[name] = {'_id': name, 'username': name, 'password': 'x', 'resume': RESUME}
+
+    client = TestClient(app.app)
+    assert client.get('/resume/ada').status_code == 200
+    assert client.get('/resume/bob').status_code == 404
+    assert asyncio.run(app.get_user_by_username('ada')) is None
+    assert asyncio.run(app.get_user_by_username('bob')) is not None
+
+@pytest.mark.skipif(not os.getenv('MONGODB_URI'), reason="Needs MONGODB_URI pointing at a replica set")
+def test_public_reads_go_to_a_secondary():
+    async def scenario():
+        recorder = ServerRecorder()
+        environ = {**os.environ, 'MONGO_PUBLIC_READ_PREFERENCE': 'secondary'}
+        client = connect([recorder], environ)
+        db = client.careerhub
+        try:
+            hello = await client.admin.command('hello')
+            if not hello.get('setName') or len(hello.get('hosts', [])) < 2:
+                pytest.skip("Not a replica set with a secondary")
+            await db.opportunities.find_one({}, {'_id': 1})
+            primary_server = recorder.servers['find']
+            await public_reads(db, public_read_preference(environ)).opportunities.find_one({}, {'_id': 1})
+            return hello['primary'], primary_server, recorder.servers['find']
+        finally:
+            await client.close()
+
+    primary, primary_server, public_server = asyncio.run(scenario())
+    assert primary_server == primary
+    assert public_server != primary
+
+def test_pool_stats_need_an_admin():
+    assert TestClient(app.app).get('/pool-stats').status_code == 401
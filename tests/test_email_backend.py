@@ -0,0 +1,117 @@
+from aiosmtpd.controller import Controller
+from datetime import datetime, timezone
+from fakes import FakeCollection
+from email_backend import BACKOFF_SECONDS, MAX_ATTEMPTS, Outbox
+import asyncio
+import pytest
+import socket
+
+class Server:
+    """An SMTP handler that keeps what it received and refuses recipients in `refuse`."""
+    def __init__(self):
+        self.received = []
+        self.refuse = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return '450 Mailbox busy, try again later'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.extend(envelope.rcpt_tos)
+        return '250 Message accepted'
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def settings(port: int) -> dict:
+    return {'host': '127.0.0.1', 'port': port, 'username': None, 'password': None, 'starttls': False, 'sender': 'noreply@careerhub.local'}
+
+@pytest.fixture
+def smtp():
+    handler = Server()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield handler, settings(controller.port)
+    controller.stop()
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def drain(outbox: Outbox, settings: dict) -> int:
+    claimed = 0
+    while n := await outbox.deliver(settings):
+        claimed += n
+    return claimed
+
+def make_due(collection: FakeCollection):
+    """Pretend the backoff of every pending message has passed."""
+    for document in collection.documents.values():
+        if document['status'] == 'pending':
+            document['next_attempt_at'] = datetime.now(timezone.utc)
+
+def addresses(n: int) -> list:
+    return [f'user{i}@example.com' for i in range(n)]
+
+def test_drains_in_batches(smtp):
+    server, settings = smtp
+    collection = FakeCollection()
+    outbox = Outbox(collection, batch_size=3)
+    run(outbox.enqueue([(to, 'Hello', 'Body') for to in addresses(7)]))
+
+    assert run(drain(outbox, settings)) == 7
+    assert sorted(server.received) == sorted(addresses(7))
+    assert {doc['status'] for doc in collection.documents.values()} == {'sent'}
+    assert run(drain(outbox, settings)) == 0 # Nothing goes out twice
+
+def test_refused_messages_back_off_and_retry(smtp):
+    server, settings = smtp
+    collection = FakeCollection()
+    outbox = Outbox(collection, batch_size=10)
+    server.refuse = {'user1@example.com', 'user3@example.com'}
+    run(outbox.enqueue([(to, 'Hello', 'Body') for to in addresses(4)]))
+
+    assert run(drain(outbox, settings)) == 4
+    assert sorted(server.received) == ['user0@example.com', 'user2@example.com']
+    pending = [doc for doc in collection.documents.values() if doc['status'] == 'pending']
+    assert sorted(doc['to'] for doc in pending) == sorted(server.refuse)
+    for doc in pending:
+        assert doc['attempts'] == 1
+        assert '450' in doc['last_error']
+        wait = (doc['next_attempt_at'] - datetime.now(timezone.utc)).total_seconds()
+        assert BACKOFF_SECONDS - 5 < wait <= BACKOFF_SECONDS
+        assert 'claimed_by' not in doc
+    assert run(drain(outbox, settings)) == 0 # Not due yet
+
+    server.refuse = set()
+    make_due(collection)
+    assert run(drain(outbox, settings)) == 2
+    assert sorted(server.received) == sorted(addresses(4)) # Each exactly once
+    assert {doc['status'] for doc in collection.documents.values()} == {'sent'}
+
+def test_gives_up_after_max_attempts(smtp):
+    server, settings = smtp
+    collection = FakeCollection()
+    outbox = Outbox(collection)
+    server.refuse = {'user0@example.com'}
+    run(outbox.enqueue([('user0@example.com', 'Hello', 'Body')]))
+
+    for _ in range(MAX_ATTEMPTS):
+        make_due(collection)
+        assert run(drain(outbox, settings)) == 1
+    [doc] = collection.documents.values()
+    assert (doc['status'], doc['attempts']) == ('failed', MAX_ATTEMPTS)
+    make_due(collection)
+    assert run(drain(outbox, settings)) == 0
+    assert server.received == []
+
+def test_unreachable_server_loses_nothing():
+    collection = FakeCollection()
+    outbox = Outbox(collection)
+    run(outbox.enqueue([(to, 'Hello', 'Body') for to in addresses(3)]))
+
+    assert run(drain(outbox, settings(free_port()))) == 3
+    assert [(doc['status'], doc['attempts']) for doc in collection.documents.values()] == [('pending', 1)] * 3
@@ -0,0 +1,83 @@
+from fastapi import HTTPException
+from fakes import FakeCollection
+from idempotency import IdempotencyKeys
+import asyncio
+import pytest
+
+BODY = {'opportunity_id': 'o1', 'candidate_email': 'ada@example.com'}
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def respond(keys: IdempotencyKeys, key: str | None, body: dict, calls: list, response: dict):
+    async with keys.attempt('apply', key, body) as attempt:
+        if attempt.replay is not None:
+            return attempt.replay
+        calls.append(1)
+        attempt.response = response
+        return response
+
+def test_retry_replays_the_stored_response():
+    keys, calls = IdempotencyKeys(FakeCollection()), []
+    first = run(respond(keys, 'k1', BODY, calls, {'application_id': 'a1'}))
+    retry = run(respond(keys, 'k1', dict(reversed(BODY.items())), calls, {'application_id': 'a2'}))
+    assert first == retry == {'application_id': 'a1'}
+    assert len(calls) == 1
+
+def test_without_a_key_every_request_runs():
+    keys, calls = IdempotencyKeys(FakeCollection()), []
+    run(respond(keys, None, BODY, calls, {}))
+    run(respond(keys, None, BODY, calls, {}))
+    assert len(calls) == 2
+
+def test_keys_are_scoped():
+    keys, calls = IdempotencyKeys(FakeCollection()), []
+    run(respond(keys, 'k1', BODY, calls, {}))
+    async def other_scope():
+        async with keys.attempt('other', 'k1', BODY) as attempt:
+            return attempt.replay
+    assert run(other_scope()) is None
+
+def test_different_body_is_422():
+    keys, calls = IdempotencyKeys(FakeCollection()), []
+    run(respond(keys, 'k1', BODY, calls, {}))
+    with pytest.raises(HTTPException) as error:
+        run(respond(keys, 'k1', {**BODY, 'cover_letter': 'Hi'}, calls, {}))
+    assert error.value.status_code == 422
+
+def test_retry_while_the_first_runs_is_409():
+    keys = IdempotencyKeys(FakeCollection())
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def first():
+            async with keys.attempt('apply', 'k1', BODY) as attempt:
+                started.set()
+                await release.wait()
+                attempt.response = {'application_id': 'a1'}
+
+        running = asyncio.create_task(first())
+        await started.wait()
+        with pytest.raises(HTTPException) as error:
+            async with keys.attempt('apply', 'k1', BODY):
+                pass
+        release.set()
+        await running
+        return error.value
+
+    error = run(scenario())
+    assert error.status_code == 409
+    assert error.headers['Retry-After'] == '1'
+
+def test_failure_releases_the_key():
+    keys, calls = IdempotencyKeys(FakeCollection()), []
+
+    async def failing():
+        async with keys.attempt('apply', 'k1', BODY):
+            raise HTTPException(404)
+
+    with pytest.raises(HTTPException):
+        run(failing())
+    assert run(respond(keys, 'k1', BODY, calls, {'application_id': 'a1'})) == {'application_id': 'a1'}
+    assert len(calls) == 1
@@ -0,0 +1,36 @@
+from bson.objectid import ObjectId
+from fastapi import HTTPException
+from pydantic import BaseModel
+from fakes import Cursor
+from pagination import collect_page, decode_cursor, encode_cursor
+from serialization import DocumentEncoder
+import asyncio
+import pytest
+
+class Item(BaseModel):
+    name: str
+    tags: list = []
+
+def test_cursor_round_trip():
+    for _ in range(100):
+        oid = ObjectId()
+        cursor = encode_cursor(oid)
+        assert '=' not in cursor and '/' not in cursor and '+' not in cursor
+        assert decode_cursor(cursor) == oid
+
+@pytest.mark.parametrize('cursor', ['', 'not-a-cursor', 'AAAA', encode_cursor(ObjectId()) + 'AA'])
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+def page(documents: list, limit: int | None):
+    return asyncio.run(collect_page(Cursor(documents), DocumentEncoder(Item), limit))
+
+def test_next_cursor_only_when_more_remain():
+    documents = [{'_id': ObjectId(), 'name': f'item {i}'} for i in range(3)]
+    items, next_cursor = page(documents, 2)
+    assert items == [{'name': 'item 0', 'tags': []}, {'name': 'item 1', 'tags': []}]
+    assert decode_cursor(next_cursor) == documents[1]['_id']
+    assert page(documents[:2], 2) == (items, None)
+    assert page(documents, None)[1] is None
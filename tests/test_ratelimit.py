@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+from fastapi import HTTPException
+from ratelimit import AuthGuard, TokenBuckets
+import asyncio
+import pytest
+
+def request(ip: str = '10.0.0.1'):
+    return SimpleNamespace(client=SimpleNamespace(host=ip))
+
+def test_burst_then_refill(clock):
+    buckets = TokenBuckets(rate_per_minute=60, burst=3)
+    assert [buckets.take('a') for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('b') == 0 # Keys have their own buckets
+    assert buckets.take('a') == pytest.approx(1)
+    clock[0] += 1
+    assert buckets.take('a') == 0
+
+def test_peek_takes_nothing(clock):
+    buckets = TokenBuckets(rate_per_minute=60, burst=1)
+    assert buckets.peek('a') == 0
+    assert buckets.peek('a') == 0
+    buckets.take('a')
+    assert buckets.peek('a') == pytest.approx(1)
+
+def test_forgets_least_recently_used(clock):
+    buckets = TokenBuckets(rate_per_minute=60, burst=1, maxsize=2)
+    for key in 'abc':
+        buckets.take(key)
+    assert buckets.peek('a') == 0 # Evicted, so it starts over with a full bucket
+    assert buckets.peek('c') > 0
+
+async def attempt(guard: AuthGuard, username: str, ok: bool, ip: str = '10.0.0.1'):
+    async with guard.admit('token', request(ip), username) as admission:
+        if not ok:
+            admission.failed()
+
+def make_guard(username_burst: int = 2, account_burst: int = 1000, max_concurrent: int = 4):
+    return AuthGuard(TokenBuckets(60_000, 1000), TokenBuckets(60, username_burst), TokenBuckets(60, account_burst), max_concurrent)
+
+def test_only_failed_logins_charge_the_username(clock):
+    guard = make_guard()
+
+    async def scenario():
+        for _ in range(10):
+            await attempt(guard, 'ada', ok=True)
+        await attempt(guard, 'ada', ok=False)
+        await attempt(guard, 'ADA', ok=False)
+        with pytest.raises(HTTPException) as error:
+            await attempt(guard, 'ada', ok=True)
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert guard.counts['token', 'allowed'] == 12
+    assert guard.counts['token', 'rate_limited_username'] == 1
+
+def test_failures_from_other_addresses_do_not_lock_the_user_out(clock):
+    guard = make_guard(username_burst=2, account_burst=30)
+
+    async def scenario():
+        for i in range(10):
+            await attempt(guard, 'ada', ok=False, ip=f'10.1.0.{i}')
+            await attempt(guard, 'ada', ok=False, ip=f'10.1.0.{i}')
+        await attempt(guard, 'ada', ok=True, ip='10.0.0.1')
+        with pytest.raises(HTTPException) as error:
+            await attempt(guard, 'ada', ok=True, ip='10.1.0.0') # That address used up its guesses
+        return error.value
+
+    assert asyncio.run(scenario()).status_code == 429
+
+def test_account_backstop(clock):
+    guard = make_guard(username_burst=2, account_burst=5)
+
+    async def scenario():
+        for i in range(5):
+            await attempt(guard, 'ada', ok=False, ip=f'10.1.0.{i}')
+        with pytest.raises(HTTPException) as error:
+            await attempt(guard, 'ada', ok=True, ip='10.0.0.1')
+        return error.value
+
+    assert asyncio.run(scenario()).status_code == 429
+    assert guard.counts['token', 'rate_limited_account'] == 1
+
+def test_sheds_over_max_concurrent(clock):
+    guard = make_guard(username_burst=1000, max_concurrent=1)
+
+    async def scenario():
+        async with guard.admit('token', request(), 'ada'):
+            with pytest.raises(HTTPException) as error:
+                await attempt(guard, 'bob', ok=True)
+        await attempt(guard, 'bob', ok=True)
+        return error.value
+
+    assert asyncio.run(scenario()).status_code == 503
+    assert guard.in_flight == 0
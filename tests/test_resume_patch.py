@@ -0,0 +1,87 @@
+from fastapi import HTTPException
+from data_class import Resume, ResumePatchOperation
+from resume_patch import build_pipeline
+import pytest
+
+def make_resume(**fields):
+    return Resume(**{
+        'basic': {
+            'name': 'Ada', 'email': 'ada@example.com', 'image': '', 'phone': '1', 'url': None,
+            'summary': None, 'location': 'London', 'profiles': None,
+        },
+        'education': [], 'skills': [], 'languages': [], 'projects': None,
+        'certificates': None, 'awards': None, 'work': None, 'interests': None,
+        **fields,
+    })
+
+def patch(*operations):
+    return build_pipeline(make_resume(), [ResumePatchOperation(**operation) for operation in operations])
+
+EXPERIENCE = {
+    'name': 'Acme', 'position': 'Engineer', 'url': 'https://acme.example.com',
+    'start_date': '2020-01-01T00:00:00', 'enddate': '2021-01-01T00:00:00', 'summary': 'Built things',
+}
+
+def test_replace_field():
+    assert patch({'op': 'replace', 'path': '/basic/summary', 'value': 'Hi'}) == [
+        {'$set': {'resume.basic.summary': {'$literal': 'Hi'}}},
+    ]
+
+def test_urls_are_stored_as_strings():
+    [stage] = patch({'op': 'add', 'path': '/work/-', 'value': EXPERIENCE})
+    [item] = stage['$set']['resume.work']['$concatArrays'][0]['$literal']
+    assert item['url'] == 'https://acme.example.com/'
+    assert item['start_date'] == '2020-01-01T00:00:00'
+
+def test_url_field_and_nested_list():
+    pipeline = patch(
+        {'op': 'replace', 'path': '/basic/url', 'value': 'https://ada.example.com'},
+        {'op': 'replace', 'path': '/basic/profiles', 'value': [{'network': 'gh', 'username': 'ada', 'url': 'https://github.com/ada'}]},
+    )
+    assert pipeline[0] == {'$set': {'resume.basic.url': {'$literal': 'https://ada.example.com/'}}}
+    assert pipeline[1]['$set']['resume.basic.profiles']['$literal'][0]['url'] == 'https://github.com/ada'
+
+def test_invalid_value_is_422():
+    with pytest.raises(HTTPException) as error:
+        patch({'op': 'add', 'path': '/work/-', 'value': {**EXPERIENCE, 'url': 'not a url'}})
+    assert error.value.status_code == 422
+
+def test_index_out_of_range():
+    with pytest.raises(HTTPException) as error:
+        patch({'op': 'replace', 'path': '/skills/0', 'value': {'name': 'Go', 'keywords': []}})
+    assert error.value.status_code == 422
+
+def test_remove_list_item():
+    resume = make_resume(skills=[{'name': 'Go', 'keywords': []}, {'name': 'Rust', 'keywords': []}])
+    [stage] = build_pipeline(resume, [ResumePatchOperation(op='remove', path='/skills/0')])
+    items = {'$ifNull': ['$resume.skills', []]}
+    assert stage == {'$set': {'resume.skills': {'$concatArrays': [{'$slice': [items, 1, 2**31 - 1]}]}}}
+
+def test_field_of_unset_optional_section_is_422():
+    with pytest.raises(HTTPException) as error:
+        patch({'op': 'replace', 'path': '/working_at/position', 'value': 'CTO'})
+    assert error.value.status_code == 422
+    assert 'not set' in error.value.detail
+
+def test_field_of_section_set_earlier_in_the_patch():
+    company = {'name': 'Acme', 'handle': 'acme', 'industry': 'Software', 'founded': 2001, 'description': '', 'logo': ''}
+    pipeline = patch(
+        {'op': 'replace', 'path': '/working_at', 'value': {'company': company, 'position': 'Engineer'}},
+        {'op': 'replace', 'path': '/working_at/position', 'value': 'CTO'},
+    )
+    assert pipeline[1] == {'$set': {'resume.working_at.position': {'$literal': 'CTO'}}}
+    with pytest.raises(HTTPException):
+        patch(
+            {'op': 'remove', 'path': '/working_at'},
+            {'op': 'replace', 'path': '/working_at/position', 'value': 'CTO'},
+        )
+
+def test_list_lengths_follow_earlier_operations():
+    skill = {'name': 'Go', 'keywords': []}
+    pipeline = patch(
+        {'op': 'add', 'path': '/skills/-', 'value': skill},
+        {'op': 'replace', 'path': '/skills/0', 'value': {**skill, 'name': 'Rust'}},
+    )
+    assert len(pipeline) == 2
+    with pytest.raises(HTTPException):
+        patch({'op': 'replace', 'path': '/skills', 'value': []}, {'op': 'remove', 'path': '/skills/0'})
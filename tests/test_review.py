@@ -0,0 +1,11 @@
+from review import cell
+import pytest
+
+@pytest.mark.parametrize('value', ['=1+1', '+1', '-1', '@SUM(A1)', '\t=1', '\r=1'])
+def test_formula_prefixes_are_escaped(value):
+    assert cell(value) == "'" + value
+
+def test_plain_values_are_kept():
+    assert cell('Ada') == 'Ada'
+    assert cell(None) == ''
+    assert cell(3.5) == '3.5'
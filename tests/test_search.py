@@ -0,0 +1,78 @@
+from fakes import FakeCollection
+from search import SearchIndex, document_terms, tokenize
+import asyncio
+import math
+import pytest
+import random
+
+WORDS = ['python', 'go', 'rust', 'backend', 'frontend', 'data', 'remote', 'senior', 'intern', 'cloud',
+         'kubernetes', 'design', 'mobile', 'ml', 'sql', 'react', 'c++', 'c#', 'platform', 'security']
+
+def make_opportunity(rng: random.Random, i: int):
+    return {
+        '_id': f'opportunity-{i}',
+        'position': ' '.join(rng.sample(WORDS, 2)),
+        'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(5, 40))),
+        'location': rng.choice(['Pune', 'Remote', 'Kolkata']),
+        'company': {'name': f'Company {rng.randrange(20)}'},
+        'preferred_skills': [{'name': rng.choice(WORDS), 'keywords': rng.sample(WORDS, 2)}],
+    }
+
+def brute_force(documents: list, query: str, k1: float = 1.2, b: float = 0.75):
+    """BM25 score of every document, straight from the formula."""
+    terms = {doc['_id']: document_terms(doc) for doc in documents}
+    avgdl = sum(sum(t.values()) for t in terms.values()) / len(terms)
+    scores = {}
+    for doc_id, doc_terms in terms.items():
+        length = sum(doc_terms.values())
+        score = 0
+        for term in set(tokenize(query)):
+            containing = sum(1 for t in terms.values() if term in t)
+            if term not in doc_terms:
+                continue
+            idf = math.log(1 + (len(terms) - containing + 0.5) / (containing + 0.5))
+            tf = doc_terms[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+        if score:
+            scores[doc_id] = score
+    return scores
+
+@pytest.fixture(scope='module')
+def indexed():
+    rng = random.Random(7)
+    documents = [make_opportunity(rng, i) for i in range(300)]
+    collection = FakeCollection()
+    for doc in documents:
+        asyncio.run(collection.insert_one(doc))
+    index = SearchIndex()
+    asyncio.run(index.rebuild(collection))
+    return documents, index
+
+@pytest.mark.parametrize('query', ['python', 'senior backend', 'remote rust kubernetes', 'c++ c#', 'Company 3 data'])
+@pytest.mark.parametrize('k', [1, 10, 50])
+def test_top_k_matches_brute_force(indexed, query, k):
+    documents, index = indexed
+    expected = brute_force(documents, query)
+    results = index.search(query, k)
+    assert len(results) == min(k, len(expected))
+    for doc_id, score in results:
+        assert score == pytest.approx(expected[doc_id])
+    # Ties may come in any order, so compare the scores rather than the ids
+    best = sorted(expected.values(), reverse=True)[:k]
+    assert [score for _, score in results] == pytest.approx(best)
+
+def test_unknown_terms(indexed):
+    _, index = indexed
+    assert index.search('cobol') == []
+    assert index.search('') == []
+
+def test_add_and_remove():
+    index = SearchIndex()
+    index.add('a', {'position': 'Rust engineer'})
+    index.add('b', {'position': 'Python engineer'})
+    assert [doc_id for doc_id, _ in index.search('rust')] == ['a']
+    index.add('a', {'position': 'Go engineer'}) # Replaces the previous version
+    assert index.search('rust') == []
+    index.remove('b')
+    assert [doc_id for doc_id, _ in index.search('engineer')] == ['a']
+    assert len(index) == 1
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous for a cold interpreter on a slow CI runner, tighten with STARTUP_BUDGET_MS
+BUDGET_MS = os.getenv('STARTUP_BUDGET_MS', '2000')
+
+def python(*args):
+    env = {key: value for key, value in os.environ.items() if key not in ('BUILD_SHA', 'MONGODB_URI')}
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+
+def test_cold_import_within_budget():
+    result = python('startup.py', '--profile-startup', '--budget-ms', BUDGET_MS)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+def test_import_stays_lazy():
+    result = python('-c', (
+        "import app, sys\n"
+        "assert app.client is None and app.db is None, 'Mongo client created at import'\n"
+        "heavy = [name for name in ('numpy', 'git', 'dns') if name in sys.modules]\n"
+        "assert not heavy, f'Imported at startup: {heavy}'\n"
+    ))
+    assert result.returncode == 0, result.stderr
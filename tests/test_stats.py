@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+from stats import minute, open_count
+import pytest
+
+@pytest.mark.parametrize('value', [
+    '2026-03-01T10:15:42',
+    '2026-03-01T10:15:42Z',
+    '2026-03-01T15:45:42+05:30',
+    '2026-03-01T05:15:42.123456-05:00',
+    datetime(2026, 3, 1, 10, 15, 42),
+    datetime(2026, 3, 1, 15, 45, 42, tzinfo=timezone(timedelta(hours=5, minutes=30))),
+])
+def test_minute_is_utc(value):
+    assert minute(value) == '2026-03-01T10:15'
+
+def test_open_count_uses_utc_deadlines():
+    now = minute(datetime(2026, 3, 1, 10, 0, tzinfo=timezone.utc))
+    # 12:00 in India is 06:30 UTC, already past
+    closing = {minute('2026-03-01T12:00:00+05:30'): 1, minute('2026-03-01T12:00:00Z'): 2}
+    assert open_count(closing, now) == 2
@@ -0,0 +1,18 @@
+from datetime import datetime, timezone
+from fakes import FakeDatabase
+import app
+import asyncio
+
+def test_opportunities_of_tombstoned_companies_are_left_out(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(app, 'db', db)
+    app.company_cache.clear()
+    db.company.documents['a'] = {'_id': 'a', 'handle': 'acme', 'tombstoned_at': None}
+    db.company.documents['b'] = {'_id': 'b', 'handle': 'gone', 'tombstoned_at': datetime.now(timezone.utc)}
+    found = {
+        '1': {'company': {'handle': 'acme'}},
+        '2': {'company': {'handle': 'gone'}},
+        '3': {'company': {'handle': 'unknown'}}, # Not ours to hide
+    }
+    assert list(asyncio.run(app.without_tombstoned(found))) == ['1', '3']
+    app.company_cache.clear()